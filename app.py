@@ -1,31 +1,28 @@
 import os
 from flask import Flask, request, Response, jsonify
 from telegram import Update
+from sqlalchemy import text
 from sqlalchemy.orm import DeclarativeBase
 from flask_sqlalchemy import SQLAlchemy
+from db_pool import get_engine, pool_stats
 import json
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+class SharedEngineSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy bound to the process-wide pool instead of its own"""
+
+    def _make_engine(self, bind_key, options, app):
+        return get_engine()
+
+db = SharedEngineSQLAlchemy(model_class=Base)
 app = Flask(__name__)
 app.secret_key = os.environ["FLASK_SECRET_KEY"]
 app.config['SERVER_NAME'] = None
 app.config['PREFERRED_URL_SCHEME'] = 'https'
 app.config['PROPAGATE_EXCEPTIONS'] = True
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_timeout": 20,
-    "pool_pre_ping": True,
-    "pool_size": 5,
-    "max_overflow": 10,
-    "connect_args": {
-        "sslmode": "require",
-        "connect_timeout": 30
-    }
-}
 
 db.init_app(app)
 bot = None  # Will be set from main.py
@@ -54,6 +51,10 @@ def view_users():
             'users_stats': [dict(row) for row in stats]
         })
 
+@app.route('/admin/pool')
+def view_pool():
+    return jsonify(pool_stats(db.engine))
+
 @app.route('/webhook', methods=['POST'])
 async def webhook():
     if request.method == "POST":
@@ -62,23 +63,25 @@ async def webhook():
         return Response('ok', status=200)
     return Response(status=403)
 
-with app.app_context():
-    import models
-    db.create_all()
+def init_database():
+    """Create the ORM tables and load sample data (python migrate.py --orm)"""
+    with app.app_context():
+        import models
+        db.create_all()
 
-    if not models.Importer.query.first():
-        from config import SAMPLE_IMPORTERS
-        try:
-            for importer_data in SAMPLE_IMPORTERS:
-                importer = models.Importer(
-                    name=importer_data['name'],
-                    country=importer_data['country'],
-                    product=importer_data['products'],
-                    contact=importer_data['contact']
-                )
-                db.session.add(importer)
-            db.session.commit()
-            print("Sample data loaded successfully")
-        except Exception as e:
-            print(f"Error loading sample data: {e}")
-            db.session.rollback()
\ No newline at end of file
+        if not models.Importer.query.first():
+            from config import SAMPLE_IMPORTERS
+            try:
+                for importer_data in SAMPLE_IMPORTERS:
+                    importer = models.Importer(
+                        name=importer_data['name'],
+                        country=importer_data['country'],
+                        product=importer_data['products'],
+                        contact=importer_data['contact']
+                    )
+                    db.session.add(importer)
+                db.session.commit()
+                print("Sample data loaded successfully")
+            except Exception as e:
+                print(f"Error loading sample data: {e}")
+                db.session.rollback()
@@ -1,9 +1,12 @@
+import asyncio
+import hashlib
+import json
 import logging
 from telegram.ext import ApplicationBuilder, CommandHandler as TelegramCommandHandler, CallbackQueryHandler
 from config import BOT_TOKEN
 from handlers import CommandHandler
-from telegram.ext import filters, MessageHandler
-from telegram import BotCommand
+from telegram.ext import filters, MessageHandler, TypeHandler
+from telegram import BotCommand, Update
 
 BOT_INFO = {
     'name': 'Direktori Ekspor Impor',
@@ -17,30 +20,57 @@ class TelegramBot:
         self._register_handlers()
         logging.info("Bot initialized")
 
-    async def setup(self):
-        """Async setup operations"""
-        await self._set_commands()
+    # Command menu shown by Telegram clients
+    COMMANDS = [
+        ('start', '🏠 Menu Utama'),
+        ('saved', '📁 Kontak Tersimpan'),
+        ('credits', '💳 Kredit Saya')
+    ]
 
-    async def _set_commands(self):
-        """Set bot commands with descriptions"""
-        # First, delete all existing commands
-        await self.application.bot.delete_my_commands()
+    async def start_services(self):
+        """Start background senders and reloaders once the database is reachable"""
+        await asyncio.gather(
+            self.command_handler.notifier.start(self.application.bot),
+            self.command_handler.data_store.catalog.start())
 
-        # Then set new commands
-        commands = [
-            BotCommand('start', '🏠 Menu Utama'),
-            BotCommand('saved', '📁 Kontak Tersimpan'),
-            BotCommand('credits', '💳 Kredit Saya')
-        ]
-        await self.application.bot.set_my_commands(commands)
+    async def register_commands(self) -> bool:
+        """Set bot commands unless Telegram already has this exact list"""
+        data_store = self.command_handler.data_store
+        commands_hash = hashlib.sha256(json.dumps(self.COMMANDS).encode('utf-8')).hexdigest()
+        # Dev and production tokens may share a database
+        setting_key = f"commands_hash:{BOT_TOKEN.split(':')[0]}"
+        try:
+            if await asyncio.to_thread(data_store.get_setting, setting_key) == commands_hash:
+                return False
+        except Exception as e:
+            logging.warning(f"Could not read stored command hash: {str(e)}")
+
+        # set_my_commands replaces the whole list, no delete needed first
+        await self.application.bot.set_my_commands(
+            [BotCommand(command, description) for command, description in self.COMMANDS])
+        try:
+            await asyncio.to_thread(data_store.set_setting, setting_key, commands_hash)
+        except Exception as e:
+            logging.warning(f"Could not store command hash: {str(e)}")
+        return True
 
     def _register_handlers(self):
         """Register command handlers"""
+        # Runs ahead of the regular handlers (group -1) on every update
+        self.application.add_handler(TypeHandler(Update, self.command_handler.capture_profile), group=-1)
+
         # Only register the essential command handlers
         self.application.add_handler(TelegramCommandHandler("start", self.command_handler.start))
         self.application.add_handler(TelegramCommandHandler("saved", self.command_handler.saved))
         self.application.add_handler(TelegramCommandHandler("credits", self.command_handler.credits))
         self.application.add_handler(TelegramCommandHandler("orders", self.command_handler.orders))
+        self.application.add_handler(TelegramCommandHandler("stats", self.command_handler.stats))
+        self.application.add_handler(TelegramCommandHandler("fulfill", self.command_handler.fulfill))
+        self.application.add_handler(TelegramCommandHandler("grant", self.command_handler.grant))
+        self.application.add_handler(TelegramCommandHandler("broadcast", self.command_handler.broadcast))
+        self.application.add_handler(MessageHandler(
+            filters.Document.FileExtension("csv") & filters.ChatType.PRIVATE,
+            self.command_handler.admin_upload))
 
         # Add the text handler for /start as fallback
         self.application.add_handler(MessageHandler(filters.Text(['/start']), self.command_handler.start))
@@ -48,6 +78,12 @@ class TelegramBot:
         # Add callback query handler for button interactions
         self.application.add_handler(CallbackQueryHandler(self.command_handler.button_callback))
 
+    async def shutdown(self):
+        """Persist state buffered in memory before the process exits"""
+        await self.command_handler.data_store.profiles.flush()
+        await self.command_handler.notifier.stop()
+        await self.command_handler.data_store.catalog.stop()
+
     def get_application(self):
         """Get the configured application instance"""
         return self.application
\ No newline at end of file
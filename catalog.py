@@ -0,0 +1,314 @@
+"""Product category menus, stored in product_categories.
+
+After editing the table, publish the change so running bots reload it:
+
+    python catalog.py
+"""
+import asyncio
+import logging
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Optional, Tuple
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+import queries
+from keyboards import BACK_TO_MAIN_BUTTON
+from messages import Messages
+from env import env_float
+
+# Seconds between checks for a new catalog version
+CATALOG_POLL_INTERVAL = env_float('CATALOG_POLL_INTERVAL', 30)
+# Telegram rejects callback_data longer than this many bytes
+MAX_CALLBACK_BYTES = 64
+
+# Menu side -> (menu text, importers.role the side lists)
+SIDES = {
+    'supplier': ("📤 *Kontak Supplier Indonesia*\n\nPilih kategori produk:", 'Exporter'),
+    'buyer': ("📥 *Kontak Buyer*\n\nPilih kategori buyer:", 'Importer')
+}
+
+LOAD_CATALOG = queries.register('load_catalog', """
+    SELECT side, category, category_emoji, name, emoji, search_term
+    FROM product_categories
+    WHERE active
+    ORDER BY side, category_position, category, position, id
+""")
+
+# Changes when the catalog is published or the search index (and with it
+# the per-product contact counts) is refreshed
+CATALOG_VERSION = queries.register('catalog_version', """
+    SELECT COALESCE((SELECT value FROM bot_settings WHERE key = 'catalog_version'), '0')
+        || ':' || COALESCE((SELECT CAST(MAX(refreshed_at) AS TEXT) FROM search_term_index), '')
+""")
+
+BUMP_CATALOG_VERSION = queries.register('bump_catalog_version', """
+    INSERT INTO bot_settings (key, value)
+    VALUES ('catalog_version', '1')
+    ON CONFLICT (key)
+    DO UPDATE SET
+        value = CAST(CAST(bot_settings.value AS BIGINT) + 1 AS TEXT),
+        updated_at = CURRENT_TIMESTAMP
+""", prepare=False)
+
+SEED_CATALOG = queries.register('seed_catalog', """
+    INSERT INTO product_categories
+        (side, category, category_emoji, category_position, name, emoji, search_term, position)
+    SELECT * FROM unnest(
+        CAST(:sides AS VARCHAR[]),
+        CAST(:categories AS VARCHAR[]),
+        CAST(:category_emojis AS VARCHAR[]),
+        CAST(:category_positions AS INTEGER[]),
+        CAST(:names AS VARCHAR[]),
+        CAST(:emojis AS VARCHAR[]),
+        CAST(:search_terms AS VARCHAR[]),
+        CAST(:positions AS INTEGER[])
+    )
+    ON CONFLICT (side, category, name) DO NOTHING
+""", prepare=False)
+
+
+def seed_rows() -> List[Dict]:
+    """Catalog rows for the menus originally defined in Messages"""
+    rows = []
+    for side, categories in (('supplier', Messages.SUPPLIER_CATEGORIES),
+                             ('buyer', Messages.BUYER_CATEGORIES)):
+        for category_position, (category, data) in enumerate(categories.items()):
+            for position, (name, product) in enumerate(data.get('subcategories', {}).items()):
+                rows.append({
+                    'side': side,
+                    'category': category,
+                    'category_emoji': data['emoji'],
+                    'category_position': category_position,
+                    'name': name,
+                    'emoji': product['emoji'],
+                    'search_term': product['search'],
+                    'position': position
+                })
+    return rows
+
+
+def seed_catalog(conn) -> int:
+    """Insert the built-in menus, keeping rows that already exist"""
+    rows = seed_rows()
+    inserted = SEED_CATALOG.execute(conn, {
+        "sides": [row['side'] for row in rows],
+        "categories": [row['category'] for row in rows],
+        "category_emojis": [row['category_emoji'] for row in rows],
+        "category_positions": [row['category_position'] for row in rows],
+        "names": [row['name'] for row in rows],
+        "emojis": [row['emoji'] for row in rows],
+        "search_terms": [row['search_term'] for row in rows],
+        "positions": [row['position'] for row in rows]
+    }).rowcount
+    if inserted:
+        BUMP_CATALOG_VERSION.execute(conn)
+    return inserted
+
+
+def publish_catalog(engine) -> None:
+    """Index the current catalog terms and signal running bots to reload"""
+    from search_index import rebuild_search_index
+
+    with engine.begin() as conn:
+        rebuild_search_index(conn)
+        BUMP_CATALOG_VERSION.execute(conn)
+
+
+def category_slug(name: str) -> str:
+    return name.lower().replace(' ', '_')
+
+
+def search_callback(term: str) -> str:
+    return f"search_{term.replace(' ', '_')}"
+
+
+def category_callback(side: str, slug: str) -> str:
+    return f"{side}_{slug}"
+
+
+def _fits_callback(data: str) -> bool:
+    return len(data.encode('utf-8')) <= MAX_CALLBACK_BYTES
+
+
+class CategoryNode:
+    __slots__ = ('side', 'slug', 'name', 'emoji', 'text', 'markup')
+
+    def __init__(self, side: str, slug: str, name: str, emoji: str, text: str, markup: InlineKeyboardMarkup):
+        self.side = side
+        self.slug = slug
+        self.name = name
+        self.emoji = emoji
+        self.text = text
+        self.markup = markup
+
+
+class SideNode:
+    __slots__ = ('side', 'text', 'markup', 'categories')
+
+    def __init__(self, side: str, text: str, markup: InlineKeyboardMarkup, categories):
+        self.side = side
+        self.text = text
+        self.markup = markup
+        self.categories = categories
+
+
+class CatalogTree:
+    """Immutable menu tree with every keyboard rendered when it is built"""
+
+    def __init__(self, version: Optional[str], rows: Iterable[Dict], counts: Dict[Tuple[str, str], Optional[int]]):
+        self.version = version
+        back_row = [BACK_TO_MAIN_BUTTON]
+
+        grouped: Dict[str, Dict[str, List[Dict]]] = {side: {} for side in SIDES}
+        for row in rows:
+            if row['side'] not in grouped:
+                continue
+            if not _fits_callback(search_callback(row['search_term'])):
+                logging.warning(f"Skipping catalog product {row['name']}: search term too long")
+                continue
+            grouped[row['side']].setdefault(row['category'], []).append(row)
+
+        sides = {}
+        self.products = 0
+        for side, categories in grouped.items():
+            text, role = SIDES[side]
+            nodes = {}
+            side_keyboard = []
+            for position, (category, products) in enumerate(categories.items()):
+                slug = category_slug(category)
+                if not _fits_callback(category_callback(side, slug)):
+                    # Too long for callback_data: address it by position
+                    slug = f"c{position}"
+                emoji = products[0]['category_emoji'] or ''
+                keyboard = []
+                for product in products:
+                    count = counts.get((product['search_term'].lower(), role))
+                    label = f"{product['emoji'] or ''} {product['name']}"
+                    if count is not None:
+                        label += f" ({count} kontak)"
+                    keyboard.append([InlineKeyboardButton(
+                        label, callback_data=search_callback(product['search_term']))])
+                keyboard.append(back_row)
+                self.products += len(products)
+
+                nodes[slug] = CategoryNode(
+                    side, slug, category, emoji,
+                    f"📂 *{category.title()}*\n\nPilih produk:",
+                    InlineKeyboardMarkup(keyboard))
+                side_keyboard.append([InlineKeyboardButton(
+                    f"{emoji} {category}", callback_data=category_callback(side, slug))])
+            side_keyboard.append(back_row)
+            sides[side] = SideNode(side, text, InlineKeyboardMarkup(side_keyboard), MappingProxyType(nodes))
+        self.sides = MappingProxyType(sides)
+
+    def side(self, side: str) -> Optional[SideNode]:
+        return self.sides.get(side)
+
+    def category(self, side: str, slug: str) -> Optional[CategoryNode]:
+        node = self.sides.get(side)
+        return node.categories.get(slug) if node else None
+
+
+class Catalog:
+    """Holds the current CatalogTree and swaps in a new one when the version changes"""
+
+    def __init__(self, engine, search_index):
+        self.engine = engine
+        self.search_index = search_index
+        # Usable before the first load, without contact counts
+        self.tree = CatalogTree(None, seed_rows(), {})
+        self._task: Optional[asyncio.Task] = None
+        self.reloads = 0
+
+    def side(self, side: str) -> Optional[SideNode]:
+        return self.tree.side(side)
+
+    def category(self, side: str, slug: str) -> Optional[CategoryNode]:
+        return self.tree.category(side, slug)
+
+    def _version(self) -> str:
+        with self.engine.connect() as conn:
+            return CATALOG_VERSION.execute(conn).scalar()
+
+    def _build(self, version: str) -> CatalogTree:
+        with self.engine.connect() as conn:
+            rows = [dict(row._mapping) for row in LOAD_CATALOG.execute(conn).fetchall()]
+        if not rows:
+            logging.warning("product_categories is empty; using the built-in menus")
+            rows = seed_rows()
+
+        # Counts come from the search index, which this version may have refreshed
+        self.search_index.invalidate()
+        counts = {}
+        for row in rows:
+            role = SIDES.get(row['side'], (None, None))[1]
+            key = (row['search_term'].lower(), role)
+            if role and key not in counts:
+                counts[key] = self._count(row['search_term'], role)
+        return CatalogTree(version, rows, counts)
+
+    def _count(self, search_term: str, role: str) -> Optional[int]:
+        count = self.search_index.count(search_term, role)
+        if count is not None:
+            return count
+        # Term added to the catalog but not indexed yet
+        try:
+            with self.engine.connect() as conn:
+                return queries.COUNT_CATEGORY_CONTACTS.execute(conn, {
+                    "role": role,
+                    "search": f"%{search_term}%"
+                }).scalar()
+        except Exception as e:
+            logging.error(f"Error counting catalog contacts: {str(e)}", exc_info=True)
+            return None
+
+    def reload(self) -> bool:
+        """Rebuild the tree if the stored version changed"""
+        version = self._version()
+        if version == self.tree.version:
+            return False
+        self.tree = self._build(version)
+        self.reloads += 1
+        logging.info(f"Loaded catalog version {version}")
+        return True
+
+    async def start(self) -> None:
+        """Load the catalog, then keep polling for new versions"""
+        try:
+            await asyncio.to_thread(self.reload)
+        except Exception as e:
+            logging.error(f"Error loading catalog: {str(e)}", exc_info=True)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(CATALOG_POLL_INTERVAL)
+            try:
+                await asyncio.to_thread(self.reload)
+            except Exception as e:
+                logging.error(f"Error reloading catalog: {str(e)}", exc_info=True)
+
+    def stats(self) -> Dict:
+        tree = self.tree
+        return {
+            'version': tree.version,
+            'categories': sum(len(node.categories) for node in tree.sides.values()),
+            'products': tree.products,
+            'reloads': self.reloads
+        }
+
+
+if __name__ == "__main__":
+    from db_pool import get_engine
+    from logging_config import setup_logging
+    setup_logging()
+    publish_catalog(get_engine())
+    logging.info("Catalog published")
@@ -5,16 +5,11 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-# Required environment variables
+# Required environment variables; the Flask server and psql tooling read
+# their own settings, so a bot process only needs these
 required_vars = [
     'TELEGRAM_TOKEN',
-    'FLASK_SECRET_KEY',
-    'DATABASE_URL',
-    'PGDATABASE',
-    'PGHOST',
-    'PGPORT',
-    'PGUSER',
-    'PGPASSWORD'
+    'DATABASE_URL'
 ]
 
 # Check for missing environment variables
@@ -30,14 +25,14 @@ BOT_TOKEN = TELEGRAM_DEV_TOKEN if (IS_DEVELOPMENT and TELEGRAM_DEV_TOKEN) else T
 
 # Database Configuration
 DATABASE_URL = os.environ['DATABASE_URL']
-PGDATABASE = os.environ['PGDATABASE']
-PGHOST = os.environ['PGHOST']
-PGPORT = os.environ['PGPORT']
-PGUSER = os.environ['PGUSER']
-PGPASSWORD = os.environ['PGPASSWORD']
+PGDATABASE = os.environ.get('PGDATABASE')
+PGHOST = os.environ.get('PGHOST')
+PGPORT = os.environ.get('PGPORT')
+PGUSER = os.environ.get('PGUSER')
+PGPASSWORD = os.environ.get('PGPASSWORD')
 
 # Flask Configuration
-FLASK_SECRET_KEY = os.environ['FLASK_SECRET_KEY']
+FLASK_SECRET_KEY = os.environ.get('FLASK_SECRET_KEY')
 
 # Rate Limiting
 RATE_LIMIT_WINDOW = 60  # seconds
@@ -0,0 +1,291 @@
+import re
+import unicodedata
+from typing import Dict, Optional, Tuple
+
+# (canonical name, ISO 3166-1 alpha-2, alpha-3, extra aliases)
+# Canonical names follow the spelling used in the importer CSV exports.
+COUNTRIES = (
+    ('Afghanistan', 'AF', 'AFG', ()),
+    ('Albania', 'AL', 'ALB', ()),
+    ('Algeria', 'DZ', 'DZA', ()),
+    ('American Samoa', 'AS', 'ASM', ()),
+    ('Andorra', 'AD', 'AND', ()),
+    ('Angola', 'AO', 'AGO', ()),
+    ('Anguilla', 'AI', 'AIA', ()),
+    ('Antigua and Barbuda', 'AG', 'ATG', ()),
+    ('Argentina', 'AR', 'ARG', ()),
+    ('Armenia', 'AM', 'ARM', ()),
+    ('Aruba', 'AW', 'ABW', ()),
+    ('Australia', 'AU', 'AUS', ()),
+    ('Austria', 'AT', 'AUT', ()),
+    ('Azerbaijan', 'AZ', 'AZE', ()),
+    ('The Bahamas', 'BS', 'BHS', ('Bahamas',)),
+    ('Bahrain', 'BH', 'BHR', ()),
+    ('Bangladesh', 'BD', 'BGD', ()),
+    ('Barbados', 'BB', 'BRB', ()),
+    ('Belarus', 'BY', 'BLR', ()),
+    ('Belgium', 'BE', 'BEL', ()),
+    ('Belize', 'BZ', 'BLZ', ()),
+    ('Benin', 'BJ', 'BEN', ()),
+    ('Bermuda', 'BM', 'BMU', ()),
+    ('Bhutan', 'BT', 'BTN', ()),
+    ('Bolivia', 'BO', 'BOL', ('Bolivia, Plurinational State of',)),
+    ('Bosnia and Herzegovina', 'BA', 'BIH', ()),
+    ('Botswana', 'BW', 'BWA', ()),
+    ('Brazil', 'BR', 'BRA', ('Brasil',)),
+    ('British Virgin Islands', 'VG', 'VGB', ('Virgin Islands, British',)),
+    ('Brunei', 'BN', 'BRN', ('Brunei Darussalam',)),
+    ('Bulgaria', 'BG', 'BGR', ()),
+    ('Burkina Faso', 'BF', 'BFA', ()),
+    ('Burundi', 'BI', 'BDI', ()),
+    ('Cambodia', 'KH', 'KHM', ()),
+    ('Cameroon', 'CM', 'CMR', ()),
+    ('Canada', 'CA', 'CAN', ()),
+    ('Cape Verde', 'CV', 'CPV', ('Cabo Verde',)),
+    ('Caribbean Netherlands', 'BQ', 'BES', ('Bonaire, Sint Eustatius and Saba',)),
+    ('Cayman Islands', 'KY', 'CYM', ()),
+    ('Central African Republic', 'CF', 'CAF', ()),
+    ('Chad', 'TD', 'TCD', ()),
+    ('Chile', 'CL', 'CHL', ()),
+    ('China', 'CN', 'CHN', ("People's Republic of China", 'PRC', 'Mainland China')),
+    ('Colombia', 'CO', 'COL', ()),
+    ('Comoros', 'KM', 'COM', ()),
+    ('Cook Islands', 'CK', 'COK', ()),
+    ('Costa Rica', 'CR', 'CRI', ()),
+    ("Côte d'Ivoire", 'CI', 'CIV', ('Ivory Coast',)),
+    ('Croatia', 'HR', 'HRV', ()),
+    ('Cuba', 'CU', 'CUB', ()),
+    ('Curaçao', 'CW', 'CUW', ()),
+    ('Cyprus', 'CY', 'CYP', ()),
+    ('Czechia', 'CZ', 'CZE', ('Czech Republic',)),
+    ('Democratic Republic of the Congo', 'CD', 'COD', ('Congo, The Democratic Republic of the', 'DR Congo', 'DRC', 'Congo-Kinshasa')),
+    ('Denmark', 'DK', 'DNK', ()),
+    ('Djibouti', 'DJ', 'DJI', ()),
+    ('Dominica', 'DM', 'DMA', ()),
+    ('Dominican Republic', 'DO', 'DOM', ()),
+    ('Ecuador', 'EC', 'ECU', ()),
+    ('Egypt', 'EG', 'EGY', ()),
+    ('El Salvador', 'SV', 'SLV', ()),
+    ('Equatorial Guinea', 'GQ', 'GNQ', ()),
+    ('Eritrea', 'ER', 'ERI', ()),
+    ('Estonia', 'EE', 'EST', ()),
+    ('Eswatini', 'SZ', 'SWZ', ('Swaziland',)),
+    ('Ethiopia', 'ET', 'ETH', ()),
+    ('Faroe Islands', 'FO', 'FRO', ()),
+    ('Fiji', 'FJ', 'FJI', ()),
+    ('Finland', 'FI', 'FIN', ()),
+    ('France', 'FR', 'FRA', ()),
+    ('French Guiana', 'GF', 'GUF', ()),
+    ('French Polynesia', 'PF', 'PYF', ()),
+    ('Gabon', 'GA', 'GAB', ()),
+    ('The Gambia', 'GM', 'GMB', ('Gambia',)),
+    ('Georgia', 'GE', 'GEO', ()),
+    ('Germany', 'DE', 'DEU', ('Deutschland',)),
+    ('Ghana', 'GH', 'GHA', ()),
+    ('Gibraltar', 'GI', 'GIB', ()),
+    ('Greece', 'GR', 'GRC', ()),
+    ('Greenland', 'GL', 'GRL', ()),
+    ('Grenada', 'GD', 'GRD', ()),
+    ('Guadeloupe', 'GP', 'GLP', ()),
+    ('Guam', 'GU', 'GUM', ()),
+    ('Guatemala', 'GT', 'GTM', ()),
+    ('Guinea', 'GN', 'GIN', ()),
+    ('Guinea-Bissau', 'GW', 'GNB', ()),
+    ('Guyana', 'GY', 'GUY', ()),
+    ('Haiti', 'HT', 'HTI', ()),
+    ('Honduras', 'HN', 'HND', ()),
+    ('Hong Kong', 'HK', 'HKG', ('Hong Kong SAR', 'Hongkong')),
+    ('Hungary', 'HU', 'HUN', ()),
+    ('Iceland', 'IS', 'ISL', ()),
+    ('India', 'IN', 'IND', ()),
+    ('Indonesia', 'ID', 'IDN', ()),
+    ('Iran', 'IR', 'IRN', ('Iran, Islamic Republic of',)),
+    ('Iraq', 'IQ', 'IRQ', ()),
+    ('Ireland', 'IE', 'IRL', ('Republic of Ireland',)),
+    ('Isle of Man', 'IM', 'IMN', ()),
+    ('Israel', 'IL', 'ISR', ()),
+    ('Italy', 'IT', 'ITA', ()),
+    ('Jamaica', 'JM', 'JAM', ()),
+    ('Japan', 'JP', 'JPN', ()),
+    ('Jordan', 'JO', 'JOR', ()),
+    ('Kazakhstan', 'KZ', 'KAZ', ()),
+    ('Kenya', 'KE', 'KEN', ()),
+    ('Kiribati', 'KI', 'KIR', ()),
+    ('Kosovo', 'XK', 'XKX', ()),
+    ('Kuwait', 'KW', 'KWT', ()),
+    ('Kyrgyzstan', 'KG', 'KGZ', ()),
+    ('Laos', 'LA', 'LAO', ("Lao People's Democratic Republic",)),
+    ('Latvia', 'LV', 'LVA', ()),
+    ('Lebanon', 'LB', 'LBN', ()),
+    ('Lesotho', 'LS', 'LSO', ()),
+    ('Liberia', 'LR', 'LBR', ()),
+    ('Libya', 'LY', 'LBY', ()),
+    ('Liechtenstein', 'LI', 'LIE', ()),
+    ('Lithuania', 'LT', 'LTU', ()),
+    ('Luxembourg', 'LU', 'LUX', ()),
+    ('Macao', 'MO', 'MAC', ('Macau',)),
+    ('Madagascar', 'MG', 'MDG', ()),
+    ('Malawi', 'MW', 'MWI', ()),
+    ('Malaysia', 'MY', 'MYS', ()),
+    ('Maldives', 'MV', 'MDV', ()),
+    ('Mali', 'ML', 'MLI', ()),
+    ('Malta', 'MT', 'MLT', ()),
+    ('Marshall Islands', 'MH', 'MHL', ()),
+    ('Martinique', 'MQ', 'MTQ', ()),
+    ('Mauritania', 'MR', 'MRT', ()),
+    ('Mauritius', 'MU', 'MUS', ()),
+    ('Mayotte', 'YT', 'MYT', ()),
+    ('Mexico', 'MX', 'MEX', ('México',)),
+    ('Micronesia', 'FM', 'FSM', ('Micronesia, Federated States of',)),
+    ('Moldova', 'MD', 'MDA', ('Moldova, Republic of',)),
+    ('Monaco', 'MC', 'MCO', ()),
+    ('Mongolia', 'MN', 'MNG', ()),
+    ('Montenegro', 'ME', 'MNE', ()),
+    ('Montserrat', 'MS', 'MSR', ()),
+    ('Morocco', 'MA', 'MAR', ()),
+    ('Mozambique', 'MZ', 'MOZ', ()),
+    ('Myanmar (Burma)', 'MM', 'MMR', ('Myanmar', 'Burma')),
+    ('Namibia', 'NA', 'NAM', ()),
+    ('Nauru', 'NR', 'NRU', ()),
+    ('Nepal', 'NP', 'NPL', ()),
+    ('Netherlands', 'NL', 'NLD', ('The Netherlands', 'Holland')),
+    ('New Caledonia', 'NC', 'NCL', ()),
+    ('New Zealand', 'NZ', 'NZL', ()),
+    ('Nicaragua', 'NI', 'NIC', ()),
+    ('Niger', 'NE', 'NER', ()),
+    ('Nigeria', 'NG', 'NGA', ()),
+    ('North Korea', 'KP', 'PRK', ("Korea, Democratic People's Republic of", 'DPRK')),
+    ('North Macedonia', 'MK', 'MKD', ('Macedonia',)),
+    ('Northern Mariana Islands', 'MP', 'MNP', ()),
+    ('Norway', 'NO', 'NOR', ()),
+    ('Oman', 'OM', 'OMN', ()),
+    ('Pakistan', 'PK', 'PAK', ()),
+    ('Palau', 'PW', 'PLW', ()),
+    ('Palestine', 'PS', 'PSE', ('Palestine, State of', 'Palestinian Territories')),
+    ('Panama', 'PA', 'PAN', ()),
+    ('Papua New Guinea', 'PG', 'PNG', ()),
+    ('Paraguay', 'PY', 'PRY', ()),
+    ('Peru', 'PE', 'PER', ()),
+    ('Philippines', 'PH', 'PHL', ('The Philippines',)),
+    ('Poland', 'PL', 'POL', ()),
+    ('Portugal', 'PT', 'PRT', ()),
+    ('Puerto Rico', 'PR', 'PRI', ()),
+    ('Qatar', 'QA', 'QAT', ()),
+    ('Republic of the Congo', 'CG', 'COG', ('Congo', 'Congo-Brazzaville')),
+    ('Réunion', 'RE', 'REU', ()),
+    ('Romania', 'RO', 'ROU', ()),
+    ('Russia', 'RU', 'RUS', ('Russian Federation',)),
+    ('Rwanda', 'RW', 'RWA', ()),
+    ('Saint Barthélemy', 'BL', 'BLM', ()),
+    ('Saint Kitts and Nevis', 'KN', 'KNA', ()),
+    ('Saint Lucia', 'LC', 'LCA', ()),
+    ('Saint Martin', 'MF', 'MAF', ('Saint Martin (French part)',)),
+    ('Saint Vincent and the Grenadines', 'VC', 'VCT', ()),
+    ('Samoa', 'WS', 'WSM', ()),
+    ('San Marino', 'SM', 'SMR', ()),
+    ('São Tomé and Príncipe', 'ST', 'STP', ()),
+    ('Saudi Arabia', 'SA', 'SAU', ('KSA',)),
+    ('Senegal', 'SN', 'SEN', ()),
+    ('Serbia', 'RS', 'SRB', ()),
+    ('Seychelles', 'SC', 'SYC', ()),
+    ('Sierra Leone', 'SL', 'SLE', ()),
+    ('Singapore', 'SG', 'SGP', ()),
+    ('Sint Maarten', 'SX', 'SXM', ('Sint Maarten (Dutch part)',)),
+    ('Slovakia', 'SK', 'SVK', ('Slovak Republic',)),
+    ('Slovenia', 'SI', 'SVN', ()),
+    ('Solomon Islands', 'SB', 'SLB', ()),
+    ('Somalia', 'SO', 'SOM', ()),
+    ('South Africa', 'ZA', 'ZAF', ()),
+    ('South Korea', 'KR', 'KOR', ('Korea', 'Korea, Republic of', 'Republic of Korea', 'Korea (South)')),
+    ('South Sudan', 'SS', 'SSD', ()),
+    ('Spain', 'ES', 'ESP', ('España',)),
+    ('Sri Lanka', 'LK', 'LKA', ()),
+    ('Sudan', 'SD', 'SDN', ()),
+    ('Suriname', 'SR', 'SUR', ()),
+    ('Sweden', 'SE', 'SWE', ()),
+    ('Switzerland', 'CH', 'CHE', ()),
+    ('Syria', 'SY', 'SYR', ('Syrian Arab Republic',)),
+    ('Taiwan', 'TW', 'TWN', ('Taiwan, Province of China', 'Republic of China')),
+    ('Tajikistan', 'TJ', 'TJK', ()),
+    ('Tanzania', 'TZ', 'TZA', ('Tanzania, United Republic of',)),
+    ('Thailand', 'TH', 'THA', ()),
+    ('Timor-Leste', 'TL', 'TLS', ('East Timor',)),
+    ('Togo', 'TG', 'TGO', ()),
+    ('Tonga', 'TO', 'TON', ()),
+    ('Trinidad and Tobago', 'TT', 'TTO', ()),
+    ('Tunisia', 'TN', 'TUN', ()),
+    ('Türkiye', 'TR', 'TUR', ('Turkey', 'Turkiye')),
+    ('Turkmenistan', 'TM', 'TKM', ()),
+    ('Turks and Caicos Islands', 'TC', 'TCA', ()),
+    ('Tuvalu', 'TV', 'TUV', ()),
+    ('U.S. Virgin Islands', 'VI', 'VIR', ('Virgin Islands, U.S.', 'US Virgin Islands')),
+    ('Uganda', 'UG', 'UGA', ()),
+    ('Ukraine', 'UA', 'UKR', ()),
+    ('United Arab Emirates', 'AE', 'ARE', ('UAE', 'U.A.E.', 'Emirates')),
+    ('United Kingdom', 'GB', 'GBR', ('UK', 'U.K.', 'Great Britain', 'Britain', 'England', 'Scotland', 'Wales', 'Northern Ireland')),
+    ('United States', 'US', 'USA', ('United States of America', 'U.S.', 'U.S.A.', 'America')),
+    ('Uruguay', 'UY', 'URY', ()),
+    ('Uzbekistan', 'UZ', 'UZB', ()),
+    ('Vanuatu', 'VU', 'VUT', ()),
+    ('Venezuela', 'VE', 'VEN', ('Venezuela, Bolivarian Republic of',)),
+    ('Vietnam', 'VN', 'VNM', ('Viet Nam', 'Việt Nam')),
+    ('Wallis and Futuna', 'WF', 'WLF', ()),
+    ('Yemen', 'YE', 'YEM', ()),
+    ('Zambia', 'ZM', 'ZMB', ()),
+    ('Zimbabwe', 'ZW', 'ZWE', ()),
+)
+
+DEFAULT_FLAG = '🌐'
+
+_PUNCTUATION = re.compile(r"[.,'’()]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _alias_key(name: str) -> str:
+    """Casefold, strip accents and punctuation so spelling variants share a key"""
+    decomposed = unicodedata.normalize('NFKD', name)
+    ascii_name = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    key = _PUNCTUATION.sub(' ', ascii_name.casefold().replace('&', ' and '))
+    return _WHITESPACE.sub(' ', key).strip()
+
+
+def _flag_for(alpha2: str) -> str:
+    """Build the regional-indicator flag emoji for an ISO alpha-2 code"""
+    return ''.join(chr(0x1F1E6 + ord(ch) - ord('A')) for ch in alpha2)
+
+
+def _build_index() -> Dict[str, Tuple[str, str]]:
+    index = {}
+    for name, alpha2, alpha3, aliases in COUNTRIES:
+        entry = (name, _flag_for(alpha2))
+        for alias in (name, alpha2, alpha3) + aliases:
+            index[_alias_key(alias)] = entry
+    return index
+
+
+# Built once at import: alias key -> (canonical name, flag)
+COUNTRY_INDEX = _build_index()
+# Exact canonical names skip key normalization, the common case for stored rows
+_CANONICAL_INDEX = {name: COUNTRY_INDEX[_alias_key(name)] for name, _, _, _ in COUNTRIES}
+
+
+def resolve_country(country: str) -> Optional[Tuple[str, str]]:
+    """Return (canonical name, flag) for a country name, alias or ISO code"""
+    if not country:
+        return None
+    entry = _CANONICAL_INDEX.get(country)
+    if entry is None:
+        entry = COUNTRY_INDEX.get(_alias_key(country))
+    return entry
+
+
+def normalize_country(country: str) -> str:
+    """Return the canonical country name, or the stripped input if unknown"""
+    entry = resolve_country(country)
+    return entry[0] if entry else (country or '').strip()
+
+
+def country_flag(country: str) -> str:
+    """Return the flag emoji for a country, or a globe if unknown"""
+    entry = resolve_country(country)
+    return entry[1] if entry else DEFAULT_FLAG
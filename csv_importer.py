@@ -2,23 +2,76 @@ import csv
 import logging
 import os
 from typing import Optional
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from db_pool import create_db_engine, get_engine
+from countries import normalize_country
+from importer_cache import invalidate_importers
+from search_index import extend_search_index
 
-# Configure logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.DEBUG,
-)
 logger = logging.getLogger(__name__)
 
+ROLES = ('Exporter', 'Importer')
+# Product values start with where the contact trades: 'ID' (Indonesia) or 'WW' (worldwide)
+ORIGINS = ('ID', 'WW')
+
+CREATE_ROLE_TYPE_SQL = """
+DO $$
+BEGIN
+    CREATE TYPE importer_role AS ENUM ('Exporter', 'Importer');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+"""
+
+# One-shot upgrade of importers created before the typed columns: the
+# WA flag becomes a boolean, role an enum, and the 'ID '/'WW ' product
+# prefix and the HS code in product values get columns of their own
+MIGRATE_IMPORTERS_SQL = """
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'importers' AND column_name = 'wa_availability'
+    ) THEN
+        ALTER TABLE importers
+            ADD COLUMN IF NOT EXISTS origin CHAR(2) CHECK (origin IN ('ID', 'WW')),
+            ADD COLUMN IF NOT EXISTS hs_code VARCHAR(10),
+            ADD COLUMN IF NOT EXISTS wa_available BOOLEAN NOT NULL DEFAULT FALSE;
+
+        UPDATE importers SET
+            product = NULLIF(TRIM(product), ''),
+            origin = CASE WHEN UPPER(LEFT(TRIM(product), 3)) IN ('ID ', 'WW ')
+                          THEN UPPER(LEFT(TRIM(product), 2)) END,
+            hs_code = CASE WHEN UPPER(TRIM(product)) ~ '^((ID|WW) )?[0-9]{2,10}$'
+                           THEN SUBSTRING(TRIM(product) FROM '[0-9]+$') END,
+            wa_available = COALESCE(TRIM(wa_availability) = 'Available', FALSE);
+
+        ALTER TABLE importers
+            ALTER COLUMN role TYPE importer_role
+            USING CASE WHEN TRIM(role) IN ('Exporter', 'Importer')
+                       THEN CAST(TRIM(role) AS importer_role) END,
+            DROP COLUMN wa_availability;
+    END IF;
+END $$;
+"""
+
+def parse_product(product: str) -> tuple[Optional[str], Optional[str]]:
+    """Split a product value like 'WW 0302' or 'ID Coffee' into (origin, hs_code)"""
+    prefix, _, rest = product.strip().partition(' ')
+    origin = prefix.upper() if prefix.upper() in ORIGINS and rest else None
+    code = rest.strip() if origin else product.strip()
+    hs_code = code if code.isdigit() and 2 <= len(code) <= 10 else None
+    return origin, hs_code
+
 def create_tables(engine) -> None:
     """Create required tables if they don't exist"""
     try:
         create_importers_sql = """
         CREATE TABLE IF NOT EXISTS importers (
             id SERIAL PRIMARY KEY,
-            role VARCHAR(50),
+            role importer_role,
             product VARCHAR(50),
+            origin CHAR(2) CHECK (origin IN ('ID', 'WW')),
+            hs_code VARCHAR(10),
             name VARCHAR(255) NOT NULL,
             country VARCHAR(100),
             phone VARCHAR(50),
@@ -27,7 +80,7 @@ def create_tables(engine) -> None:
             email_2 VARCHAR(255),
             last_contact VARCHAR(100),
             status VARCHAR(50),
-            wa_availability VARCHAR(50),
+            wa_available BOOLEAN NOT NULL DEFAULT FALSE,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         """
@@ -39,8 +92,19 @@ def create_tables(engine) -> None:
             processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         """
+        # Role/origin filters are equality checks on these columns; HS
+        # chapter/heading filters (hs_code LIKE '0302%') are range scans
+        create_importers_index_sql = """
+        CREATE INDEX IF NOT EXISTS idx_importers_role_origin
+        ON importers (role, origin);
+        CREATE INDEX IF NOT EXISTS idx_importers_hs_code
+        ON importers (hs_code text_pattern_ops);
+        """
         with engine.begin() as conn:
+            conn.execute(text(CREATE_ROLE_TYPE_SQL))
             conn.execute(text(create_importers_sql))
+            conn.execute(text(MIGRATE_IMPORTERS_SQL))
+            conn.execute(text(create_importers_index_sql))
             conn.execute(text(create_processed_files_sql))
         logger.info("Database tables created successfully")
     except Exception as e:
@@ -54,23 +118,51 @@ def process_csv_row(row: dict) -> Optional[dict]:
         if not name:
             return None
 
+        role = (row.get("Role") or "").strip()
+        product = (row.get("Product") or "").strip()
+        origin, hs_code = parse_product(product)
+
         return {
-            "role": row.get("Role", "").strip(),
-            "product": row.get("Product", "").strip(),
+            "role": role if role in ROLES else None,
+            "product": product or None,
+            "origin": origin,
+            "hs_code": hs_code,
             "name": name,
-            "country": row.get("Country", "").strip(),
+            "country": normalize_country(row.get("Country", "")),
             "phone": row.get("Phone", "").strip(),
             "website": row.get("Website", "").strip(),
             "email_1": row.get("E-mail 1", "").strip(),
             "email_2": row.get("E-mail 2", "").strip(),
             "last_contact": row.get("Last Contact", "").strip(),
             "status": row.get("Status", "").strip(),
-            "wa_availability": row.get("WA Availability", "Not Available").strip(),
+            "wa_available": (row.get("WA Availability") or "").strip() == "Available",
         }
     except Exception as e:
         logger.error(f"Error processing row: {row}, Error: {str(e)}")
         return None
 
+def normalize_existing_countries(engine) -> int:
+    """Rewrite stored country values to their canonical names"""
+    try:
+        updated = 0
+        with engine.begin() as conn:
+            countries = conn.execute(text(
+                "SELECT DISTINCT country FROM importers WHERE country IS NOT NULL"
+            )).scalars().all()
+            for country in countries:
+                canonical = normalize_country(country)
+                if canonical != country:
+                    updated += conn.execute(text(
+                        "UPDATE importers SET country = :canonical WHERE country = :country"
+                    ), {"canonical": canonical, "country": country}).rowcount
+        if updated:
+            invalidate_importers()
+        logger.info(f"Normalized country for {updated} importer rows")
+        return updated
+    except Exception as e:
+        logger.error(f"Error normalizing countries: {str(e)}", exc_info=True)
+        return 0
+
 def import_csv_to_postgres(csv_file_path: str, database_url: Optional[str] = None) -> bool:
     """Import data from CSV file to PostgreSQL database"""
     if not os.path.exists(csv_file_path):
@@ -78,10 +170,7 @@ def import_csv_to_postgres(csv_file_path: str, database_url: Optional[str] = Non
         return False
 
     try:
-        if database_url is None:
-            database_url = os.environ.get("DATABASE_URL")
-        
-        engine = create_engine(database_url, pool_pre_ping=True)
+        engine = create_db_engine(database_url) if database_url else get_engine()
         # Check if file was already processed
         with engine.connect() as conn:
             result = conn.execute(text(
@@ -90,15 +179,10 @@ def import_csv_to_postgres(csv_file_path: str, database_url: Optional[str] = Non
             if result:
                 logger.info(f"File {csv_file_path} was already processed, skipping")
                 return True
-        if database_url is None:
-            database_url = os.environ.get("DATABASE_URL")
-            if not database_url:
-                raise ValueError("DATABASE_URL environment variable not set")
 
         file_size = os.path.getsize(csv_file_path)
         logger.info(f"Processing file: {csv_file_path} (Size: {file_size} bytes)")
 
-        engine = create_engine(database_url, pool_pre_ping=True)
         create_tables(engine)
 
         valid_rows = []
@@ -124,16 +208,19 @@ def import_csv_to_postgres(csv_file_path: str, database_url: Optional[str] = Non
         inserted_count = 0
 
         with engine.begin() as conn:  # Single transaction block
+            # Rows above this id are the ones this load adds
+            watermark = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM importers")).scalar()
+
             for batch_start in range(0, len(valid_rows), batch_size):
                 batch = valid_rows[batch_start : batch_start + batch_size]
 
                 insert_sql = """
                 INSERT INTO importers (
-                    role, product, name, country, phone, website,
-                    email_1, email_2, last_contact, status, wa_availability
+                    role, product, origin, hs_code, name, country, phone, website,
+                    email_1, email_2, last_contact, status, wa_available
                 ) VALUES (
-                    :role, :product, :name, :country, :phone, :website,
-                    :email_1, :email_2, :last_contact, :status, :wa_availability
+                    :role, :product, :origin, :hs_code, :name, :country, :phone,
+                    :website, :email_1, :email_2, :last_contact, :status, :wa_available
                 )
                 """
                 conn.execute(text(insert_sql), batch)
@@ -152,6 +239,12 @@ def import_csv_to_postgres(csv_file_path: str, database_url: Optional[str] = Non
             })
             logger.info(f"Tracked file {csv_file_path} with {inserted_count} rows")
 
+            # Index the new rows in the same transaction as the load
+            extend_search_index(conn, after_id=watermark)
+
+        # Let in-process caches (importer rows, rendered cards) drop stale entries
+        invalidate_importers()
+
         # Verify final count
         with engine.connect() as conn:
             final_count = conn.execute(text("SELECT COUNT(*) FROM importers")).scalar()
@@ -191,8 +284,11 @@ def process_all_csv_files(data_dir: str = "new data update") -> bool:
         return False
 
 if __name__ == "__main__":
+    from logging_config import setup_logging
+    setup_logging()
     logger.info("Starting batch import process for all CSV files")
     if process_all_csv_files():
+        normalize_existing_countries(get_engine())
         logger.info("All CSV imports completed successfully")
         exit(0)
     else:
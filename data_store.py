@@ -1,112 +1,113 @@
 import logging
-from typing import Dict, List, Optional
-import os
-from sqlalchemy import create_engine, text
+import time
+from typing import Dict, List, Optional, Set
+from sqlalchemy import text
+from db_pool import get_engine, pool_stats, prefill_pool
 from messages import Messages
+import queries
+from cache import LRUCache
+from exporter import CsvExport, stream_partitions
+from user_profiles import UserProfiles, display_username
+from importer_cache import get_importer_cache, register_invalidation_hook
+from search_index import SearchIndex
+from catalog import Catalog
+from hs_codes import hs_prefix_filter
+
+# Seconds before the incrementally maintained pending-order count is re-read
+PENDING_RECOUNT_INTERVAL = 300
+
+# Contact category -> (HS chapter/heading prefixes, words for products
+# listed by name instead of HS code)
+CONTACT_CATEGORIES = {
+    'marine': (('0301', '0302', '0303', '0304', '0305'), ('seafood', 'fish', 'marine')),
+    'agriculture': (('0901', '1513'), ('agriculture', 'farming', 'crops')),
+    'spices': (('0904', '0908'), ('spices', 'herbs')),
+    'nuts': (('0801', '0802'), ('nuts', 'peanuts', 'cashews')),
+    'industrial': (('44029010',), ('industrial', 'manufacturing'))
+}
 
 class DataStore:
     def __init__(self):
-        self.engine = create_engine(
-            os.environ.get('DATABASE_URL'),
-            pool_pre_ping=True,  # Enable connection health checks
-            pool_recycle=300,    # Recycle connections every 5 minutes
-            connect_args={
-                "sslmode": "require",
-                "connect_timeout": 30
-            }
-        )
-        self._init_tables()
+        # Shared, configurable pool (see db_pool for the tuning knobs)
+        self.engine = get_engine()
+        queries.install(self.engine)
+        self.importers = get_importer_cache(self.engine)
+        self.profiles = UserProfiles(self.engine)
+        self.search_index = SearchIndex(self.engine)
+        self.catalog = Catalog(self.engine, self.search_index)
+        # Write-through balance cache; the database stays authoritative for debits
+        self._credit_cache = LRUCache(max_size=10000, ttl=600)
+        # user_id -> ids of importers the user has saved, loaded on first search
+        self._saved_ids = LRUCache(max_size=10000, ttl=1800)
+        # Pending-order count, kept current by this process's order writes
+        # and recounted periodically to pick up changes made elsewhere
+        self._pending_orders: Optional[int] = None
+        self._pending_counted_at = 0.0
+        register_invalidation_hook(Messages.invalidate_render_cache)
+        register_invalidation_hook(self.search_index.invalidate)
         logging.info("DataStore initialized with PostgreSQL")
         self.Messages = Messages()
 
-    def _init_tables(self):
-        """Initialize required tables"""
+    def warm_up(self) -> int:
+        """Open pool connections (and their prepared statements) before the first update"""
         try:
-            # Don't drop tables on init, only create if not exists
-            create_saved_contacts_sql = """
-            CREATE TABLE IF NOT EXISTS saved_contacts (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT NOT NULL,
-                importer_name VARCHAR(255) NOT NULL,
-                country VARCHAR(100),
-                phone VARCHAR(50),
-                email VARCHAR(255),
-                website TEXT,
-                wa_availability BOOLEAN,
-                hs_code VARCHAR(255),
-                product_description TEXT,
-                role VARCHAR(50),
-                saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            """
-
-            create_user_stats_sql = """
-            CREATE TABLE IF NOT EXISTS user_stats (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT NOT NULL,
-                command VARCHAR(50) NOT NULL,
-                usage_count INTEGER DEFAULT 1,
-                last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(user_id, command)
-            );
-            """
-
-            create_credit_orders_sql = """
-            CREATE TABLE IF NOT EXISTS credit_orders (
-                id SERIAL PRIMARY KEY,
-                order_id VARCHAR(50) NOT NULL UNIQUE,
-                user_id BIGINT NOT NULL,
-                credits INTEGER NOT NULL,
-                amount INTEGER NOT NULL,
-                status VARCHAR(20) NOT NULL DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                fulfilled_at TIMESTAMP
-            );
-            """
-
-            create_user_credits_sql = """
-            DO $$ 
-            BEGIN
-                CREATE TABLE IF NOT EXISTS user_credits (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT NOT NULL UNIQUE,
-                    credits NUMERIC(10,1) NOT NULL DEFAULT 3.0 CHECK (credits >= 0),
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    has_redeemed_free_credits BOOLEAN DEFAULT FALSE,
-                    CONSTRAINT positive_credits CHECK (credits >= 0)
-                );
-
-                -- Add has_redeemed_free_credits column if it doesn't exist
-                IF NOT EXISTS (
-                    SELECT 1 
-                    FROM information_schema.columns 
-                    WHERE table_name='user_credits' 
-                    AND column_name='has_redeemed_free_credits'
-                ) THEN
-                    ALTER TABLE user_credits 
-                    ADD COLUMN has_redeemed_free_credits BOOLEAN DEFAULT FALSE;
-                END IF;
-            END $$;
-            """
-
-            with self.engine.connect() as conn:
-                conn.execute(text(create_saved_contacts_sql))
-                conn.execute(text(create_user_stats_sql))
-                conn.execute(text(create_user_credits_sql))
-                conn.execute(text(create_credit_orders_sql))
-                conn.commit()
-                logging.info("Tables initialized successfully")
+            return prefill_pool(self.engine)
         except Exception as e:
-            logging.error(f"Error creating tables: {str(e)}", exc_info=True)
+            # Not fatal: connections are opened on demand instead
+            logging.error(f"Database warm-up failed: {str(e)}", exc_info=True)
+            return 0
+
+    def get_setting(self, key: str) -> Optional[str]:
+        with self.engine.connect() as conn:
+            return queries.GET_SETTING.execute(conn, {"key": key}).scalar()
+
+    def set_setting(self, key: str, value: str) -> None:
+        with self.engine.begin() as conn:
+            queries.SET_SETTING.execute(conn, {"key": key, "value": value})
+
+    def _cache_credits(self, user_id: int, credits) -> None:
+        """Record a balance returned by the database, or forget it when unknown"""
+        if credits is None:
+            self._credit_cache.pop(user_id)
+        else:
+            self._credit_cache.set(user_id, credits)
+
+    def get_runtime_stats(self) -> Dict:
+        """Pool and cache statistics for the admin stats command"""
+        return {
+            'pool': pool_stats(self.engine),
+            'importer_cache': self.importers.stats(),
+            'render_cache': Messages._render_cache.stats(),
+            'credit_cache': self._credit_cache.stats(),
+            'saved_ids': self._saved_ids.stats(),
+            'user_profiles': self.profiles.stats(),
+            'search_index': self.search_index.stats(),
+            'catalog': self.catalog.stats(),
+            'orders': {'pending': self._pending_orders},
+            'queries': self._query_summary()
+        }
+
+    def _query_summary(self) -> Dict:
+        """Prepared-statement hit counters, compacted for chat display"""
+        return {
+            name: f"{stats['prepared_executions']}/{stats['executions']} prepared"
+            for name, stats in queries.query_stats().items()
+            if stats['executions']
+        }
 
     def get_user_credits(self, user_id: int) -> float:
         """Get user's remaining credits"""
+        cached = self._credit_cache.get(user_id)
+        if cached is not None:
+            return cached
         try:
             with self.engine.connect() as conn:
-                result = conn.execute(text(
-                    "SELECT credits FROM user_credits WHERE user_id = :user_id"
-                ), {"user_id": user_id}).first()
-                return result[0] if result else 0.0
+                result = queries.GET_USER_CREDITS.execute(
+                    conn, {"user_id": user_id}).first()
+            if result is None:
+                return 0.0
+            self._cache_credits(user_id, result[0])
+            return result[0]
         except Exception as e:
             logging.error(f"Error getting user credits: {str(e)}")
             return None
@@ -116,75 +117,79 @@ class DataStore:
         try:
             with self.engine.begin() as conn:
                 # First check if user already has credits
-                result = conn.execute(text(
-                    "SELECT credits FROM user_credits WHERE user_id = :user_id"
-                ), {"user_id": user_id}).first()
+                result = queries.GET_USER_CREDITS.execute(
+                    conn, {"user_id": user_id}).first()
 
                 if result is None:
                     # Only initialize if user doesn't exist
-                    conn.execute(text("""
-                        INSERT INTO user_credits (user_id, credits) 
-                        VALUES (:user_id, :credits)
-                    """), {"user_id": user_id, "credits": initial_credits})
-                    logging.info(f"Initialized new user {user_id} with {initial_credits} credits")
+                    credits = queries.INSERT_USER_CREDITS.execute(
+                        conn, {"user_id": user_id, "credits": initial_credits}).scalar()
+                    logging.info("Initialized new user %s with %s credits", user_id, initial_credits)
+                else:
+                    credits = result[0]
+            self._cache_credits(user_id, credits)
         except Exception as e:
+            self._credit_cache.pop(user_id)
             logging.error(f"Error initializing user credits: {str(e)}")
 
 
     def use_credit(self, user_id: int, amount: int) -> bool:
         """Use specified amount of credits for the user. Returns True if successful."""
         try:
-            use_credit_sql = """
-            WITH credit_update AS (
-                UPDATE user_credits
-                SET credits = ROUND(CAST(credits - :amount AS NUMERIC), 1),
-                    last_updated = CURRENT_TIMESTAMP
-                WHERE user_id = :user_id AND credits >= :amount
-                RETURNING credits
-            )
-            SELECT credits FROM credit_update;
-            """
-
             with self.engine.connect() as conn:
                 with conn.begin():
-                    result = conn.execute(
-                        text(use_credit_sql),
-                        {"user_id": user_id, "amount": int(amount)}
+                    result = queries.USE_CREDIT.execute(
+                        conn, {"user_id": user_id, "amount": int(amount)}
                     ).scalar()
                     if result is not None:
-                        logging.info(f"Credit used for user {user_id}. Amount: {amount}, Remaining credits: {result}")
+                        logging.info("Credit used for user %s. Amount: %s, Remaining credits: %s", user_id, amount, result)
+                        self._cache_credits(user_id, result)
                         return True
                     conn.rollback()
+                    # Balance was lower than we thought; re-read it on next access
+                    self._credit_cache.pop(user_id)
                     return False
         except Exception as e:
+            self._credit_cache.pop(user_id)
             logging.error(f"Error using credit: {str(e)}", exc_info=True)
             return False
 
     def add_credits(self, user_id: int, amount: int) -> bool:
         """Add credits to user account. Returns True if successful."""
         try:
-            add_credits_sql = """
-            INSERT INTO user_credits (user_id, credits)
-            VALUES (:user_id, :amount)
-            ON CONFLICT (user_id) 
-            DO UPDATE SET 
-                credits = user_credits.credits + :amount,
-                last_updated = CURRENT_TIMESTAMP
-            RETURNING credits;
-            """
-
             with self.engine.connect() as conn:
                 with conn.begin():
-                    result = conn.execute(
-                        text(add_credits_sql),
-                        {"user_id": user_id, "amount": amount}
+                    result = queries.ADD_CREDITS.execute(
+                        conn, {"user_id": user_id, "amount": amount}
                     ).scalar()
-                    logging.info(f"Added {amount} credits for user {user_id}. New total: {result}")
+                    logging.info("Added %s credits for user %s. New total: %s", amount, user_id, result)
+                    self._cache_credits(user_id, result)
                     return result is not None
         except Exception as e:
+            self._credit_cache.pop(user_id)
             logging.error(f"Error adding credits: {str(e)}", exc_info=True)
             return False
 
+    def redeem_free_credits(self, user_id: int) -> tuple[bool, Optional[float]]:
+        """Grant the one-time free credits. Returns (redeemed, balance)."""
+        try:
+            with self.engine.begin() as conn:
+                balance = queries.REDEEM_FREE_CREDITS.execute(
+                    conn, {"user_id": user_id}
+                ).scalar()
+
+            if balance is None:
+                # Already redeemed; report the current balance
+                return False, self.get_user_credits(user_id)
+
+            self._cache_credits(user_id, balance)
+            logging.info("User %s redeemed free credits. New total: %s", user_id, balance)
+            return True, balance
+        except Exception as e:
+            self._credit_cache.pop(user_id)
+            logging.error(f"Error redeeming free credits: {str(e)}", exc_info=True)
+            raise
+
     def search_importers(self, query: str) -> List[Dict]:
         """Search importers by query"""
         try:
@@ -227,74 +232,36 @@ class DataStore:
     async def save_contact(self, user_id: int, importer: Dict) -> bool:
         """Save an importer contact for a user"""
         try:
-            logging.info(f"Starting save contact process for user {user_id}")
+            logging.debug("Starting save contact process for user %s", user_id)
             credit_cost = Messages._calculate_credit_cost(importer)
-            logging.info(f"Calculated credit cost for contact: {credit_cost}")
+            logging.debug("Calculated credit cost for contact: %s", credit_cost)
 
             with self.engine.begin() as conn:
                 try:
                     # Check credits
-                    current_credits = conn.execute(
-                        text("SELECT credits FROM user_credits WHERE user_id = :user_id FOR UPDATE"),
-                        {"user_id": user_id}
+                    current_credits = queries.LOCK_USER_CREDITS.execute(
+                        conn, {"user_id": user_id}
                     ).scalar()
 
                     if current_credits is None or current_credits < credit_cost:
                         logging.error(f"Insufficient credits. Current: {current_credits}, Required: {credit_cost}")
+                        self._cache_credits(user_id, current_credits)
                         return False
 
-                    # Check if contact already exists using importer_name
-                    existing = conn.execute(
-                        text("""
-                        SELECT id FROM saved_contacts 
-                        WHERE user_id = :user_id AND importer_name = :name
-                        """),
-                        {"user_id": user_id, "name": importer['importer_name']}
-                    ).first()
-
-                    if existing:
-                        logging.warning(f"Contact {importer['name']} already saved by user {user_id}")
-                        return False
-
-                    # Insert contact if not exists
-                    contact_result = conn.execute(
-                        text("""
-                        INSERT INTO saved_contacts (
-                            user_id, importer_name, country, phone, email, 
-                            website, wa_availability, hs_code, product_description, role
-                        ) VALUES (
-                            :user_id, :name, :country, :phone, :email,
-                            :website, :wa_available, :hs_code, :product_description, :role
-                        )
-                        RETURNING id;
-                        """),
-                        {
-                            "user_id": user_id,
-                            "name": importer['importer_name'],
-                            "country": importer['country'],
-                            "phone": importer['contact'],
-                            "email": importer['email'],
-                            "website": importer['website'],
-                            "wa_available": importer['wa_available'],
-                            "hs_code": importer.get('hs_code', ''),
-                            "product_description": importer.get('product_description', ''),
-                            "role": importer.get('role', '')
-                        }
-                    )
+                    # The unique (user_id, importer_id) index rejects repeat saves
+                    contact_result = queries.INSERT_SAVED_CONTACT.execute(conn, {
+                        "user_id": user_id,
+                        "importer_id": importer['id'],
+                        "price_paid": float(credit_cost)
+                    })
 
-                    if contact_result.rowcount == 0:
-                        logging.error("Failed to insert contact")
+                    if contact_result.first() is None:
+                        logging.warning(f"Contact {importer['id']} already saved by user {user_id}")
                         return False
 
                     # Deduct credits
-                    credit_result = conn.execute(
-                        text("""
-                        UPDATE user_credits 
-                        SET credits = ROUND(CAST(credits - :credit_cost AS NUMERIC), 1),
-                            last_updated = CURRENT_TIMESTAMP
-                        WHERE user_id = :user_id 
-                        RETURNING credits;
-                        """),
+                    credit_result = queries.DEDUCT_CREDITS.execute(
+                        conn,
                         {"user_id": user_id, "credit_cost": float(credit_cost)}
                     )
 
@@ -303,7 +270,11 @@ class DataStore:
                         logging.error("Failed to update credits")
                         return False
 
-                    logging.info(f"Successfully saved contact and deducted {credit_cost} credits. New balance: {new_credits}")
+                    logging.info("Successfully saved contact and deducted %s credits. New balance: %s", credit_cost, new_credits)
+                    self._cache_credits(user_id, new_credits)
+                    saved = self._saved_ids.get(user_id)
+                    if saved is not None:
+                        saved.add(importer['id'])
                     return True
 
                 except Exception as tx_error:
@@ -311,23 +282,26 @@ class DataStore:
                     return False
 
         except Exception as e:
+            self._credit_cache.pop(user_id)
             logging.error(f"Error in save_contact: {str(e)}", exc_info=True)
             return False
 
+    def saved_importer_ids(self, user_id: int) -> Set[int]:
+        """Ids of the importers user_id has saved, for filtering search results"""
+        saved = self._saved_ids.get(user_id)
+        if saved is None:
+            with self.engine.connect() as conn:
+                saved = set(queries.GET_SAVED_IMPORTER_IDS.execute(
+                    conn, {"user_id": user_id}).scalars().all())
+            self._saved_ids.set(user_id, saved)
+        return saved
+
     def get_saved_contacts(self, user_id: int) -> List[Dict]:
         """Get saved contacts for a user"""
         try:
-            get_saved_sql = """
-            SELECT importer_name, country, phone, email, website, 
-                   wa_availability, saved_at, hs_code, product_description, role
-            FROM saved_contacts
-            WHERE user_id = :user_id
-            ORDER BY saved_at DESC;
-            """
             with self.engine.connect() as conn:
-                result = conn.execute(
-                    text(get_saved_sql),
-                    {"user_id": user_id}
+                result = queries.GET_SAVED_CONTACTS.execute(
+                    conn, {"user_id": user_id}
                 ).fetchall()
 
                 return [
@@ -337,8 +311,10 @@ class DataStore:
                         'contact': row.phone,
                         'email': row.email,
                         'website': row.website,
-                        'wa_available': row.wa_availability,
+                        'wa_available': row.wa_available,
                         'saved_at': row.saved_at.strftime("%Y-%m-%d %H:%M"),
+                        'product': row.product,
+                        'origin': row.origin,
                         'hs_code': row.hs_code,
                         'product_description': row.product_description,
                         'role': row.role if row.role else row.product_description
@@ -352,33 +328,21 @@ class DataStore:
     def track_user_command(self, user_id: int, command: str):
         """Track user command usage in PostgreSQL"""
         try:
-            update_sql = """
-            INSERT INTO user_stats (user_id, command, usage_count, last_used)
-            VALUES (:user_id, :command, 1, CURRENT_TIMESTAMP)
-            ON CONFLICT (user_id, command)
-            DO UPDATE SET 
-                usage_count = user_stats.usage_count + 1,
-                last_used = CURRENT_TIMESTAMP;
-            """
-
             with self.engine.connect() as conn:
                 with conn.begin():
-                    conn.execute(text(update_sql), {"user_id": user_id, "command": command})
+                    queries.TRACK_USER_COMMAND.execute(
+                        conn, {"user_id": user_id, "command": command})
 
-            logging.info(f"Command tracked for user {user_id}: {command}")
+            logging.debug("Command tracked for user %s: %s", user_id, command)
         except Exception as e:
             logging.error(f"Error tracking command: {str(e)}", exc_info=True)
 
     def get_user_stats(self, user_id: int) -> Dict:
         """Get user statistics from PostgreSQL"""
         try:
-            stats_sql = """
-            SELECT command, usage_count
-            FROM user_stats
-            WHERE user_id = :user_id;
-            """
             with self.engine.connect() as conn:
-                result = conn.execute(text(stats_sql), {"user_id": user_id}).fetchall()
+                result = queries.GET_USER_STATS.execute(
+                    conn, {"user_id": user_id}).fetchall()
                 commands = {row.command: row.usage_count for row in result}
                 total = sum(commands.values())
                 return {
@@ -402,75 +366,55 @@ class DataStore:
             # Base SQL query for fetching contacts
             contact_sql = """
             SELECT name, country, phone as contact, website, 
-                   email as email, wa_available as wa_availability, product,
+                   email_1 as email, wa_available, product, origin, hs_code,
                    role as product_description
             FROM importers 
             WHERE 1=1
             """
 
             params = {}
+            filters = ""
+            product = None
 
             # Add role filter based on category type
             if category_type == "supplier":
-                count_sql += " AND role = 'Exporter'"
-                contact_sql += " AND role = 'Exporter'"
-
-                # Add specific category filter for suppliers if provided
-                if specific_category:
-                    if specific_category == 'marine':
-                        product_pattern = '%(0301|0302|0303|0304|0305|seafood|fish|marine)%'
-                    elif specific_category == 'agriculture':
-                        product_pattern = '%(0901|1513|agriculture|farming|crops)%'
-                    elif specific_category == 'spices':
-                        product_pattern = '%(0904|0908|spices|herbs)%'
-                    elif specific_category == 'nuts':
-                        product_pattern = '%(0801|0802|nuts|peanuts|cashews)%'
-                    elif specific_category == 'industrial':
-                        product_pattern = '%(44029010|industrial|manufacturing)%'
-                    else:
-                        product_pattern = f'%{specific_category}%'
-
-                    count_sql += " AND (LOWER(product) SIMILAR TO :pattern OR LOWER(product_description) SIMILAR TO :pattern)"
-                    contact_sql += " AND (LOWER(product) SIMILAR TO :pattern OR LOWER(product_description) SIMILAR TO :pattern)"
-                    params['pattern'] = product_pattern
-
+                filters += " AND role = 'Exporter'"
+                product = specific_category
             elif category_type == "buyer":
-                count_sql += " AND role = 'Importer'"
-                contact_sql += " AND role = 'Importer'"
-
+                filters += " AND role = 'Importer'"
                 if specific_category:
                     # Handle ID/WW prefix for buyers
                     category_parts = specific_category.split("_", 1)
                     if len(category_parts) == 2:
                         location, product = category_parts
-                        count_sql += " AND country_type = :country_type"
-                        contact_sql += " AND country_type = :country_type"
-
-                        # Add product category filter
-                        if product == 'marine':
-                            product_pattern = '%(0301|0302|0303|0304|0305|seafood|fish|marine)%'
-                        elif product == 'agriculture':
-                            product_pattern = '%(0901|1513|agriculture|farming|crops)%'
-                        elif product == 'spices':
-                            product_pattern = '%(0904|0908|spices|herbs)%'
-                        else:
-                            product_pattern = f'%{product}%'
-
-                        count_sql += " AND (LOWER(product) SIMILAR TO :pattern OR LOWER(product_description) SIMILAR TO :pattern)"
-                        contact_sql += " AND (LOWER(product) SIMILAR TO :pattern OR LOWER(product_description) SIMILAR TO :pattern)"
-
-                        params['country_type'] = location
-                        params['pattern'] = product_pattern
+                        filters += " AND origin = :origin"
+                        params['origin'] = location.upper()
+
+            # Add product category filter: HS prefixes are index range
+            # scans on hs_code, words are matched in product names
+            if product:
+                hs_prefixes, words = CONTACT_CATEGORIES.get(
+                    product, ((product,), ()) if product.isdigit() else ((), (product,)))
+                conditions = []
+                if hs_prefixes:
+                    conditions.append(hs_prefix_filter(hs_prefixes, params))
+                if words:
+                    conditions.append("LOWER(product) SIMILAR TO :pattern")
+                    params['pattern'] = f"%({'|'.join(word.lower() for word in words)})%"
+                filters += f" AND ({' OR '.join(conditions)})"
+
+            count_sql += filters
+            contact_sql += filters
 
             # Add ordering and limit for contact query
             contact_sql += " ORDER BY RANDOM() LIMIT 10"
 
-            logging.info(f"Executing category query with params: {params}")
+            logging.debug("Executing category query with params: %s", params)
 
             with self.engine.connect() as conn:
                 # Get total count
                 total_count = conn.execute(text(count_sql), params).scalar() or 0
-                logging.info(f"Found {total_count} total contacts for category")
+                logging.debug("Found %s total contacts for category", total_count)
 
                 # Get contacts
                 results = conn.execute(text(contact_sql), params).fetchall()
@@ -482,13 +426,15 @@ class DataStore:
                         'contact': row.contact,
                         'website': row.website,
                         'email': row.email,
-                        'wa_available': row.wa_availability,
+                        'wa_available': row.wa_available,
                         'product': row.product,
+                        'origin': row.origin,
+                        'hs_code': row.hs_code,
                         'product_description': row.product_description
                     }
                     contacts.append(contact)
 
-                logging.info(f"Returning {len(contacts)} contacts")
+                logging.debug("Returning %s contacts", len(contacts))
                 return contacts, total_count
 
         except Exception as e:
@@ -513,10 +459,14 @@ class DataStore:
                 WHERE 1=1
             """
 
-            if search_type == 'ID':
-                base_query += " AND country_type = :search_value"
-            elif search_type == 'WW':
-                base_query += " AND country_type != 'ID'"
+            if search_type not in ('ID', 'WW'):
+                return [], 0
+            base_query += " AND origin = :origin"
+            if search_value.isdigit():
+                # Everything under the code, as a range scan of the hs_code index
+                base_query += " AND hs_code LIKE :search_value || '%'"
+            else:
+                base_query += " AND LOWER(product) LIKE '%' || LOWER(:search_value) || '%'"
 
             # Count total results
             count_query = f"SELECT COUNT(*) FROM ({base_query}) as count_query"
@@ -531,13 +481,14 @@ class DataStore:
                 # Get total count
                 total_count = conn.execute(
                     text(count_query),
-                    {"search_value": search_value}
+                    {"origin": search_type, "search_value": search_value}
                 ).scalar() or 0
 
                 # Get paginated results
                 results = conn.execute(
                     text(main_query),
                     {
+                        "origin": search_type,
                         "search_value": search_value,
                         "limit": per_page,
                         "offset": offset
@@ -557,92 +508,173 @@ class DataStore:
                         contact['contact'] = f"{phone[:4]}..." if phone else "***"
                     contacts.append(contact)
 
-                logging.info(f"Found {total_count} results for pattern {pattern}, returning page {page + 1}")
+                logging.debug("Found %s results for pattern %s, returning page %s", total_count, pattern, page + 1)
                 return contacts, total_count
 
         except Exception as e:
             logging.error(f"Error searching importers by pattern: {str(e)}", exc_info=True)
             return [], 0
 
-    def format_saved_contacts_to_csv(self, user_id: int) -> str:
-        """Format saved contacts into CSV string"""
+    def create_credit_order(self, order_id: str, user_id: int, credits: int, amount: int) -> None:
+        """Insert a pending credit order"""
+        with self.engine.begin() as conn:
+            queries.INSERT_CREDIT_ORDER.execute(conn, {
+                "order_id": order_id,
+                "user_id": user_id,
+                "credits": credits,
+                "amount": amount
+            })
+        self._adjust_pending_orders(1)
+
+    def delete_credit_order(self, order_id: str) -> bool:
+        """Delete an order, returning whether it existed"""
+        with self.engine.begin() as conn:
+            status = queries.DELETE_CREDIT_ORDER.execute(
+                conn, {"order_id": order_id}).scalar()
+        if status == 'pending':
+            self._adjust_pending_orders(-1)
+        return status is not None
+
+    def fulfill_order(self, order_id: str) -> tuple[Optional[Dict], Optional[str]]:
+        """Fulfill a pending order and credit its user in one transaction.
+
+        Returns (result, None) with user_id, added and balance on success,
+        or (None, status) where status is the order's current status, or
+        None when the order does not exist.
+        """
+        with self.engine.begin() as conn:
+            row = queries.FULFILL_ORDER.execute(conn, {"order_id": order_id}).first()
+            if row is None:
+                status = queries.GET_ORDER_STATUS.execute(
+                    conn, {"order_id": order_id}).scalar()
+                return None, status
+
+        result = dict(row._mapping)
+        self._cache_credits(result['user_id'], result['balance'])
+        self._adjust_pending_orders(-1)
+        logging.info("Order %s fulfilled, %s credits to user %s", order_id, result['added'], result['user_id'])
+        return result, None
+
+    def fulfill_orders(self, order_ids: List[str]) -> List[Dict]:
+        """Fulfill many pending orders at once; one result per credited user"""
+        with self.engine.begin() as conn:
+            rows = queries.FULFILL_ORDERS.execute(
+                conn, {"order_ids": list(set(order_ids))}).fetchall()
+
+        results = [dict(row._mapping) for row in rows]
+        for result in results:
+            self._cache_credits(result['user_id'], result['balance'])
+        self._adjust_pending_orders(-sum(len(result['order_ids']) for result in results))
+        logging.info("Batch fulfilled %s of %s orders", sum(len(r['order_ids']) for r in results), len(order_ids))
+        return results
+
+    def grant_credits(self, grants: Dict[int, int]) -> Dict[int, float]:
+        """Add credits to many users in one statement, returning new balances"""
+        if not grants:
+            return {}
+        with self.engine.begin() as conn:
+            rows = queries.GRANT_CREDITS.execute(conn, {
+                "user_ids": list(grants.keys()),
+                "amounts": list(grants.values())
+            }).fetchall()
+
+        balances = {row.user_id: row.credits for row in rows}
+        for user_id, balance in balances.items():
+            self._cache_credits(user_id, balance)
+        return balances
+
+    def find_pending_order(self, user_id: int, credits: int) -> Optional[str]:
+        """Oldest pending order id matching a legacy give_ button"""
+        with self.engine.connect() as conn:
+            return queries.FIND_PENDING_ORDER.execute(
+                conn, {"user_id": user_id, "credits": credits}).scalar()
+
+    def get_pending_order(self, cursor_id: Optional[int] = None, direction: str = 'older') -> Optional[Dict]:
+        """Newest pending order, or the neighbour of cursor_id in the queue"""
         try:
-            # Get saved contacts
-            contacts = self.get_saved_contacts(user_id)
-            if not contacts:
-                return "No saved contacts found"
-
-            # Define CSV header
-            header = ["Name", "Country", "Phone", "Email", "Website", "WhatsApp Available", "Saved Date", "HS Code", "Product Description", "Role"]
-
-            # Format rows
-            rows = [header]
-            for contact in contacts:
-                row = [
-                    contact['name'],
-                    contact['country'],
-                    contact['contact'],
-                    contact['email'],
-                    contact['website'],
-                    'Yes' if contact['wa_available'] else 'No',
-                    contact['saved_at'],
-                    contact['hs_code'],
-                    contact['product_description'],
-                    contact['role']
-                ]
-                rows.append(row)
-
-            # Convert to CSV string
-            import csv
-            from io import StringIO
-            output = StringIO()
-            writer = csv.writer(output)
-            writer.writerows(rows)
-            return output.getvalue()
+            with self.engine.connect() as conn:
+                if cursor_id is not None:
+                    seek = queries.OLDER_PENDING_ORDER if direction == 'older' else queries.NEWER_PENDING_ORDER
+                    row = seek.execute(conn, {"cursor_id": cursor_id}).first()
+                    if row is not None:
+                        return dict(row._mapping)
+                # No cursor, or it was deleted/fulfilled and nothing lies beyond it
+                row = queries.NEWEST_PENDING_ORDER.execute(conn).first()
+                return dict(row._mapping) if row is not None else None
+        except Exception as e:
+            logging.error(f"Error getting pending order: {str(e)}", exc_info=True)
+            return None
 
+    def pending_order_count(self) -> int:
+        """Number of pending orders, recounted at most every PENDING_RECOUNT_INTERVAL"""
+        if self._pending_orders is None or time.monotonic() - self._pending_counted_at > PENDING_RECOUNT_INTERVAL:
+            with self.engine.connect() as conn:
+                self._pending_orders = queries.COUNT_PENDING_ORDERS.execute(conn).scalar()
+            self._pending_counted_at = time.monotonic()
+        return self._pending_orders
+
+    def _adjust_pending_orders(self, delta: int) -> None:
+        if self._pending_orders is not None:
+            self._pending_orders = max(0, self._pending_orders + delta)
+
+    def export_saved_contacts_csv(self, user_id: int) -> Optional[CsvExport]:
+        """Stream saved contacts into a CSV export, None when there are none"""
+        header = ["Name", "Country", "Phone", "Email", "Website", "WhatsApp Available", "Saved Date", "HS Code", "Product Description", "Role"]
+        export = CsvExport(f"saved_contacts_{user_id}.csv", header)
+        try:
+            for rows in stream_partitions(self.engine, queries.GET_SAVED_CONTACTS.statement,
+                                          {"user_id": user_id}):
+                export.write_rows([
+                    row.importer_name,
+                    row.country,
+                    row.phone,
+                    row.email,
+                    row.website,
+                    'Yes' if row.wa_available else 'No',
+                    row.saved_at.strftime("%Y-%m-%d %H:%M"),
+                    row.hs_code or row.product,
+                    row.product_description,
+                    row.role if row.role else row.product_description
+                ] for row in rows)
         except Exception as e:
-            logging.error(f"Error formatting contacts to CSV: {str(e)}")
-            return "Error generating CSV"
+            export.close()
+            logging.error(f"Error exporting saved contacts: {str(e)}", exc_info=True)
+            raise
+
+        if not export.rows:
+            export.close()
+            return None
+        return export
+
+    def order_user_ids(self) -> List[int]:
+        with self.engine.connect() as conn:
+            return queries.ORDER_USER_IDS.execute(conn).scalars().all()
+
+    def export_orders_csv(self, profiles: Dict[int, Dict]) -> Optional[CsvExport]:
+        """Stream all credit orders, newest first, into a CSV export, None when there are none.
 
-    def format_orders_to_csv(self, user_id: int) -> str:
-        """Format credit orders into CSV string"""
+        profiles (user_id -> profile) must be resolved beforehand: nothing
+        waits on the network while the cursor holds a pooled connection.
+        """
+        header = ['User ID', 'Username', 'Time', 'Credits', 'Amount (Rp)', 'Status', 'Fulfilled At']
+        export = CsvExport("orders_export.csv", header)
         try:
-            # Get orders from database
-            with self.engine.connect() as conn:
-                orders = conn.execute(text("""
-                    SELECT order_id, credits, amount, status, created_at, fulfilled_at
-                    FROM credit_orders
-                    WHERE user_id = :user_id
-                    ORDER BY created_at DESC
-                """), {"user_id": user_id}).fetchall()
-
-            if not orders:
-                return "No orders found"
-
-            # Define CSV header
-            header = ["Order ID", "Credits", "Amount", "Status", "Created At", "Fulfilled At"]
-
-            # Format rows
-            rows = [header]
-            for order in orders:
-                row = [
-                    order.order_id,
+            for orders in stream_partitions(self.engine, queries.EXPORT_CREDIT_ORDERS.statement):
+                export.write_rows([
+                    f"User_{order.user_id}",
+                    display_username(profiles.get(order.user_id)),
+                    order.created_at.strftime('%Y-%m-%d %H:%M:%S'),
                     order.credits,
-                    f"Rp {order.amount:,}",
+                    f"{order.amount:,}",
                     order.status,
-                    order.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                    order.fulfilled_at.strftime("%Y-%m-%d %H:%M:%S") if order.fulfilled_at else "Not fulfilled"
-                ]
-                rows.append(row)
-
-            # Convert to CSV string
-            import csv
-            from io import StringIO
-            output = StringIO()
-            writer = csv.writer(output)
-            writer.writerows(rows)
-            return output.getvalue()
-
+                    order.fulfilled_at.strftime('%Y-%m-%d %H:%M:%S') if order.fulfilled_at else '-'
+                ] for order in orders)
         except Exception as e:
-            logging.error(f"Error formatting orders to CSV: {str(e)}")
-            return "Error generating CSV"
\ No newline at end of file
+            export.close()
+            logging.error(f"Error exporting orders: {str(e)}", exc_info=True)
+            raise
+
+        if not export.rows:
+            export.close()
+            return None
+        return export
\ No newline at end of file
@@ -0,0 +1,166 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from env import env_int
+
+
+# Pool settings, overridable per deploy through the environment
+POOL_SIZE = env_int('DB_POOL_SIZE', 5)
+MAX_OVERFLOW = env_int('DB_MAX_OVERFLOW', 10)
+POOL_TIMEOUT = env_int('DB_POOL_TIMEOUT', 20)
+POOL_RECYCLE = env_int('DB_POOL_RECYCLE', 300)
+# 'always' pings on every checkout, 'never' skips it, 'idle' pings only
+# connections that sat unused longer than PRE_PING_IDLE seconds
+PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'idle').lower()
+PRE_PING_IDLE = env_int('DB_PRE_PING_IDLE', 60)
+STATEMENT_TIMEOUT_MS = env_int('DB_STATEMENT_TIMEOUT_MS', 30000)
+CONNECT_TIMEOUT = env_int('DB_CONNECT_TIMEOUT', 30)
+# Connections opened at startup so the first updates skip the TCP/TLS handshake
+POOL_PREFILL = env_int('DB_POOL_PREFILL', 2)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            with self._wait_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+
+def _install_idle_ping(engine: Engine, idle_seconds: int) -> None:
+    """Ping only connections that were idle long enough to have gone stale"""
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        connection_record.info['last_checkin'] = time.monotonic()
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        last_checkin = connection_record.info.get('last_checkin')
+        if last_checkin is None or time.monotonic() - last_checkin < idle_seconds:
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+        except Exception:
+            # The pool discards this connection and retries with a fresh one
+            raise exc.DisconnectionError("Stale connection detected on checkout")
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+
+def create_db_engine(database_url: Optional[str] = None, **overrides) -> Engine:
+    """Create an engine with the shared pool configuration"""
+    database_url = database_url or os.environ.get('DATABASE_URL')
+    if not database_url:
+        raise ValueError("DATABASE_URL environment variable not set")
+
+    pre_ping = overrides.pop('pre_ping', PRE_PING)
+    connect_args = {
+        "sslmode": "require",
+        "connect_timeout": CONNECT_TIMEOUT
+    }
+    if STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"
+    connect_args.update(overrides.pop('connect_args', {}))
+
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": pre_ping == 'always',
+        "connect_args": connect_args
+    }
+    options.update(overrides)
+
+    engine = create_engine(database_url, **options)
+    if pre_ping == 'idle':
+        _install_idle_ping(engine, PRE_PING_IDLE)
+    logging.info(
+        f"Database engine created (pool_size={options['pool_size']}, "
+        f"max_overflow={options['max_overflow']}, pre_ping={pre_ping})")
+    return engine
+
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    """Return the process-wide engine, creating it on first use"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_db_engine()
+    return _engine
+
+
+def prefill_pool(engine: Engine, connections: int = POOL_PREFILL) -> int:
+    """Open up to connections pool connections concurrently and return them to the pool"""
+    connections = min(connections, POOL_SIZE)
+    if connections <= 0:
+        return 0
+    # Every worker holds its connection until all have one, so the pool
+    # ends up with distinct connections rather than one reused N times
+    barrier = threading.Barrier(connections)
+
+    def open_connection(_):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            try:
+                barrier.wait(timeout=CONNECT_TIMEOUT)
+            except threading.BrokenBarrierError:
+                pass
+
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        list(executor.map(open_connection, range(connections)))
+    return connections
+
+
+def pool_stats(engine: Optional[Engine] = None) -> Dict:
+    """Live pool statistics for the admin/instrumentation surface"""
+    engine = engine or _engine
+    if engine is None:
+        return {}
+    pool = engine.pool
+    stats = {
+        'pool_size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow()
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._wait_lock:
+            checkouts = pool.checkouts
+            stats.update({
+                'checkouts': checkouts,
+                'avg_wait_ms': round(pool.wait_total / checkouts * 1000, 2) if checkouts else 0.0,
+                'max_wait_ms': round(pool.wait_max * 1000, 2)
+            })
+    return stats
@@ -0,0 +1,192 @@
+import asyncio
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Optional
+from env import env_float
+
+# off, on (lag sampling and stall watchdog) or debug (also asyncio debug
+# mode, which logs every slow callback but slows the loop down)
+DIAGNOSTICS = os.environ.get('DIAGNOSTICS', 'off').lower()
+if DIAGNOSTICS in ('1', 'true', 'yes'):
+    DIAGNOSTICS = 'on'
+# Seconds between event loop lag samples
+LOOP_LAG_INTERVAL = env_float('LOOP_LAG_INTERVAL', 0.5)
+# A callback holding the loop longer than this many seconds is reported
+LOOP_BLOCK_THRESHOLD = env_float('LOOP_BLOCK_THRESHOLD', 0.25)
+
+# Upper bounds (ms) of the lag histogram buckets; the last one is open
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+logger = logging.getLogger(__name__)
+
+
+class LagHistogram:
+    """Bucketed event loop lag samples"""
+
+    def __init__(self, buckets=LAG_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.samples = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, lag_ms: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, lag_ms)] += 1
+        self.samples += 1
+        self.total_ms += lag_ms
+        self.max_ms = max(self.max_ms, lag_ms)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Upper bound (ms) of the bucket holding the given fraction of samples"""
+        if not self.samples:
+            return None
+        threshold = fraction * self.samples
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= threshold:
+                return bound
+        return self.max_ms
+
+    def stats(self) -> Dict:
+        labels = [f"<={bound}ms" for bound in self.buckets] + [f">{self.buckets[-1]}ms"]
+        return {
+            'samples': self.samples,
+            'mean_ms': round(self.total_ms / self.samples, 1) if self.samples else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max_ms, 1),
+            'histogram': ' '.join(f"{label}:{count}" for label, count in zip(labels, self.counts) if count)
+        }
+
+
+class LoopMonitor:
+    """Samples event loop lag and dumps the loop's stack when it stalls"""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_BLOCK_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.histogram = LagHistogram()
+        self.stalls = 0
+        self.longest_stall = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+        # Set by the watchdog, cleared by the loop when it gets to run again
+        self._ping_sent: Optional[float] = None
+        # Whether the watchdog already reported the stall holding up the ping
+        self._ping_reported = False
+        self._ping_lock = threading.Lock()
+
+    def start(self, debug: bool = False) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        if debug:
+            # asyncio then logs "Executing <Handle ...> took N seconds" itself
+            self._loop.set_debug(True)
+            self._loop.slow_callback_duration = self.threshold
+        self._task = self._loop.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+        logger.info(f"Event loop diagnostics on (threshold {self.threshold * 1000:.0f} ms)")
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _sample(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - started - self.interval
+            self.histogram.record(max(0.0, lag) * 1000)
+
+    def _pong(self) -> None:
+        with self._ping_lock:
+            sent = self._ping_sent
+            reported = self._ping_reported
+            self._ping_sent = None
+        if sent is not None:
+            blocked = time.monotonic() - sent
+            self.longest_stall = max(self.longest_stall, blocked)
+            # Stalls the watchdog caught are reported once, with the stack
+            if blocked > self.threshold and not reported:
+                self.stalls += 1
+                logger.warning(f"Event loop was blocked for {blocked * 1000:.0f} ms")
+
+    def _watch(self) -> None:
+        """Watchdog thread: ping the loop and capture its stack if the ping goes unanswered"""
+        poll = self.threshold / 2
+        while not self._stop.wait(poll):
+            with self._ping_lock:
+                sent = self._ping_sent
+                reported = self._ping_reported
+                if sent is None:
+                    self._ping_sent = time.monotonic()
+                    self._ping_reported = False
+            if sent is None:
+                try:
+                    self._loop.call_soon_threadsafe(self._pong)
+                except RuntimeError:
+                    # Loop closed
+                    return
+                continue
+
+            blocked = time.monotonic() - sent
+            self.longest_stall = max(self.longest_stall, blocked)
+            if blocked > self.threshold and not reported:
+                with self._ping_lock:
+                    if self._ping_sent != sent:
+                        # The loop answered in the meantime and reports it itself
+                        continue
+                    self._ping_reported = True
+                self.stalls += 1
+                frame = sys._current_frames().get(self._loop_thread)
+                stack = ''.join(traceback.format_stack(frame)) if frame else 'unavailable'
+                logger.warning(
+                    f"Event loop blocked for {blocked * 1000:.0f} ms; loop thread stack:\n{stack}")
+
+    def stats(self) -> Dict:
+        stats = self.histogram.stats()
+        stats.update({
+            'stalls': self.stalls,
+            'longest_stall_ms': round(self.longest_stall * 1000, 1)
+        })
+        return stats
+
+
+_monitor: Optional[LoopMonitor] = None
+
+
+def start_monitor() -> Optional[LoopMonitor]:
+    """Start diagnostics on the running loop when DIAGNOSTICS is enabled"""
+    global _monitor
+    if DIAGNOSTICS not in ('on', 'debug') or _monitor is not None:
+        return _monitor
+    _monitor = LoopMonitor()
+    _monitor.start(debug=DIAGNOSTICS == 'debug')
+    return _monitor
+
+
+async def stop_monitor() -> None:
+    global _monitor
+    if _monitor is not None:
+        await _monitor.stop()
+        _monitor = None
+
+
+def monitor_stats() -> Optional[Dict]:
+    return _monitor.stats() if _monitor is not None else None
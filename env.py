@@ -0,0 +1,22 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def env_int(name: str, default: int) -> int:
+    """Integer setting from the environment, default when unset or invalid"""
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid value for {name}, using default {default}")
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """Float setting from the environment, default when unset or invalid"""
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid value for {name}, using default {default}")
+        return default
@@ -0,0 +1,72 @@
+import csv
+import gzip
+import logging
+import os
+import tempfile
+from typing import Iterable, List, Optional
+from env import env_int
+
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = env_int('EXPORT_BATCH_SIZE', 1000)
+# Exports stay in memory up to this size, then roll over to a temp file
+EXPORT_SPOOL_MAX_SIZE = env_int('EXPORT_SPOOL_MAX_SIZE', 1024 * 1024)
+EXPORT_GZIP = os.environ.get('EXPORT_GZIP', 'false').lower() in ('1', 'true', 'yes', 'on')
+
+
+class _Utf8Writer:
+    """Encode csv.writer output straight into a binary stream"""
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def write(self, data: str) -> int:
+        return self.raw.write(data.encode('utf-8'))
+
+
+class CsvExport:
+    """CSV document written row by row into a spooled temporary buffer"""
+
+    def __init__(self, filename: str, header: List, compress: Optional[bool] = None):
+        compress = EXPORT_GZIP if compress is None else compress
+        self.filename = f"{filename}.gz" if compress else filename
+        self.rows = 0
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE, mode='w+b')
+        self._gzip = gzip.GzipFile(fileobj=self.buffer, mode='wb') if compress else None
+        self._writer = csv.writer(_Utf8Writer(self._gzip or self.buffer))
+        self._writer.writerow(header)
+
+    def write_rows(self, rows: Iterable[List]) -> None:
+        for row in rows:
+            self._writer.writerow(row)
+            self.rows += 1
+
+    def finish(self):
+        """Flush the document and rewind it for sending"""
+        if self._gzip is not None:
+            self._gzip.close()
+            self._gzip = None
+        self.buffer.seek(0)
+        return self.buffer
+
+    def close(self) -> None:
+        if self._gzip is not None:
+            self._gzip.close()
+        self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def stream_partitions(engine, statement, params: Optional[dict] = None,
+                      batch_size: int = EXPORT_BATCH_SIZE):
+    """Yield result rows in batches through a server-side cursor"""
+    with engine.connect() as conn:
+        result = conn.execution_options(
+            stream_results=True, yield_per=batch_size
+        ).execute(statement, params or {})
+        for partition in result.partitions():
+            yield partition
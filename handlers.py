@@ -2,6 +2,9 @@ import logging
 import os
 import time
 import asyncio
+import csv
+import io
+from typing import Dict, List
 from sqlalchemy import create_engine, text
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler, CallbackContext
@@ -9,9 +12,13 @@ from telegram.error import BadRequest  # Add this import
 from data_store import DataStore
 from rate_limiter import RateLimiter
 from messages import Messages
-from app import app
-import csv
-import tempfile
+import queries
+from notifier import Notifier, PRIORITY_HIGH
+import keyboards
+from diagnostics import monitor_stats
+
+# Batch CSV uploads are parsed in memory
+MAX_BATCH_UPLOAD_BYTES = 1024 * 1024
 
 class CommandHandler:
 
@@ -19,6 +26,7 @@ class CommandHandler:
         self.data_store = DataStore()
         self.rate_limiter = RateLimiter()
         self.engine = self.data_store.engine
+        self.notifier = Notifier(self.engine)
         logging.info("CommandHandler initialized")
 
     async def check_admin_status(self, user_id: int) -> bool:
@@ -28,13 +36,12 @@ class CommandHandler:
 
     async def initialize_credits(self, user_id: int, is_admin: bool) -> float:
         """Initialize or get user credits"""
-        with app.app_context():
-            credits = self.data_store.get_user_credits(user_id)
-            if credits is None:
-                initial_credits = 999999.0 if is_admin else 10.0
-                self.data_store.initialize_user_credits(user_id, initial_credits)
-                credits = initial_credits
-            self.data_store.track_user_command(user_id, 'start')
+        credits = self.data_store.get_user_credits(user_id)
+        if credits is None:
+            initial_credits = 999999.0 if is_admin else 10.0
+            self.data_store.initialize_user_credits(user_id, initial_credits)
+            credits = initial_credits
+        self.data_store.track_user_command(user_id, 'start')
         return credits
 
     async def check_community_membership(self, context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
@@ -46,7 +53,7 @@ class CommandHandler:
             # Verify group exists
             try:
                 chat = await context.bot.get_chat(chat_id=group_id)
-                logging.info(f"Checking membership for group: {chat.title}")
+                logging.debug("Checking membership for group: %s", chat.title)
             except Exception as e:
                 logging.error(f"Group not found: {e}")
                 return False
@@ -94,36 +101,12 @@ class CommandHandler:
         """Handle /credits command"""
         try:
             user_id = update.effective_user.id
-            with app.app_context():
-                credits = self.data_store.get_user_credits(user_id)
-                self.data_store.track_user_command(user_id, 'credits')
-
-            keyboard = [
-                [
-                    InlineKeyboardButton("🎁 Klaim 20 Kredit Gratis",
-                                         callback_data="redeem_free_credits")
-                ],
-                [
-                    InlineKeyboardButton("🛒 Beli 75 Kredit - Rp 150.000",
-                                         callback_data="order_75")
-                ],
-                [
-                    InlineKeyboardButton("🛒 Beli 150 Kredit - Rp 300.000",
-                                         callback_data="order_150")
-                ],
-                [
-                    InlineKeyboardButton("🛒 Beli 250 Kredit - Rp 399.000",
-                                         callback_data="order_250")
-                ],
-                [
-                    InlineKeyboardButton("🔙 Kembali",
-                                         callback_data="back_to_main")
-                ]
-            ]
+            credits = self.data_store.get_user_credits(user_id)
+            self.data_store.track_user_command(user_id, 'credits')
 
             await update.message.reply_text(
                 f"{Messages.CREDITS_REMAINING.format(credits)}\n\n{Messages.BUY_CREDITS_INFO}",
-                reply_markup=InlineKeyboardMarkup(keyboard))
+                reply_markup=keyboards.CREDITS_MENU)
         except Exception as e:
             logging.error(f"Error in credits command: {str(e)}")
             await update.message.reply_text(
@@ -136,35 +119,23 @@ class CommandHandler:
             message = reply_to or update.message
             
             with self.engine.connect() as conn:
-                saved_contacts = conn.execute(text("""
-                    SELECT 
-                        sc.id,
-                        sc.importer_name as name,
-                        sc.phone as contact,
-                        sc.email,
-                        sc.website,
-                        sc.hs_code as product,
-                        sc.product_description as role,
-                        sc.country,
-                        sc.wa_availability as wa_available,
-                        sc.saved_at
-                    FROM saved_contacts sc
-                    WHERE sc.user_id = :user_id 
-                    ORDER BY sc.saved_at DESC
-                """), {"user_id": user_id}).fetchall()
-                
-                saved_contacts = [{
-                    'id': row.id,
-                    'name': row.name,
-                    'contact': row.contact,
-                    'email': row.email,
-                    'website': row.website,
-                    'product': row.product,
-                    'role': row.role or 'Importer',  # Default role
-                    'country': row.country,
-                    'wa_available': row.wa_available,
-                    'saved_at': row.saved_at
-                } for row in saved_contacts]
+                rows = queries.GET_SAVED_CONTACTS.execute(
+                    conn, {"user_id": user_id}).fetchall()
+
+            saved_contacts = [{
+                'id': row.importer_id,
+                'name': row.importer_name,
+                'contact': row.phone,
+                'email': row.email,
+                'website': row.website,
+                'product': row.product,
+                'origin': row.origin,
+                'hs_code': row.hs_code,
+                'role': row.product_description or 'Importer',  # Default role
+                'country': row.country,
+                'wa_available': row.wa_available,
+                'saved_at': row.saved_at
+            } for row in rows]
 
             if not saved_contacts:
                 await message.reply_text("❌ Anda belum memiliki kontak tersimpan.")
@@ -185,42 +156,16 @@ class CommandHandler:
             # Display contacts
             for contact in current_contacts:
                 message_text, whatsapp_number, _ = Messages.format_importer(contact, saved=True)
-                buttons = []
-                
-                if contact['wa_available']:
-                    buttons.append([
-                        InlineKeyboardButton("💬 Chat WhatsApp", url=f"https://wa.me/{whatsapp_number}")
-                    ])
-                    
                 sent_msg = await message.reply_text(
                     message_text,
                     parse_mode='Markdown',
-                    reply_markup=InlineKeyboardMarkup(buttons) if buttons else None
+                    reply_markup=keyboards.whatsapp(whatsapp_number) if contact['wa_available'] else None
                 )
                 message_ids.append(sent_msg.message_id)
 
-            # Navigation buttons
-            # Fix navigation buttons construction
-            keyboard = []
-            navigation_row = []
-            bottom_buttons = []
-            # Navigation buttons
-            if total_pages > 1:
-                navigation_row.append(InlineKeyboardButton(f"1/{total_pages}", callback_data="page_info")),
-                navigation_row.append(InlineKeyboardButton("Next ➡️", callback_data="show_saved_next"))
-
-            # Bottom buttons
-            bottom_buttons.extend([
-                [InlineKeyboardButton("📥 Export to CSV", callback_data="export_saved_contacts")],
-                [InlineKeyboardButton("🔙 Kembali", callback_data="back_to_main")]
-            ])
-            
-            # Combine all buttons
-            keyboard = [navigation_row] + bottom_buttons
-
             nav_msg = await message.reply_text(
                 f"Halaman 1 dari {total_pages}",
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                reply_markup=keyboards.saved_pages(0, total_pages)
             )
             message_ids.append(nav_msg.message_id)
 
@@ -237,68 +182,22 @@ class CommandHandler:
         """Generate main menu keyboard markup based on user status"""
         try:
             # Get user credits
-            with app.app_context():
-                credits = self.data_store.get_user_credits(user_id)
-            
-            # Check member status
-            group_id = -1002349486618
-            try:
-                member = await context.bot.get_chat_member(
-                    chat_id=group_id,
-                    user_id=user_id
-                )
-                is_member = member.status not in ['left', 'kicked']
-            except Exception:
-                is_member = False
+            credits = self.data_store.get_user_credits(user_id)
             
-            if is_member:
-                community_button = [
-                    InlineKeyboardButton(
-                        "🔓 Buka Kancil Global Network",
-                        url="https://t.me/+kuNU6lDtYoNlMTc1"
-                    )
-                ]
-            else:
-                community_button = [
-                    InlineKeyboardButton(
-                        "🌟 Gabung Kancil Global Network",
-                        callback_data="join_community"
-                    )
-                ]
-
-            keyboard = [[
-                InlineKeyboardButton("📤 Kontak Supplier", callback_data="show_suppliers"),
-                InlineKeyboardButton("📥 Kontak Buyer", callback_data="show_buyers")
-            ],
-                    [
-                        InlineKeyboardButton("📁 Kontak Tersimpan", callback_data="saved")
-                    ],
-                    [
-                        InlineKeyboardButton("💳 Kredit Saya", callback_data="show_credits")
-                    ], community_button,
-                    [
-                        InlineKeyboardButton("❓ Bantuan", callback_data="show_help")
-                    ],
-                    [
-                        InlineKeyboardButton("👨‍💼 Hubungi Admin", url="https://t.me/afrizaladinur")
-                    ]]
-
             message_text = f"{Messages.START}\n{Messages.CREDITS_REMAINING.format(credits)}"
-            return message_text, InlineKeyboardMarkup(keyboard)
+            return message_text, keyboards.main_menu(is_member)
             
         except Exception as e:
             logging.error(f"Error generating main menu: {str(e)}")
             # Return basic menu on error
-            return Messages.START, InlineKeyboardMarkup([[
-                InlineKeyboardButton("🔄 Refresh", callback_data="start")
-            ]])
+            return Messages.START, keyboards.REFRESH_MENU
     async def button_callback(self, update: Update,
                               context: ContextTypes.DEFAULT_TYPE):
         """Handle button callbacks"""
         try:
             query = update.callback_query
             await query.answer()  # Acknowledge the button press
-            logging.info(f"Received callback query: {query.data}")
+            logging.info("Received callback query: %s", query.data)
 
             # Get user ID
             user_id = query.from_user.id
@@ -308,54 +207,15 @@ class CommandHandler:
                     'supplier_'):
                 try:
                     category_type, category = query.data.split('_', 1)
-                    categories = Messages.SUPPLIER_CATEGORIES if category_type == "supplier" else Messages.BUYER_CATEGORIES
-
-                    cat_data = {}
-                    # Handle nested categories
-                    for key, data in categories.items():
-                        if key.lower().replace(' ', '_') == category:
-                            cat_data = data
-                            break
-
-                    if not cat_data:
+                    node = self.data_store.catalog.category(category_type, category)
+                    if node is None:
                         await query.message.reply_text("Category not found")
                         return
 
-                    keyboard = []
-                    if 'subcategories' in cat_data:
-                        with self.engine.connect() as conn:
-                            for sub_name, sub_data in cat_data[
-                                    'subcategories'].items():
-                                search_term = sub_data['search']
-                                count = conn.execute(
-                                    text("""
-                                    SELECT COUNT(*) FROM importers 
-                                    WHERE Role = :role 
-                                    AND LOWER(Product) LIKE LOWER(:search)
-                                    AND Phone IS NOT NULL 
-                                    AND Phone != ''
-                                    """), {
-                                        "role": "Exporter" if category_type == "supplier" else "Importer",
-                                        "search": f"%{search_term}%"
-                                    }).scalar()
-
-                                keyboard.append([
-                                    InlineKeyboardButton(
-                                        f"{sub_data['emoji']} {sub_name} ({count} kontak)",
-                                        callback_data=
-                                        f"search_{search_term.replace(' ', '_')}"
-                                    )
-                                ])
-
-                    keyboard.append([
-                        InlineKeyboardButton("🔙 Kembali",
-                                             callback_data="back_to_main")
-                    ])
-
                     await query.message.edit_text(
-                        f"📂 *{category.replace('_', ' ').title()}*\n\nPilih produk:",
+                        node.text,
                         parse_mode='Markdown',
-                        reply_markup=InlineKeyboardMarkup(keyboard))
+                        reply_markup=node.markup)
 
                 except Exception as e:
                     logging.error(f"Error in category navigation: {str(e)}",
@@ -379,14 +239,7 @@ class CommandHandler:
                     order_id = query.data.replace('delete_order_', '')
                     
                     # Delete from database
-                    with self.engine.begin() as conn:
-                        conn.execute(
-                            text("""
-                            DELETE FROM credit_orders 
-                            WHERE order_id = :order_id
-                            """), {
-                                "order_id": order_id
-                            })
+                    self.data_store.delete_credit_order(order_id)
 
                     # Show confirmation message
                     await query.answer("Order deleted successfully!")
@@ -399,86 +252,25 @@ class CommandHandler:
                     await query.message.reply_text(
                         "Failed to delete order. Please try again."
                     )
-            elif query.data == "orders_prev" or query.data == "orders_next":
+            elif query.data.startswith(('orders_prev', 'orders_next')):
                 try:
-                    page = context.user_data.get('order_page', 0)
-                    pending_orders = context.user_data.get('pending_orders', [])
-
-                    if not pending_orders:
-                        await query.message.reply_text("No pending orders found.")
+                    if not await self.check_admin_status(user_id):
+                        await query.message.reply_text("⛔️ Unauthorized")
                         return
 
-                    # Update page and handle edge cases
-                    total_pages = len(pending_orders)
-                    if total_pages == 0:
+                    direction, cursor_id = keyboards.parse_order_page(query.data)
+                    current_order = self.data_store.get_pending_order(cursor_id, direction)
+
+                    if current_order is None:
                         await query.message.edit_text("No more pending orders.")
                         return
-                        
-                    if page >= total_pages:
-                        page = total_pages - 1
-                        
-                    if query.data == "orders_prev":
-                        page = max(0, page - 1)
-                    else:
-                        page = min(total_pages - 1, page + 1)
-
-                    context.user_data['order_page'] = page
-                    current_order = pending_orders[page]
-
-                    # Format message with basic info
-                    message_text = (
-                        f"📦 Pending Order {page + 1}/{total_pages}\n\n"
-                        f"🔖 Order ID: `{current_order['order_id']}`\n"
-                        f"👤 User ID: `{current_order['user_id']}`\n"
-                    )
-
-                    # Single chat lookup with proper error handling
-                    try:
-                        user = await context.bot.get_chat(current_order['user_id'])
-                        name_parts = []
-                        if user.username:
-                            name_parts.append(f"@{user.username}")
-                        if user.first_name:
-                            name_parts.append(user.first_name)
-                        if user.last_name:
-                            name_parts.append(user.last_name)
-                        username = " | ".join(name_parts) if name_parts else f"User_{current_order['user_id']}"
-                        chat_link = f"tg://user?id={current_order['user_id']}"
-                        message_text += f"Username: [{username}]({chat_link})\n"
-                    except Exception as e:
-                        logging.warning(f"Could not fetch chat for user {current_order['user_id']}: {e}")
-                        message_text += f"Username: User ID: {current_order['user_id']}\n"
-
-                    # Add remaining order details
-                    message_text += (
-                        f"💳 Credits: {current_order['credits']}\n"
-                        f"💰 Amount: Rp {current_order['amount']:,}\n"
-                        f"⏱️ Waiting since: {current_order['created_at'].strftime('%Y-%m-%d %H:%M:%S')}"
-                    )
-
-                    # Build keyboard
-                    keyboard = []
-                    nav_row = []
-                    if page > 0:
-                        nav_row.append(InlineKeyboardButton("⬅️ Prev", callback_data="orders_prev"))
-                    if page < total_pages - 1:
-                        nav_row.append(InlineKeyboardButton("Next ➡️", callback_data="orders_next"))
-                    if nav_row:
-                        keyboard.append(nav_row)
-
-                    keyboard.append([
-                        InlineKeyboardButton("✅ Fulfill Order", 
-                            callback_data=f"give_{current_order['user_id']}_{current_order['credits']}"),
-                        InlineKeyboardButton("❌ Delete Order",
-                            callback_data=f"delete_order_{current_order['order_id']}")
-                    ])
 
+                    message_text, keyboard_markup = self._pending_order_view(current_order)
                     await query.message.edit_text(
                         message_text,
-                        reply_markup=InlineKeyboardMarkup(keyboard),
+                        reply_markup=keyboard_markup,
                         parse_mode='Markdown'
                     )
-                    await query.answer()
 
                 except Exception as e:
                     logging.error(f"Error in orders pagination: {str(e)}")
@@ -527,52 +319,15 @@ class CommandHandler:
                     # Display new results
                     for result in current_results:
                         message_text, _, _ = Messages.format_importer(result)
-                        save_button = [[
-                            InlineKeyboardButton(
-                                "💾 Simpan Kontak",
-                                callback_data=
-                                f"save_{result['id']}" 
-                            )
-                        ]]
-
                         sent_msg = await query.message.reply_text(
                             message_text,
                             parse_mode='Markdown',
-                            reply_markup=InlineKeyboardMarkup(save_button))
+                            reply_markup=keyboards.save_contact(result['id']))
                         new_message_ids.append(sent_msg.message_id)
 
-                    # Add pagination buttons in a single row
-                    navigation_row = []
-                    if current_page > 0:
-                        navigation_row.append(
-                            InlineKeyboardButton("⬅️ Prev",
-                                                 callback_data="prev_page"))
-                    navigation_row.append(
-                        InlineKeyboardButton(
-                            f"{current_page + 1}/{total_pages}",
-                            callback_data="page_info"))
-                    if current_page < total_pages - 1:
-                        navigation_row.append(
-                            InlineKeyboardButton("Next ➡️",
-                                                 callback_data="next_page"))
-
-                    bottom_buttons = [
-                        [
-                            InlineKeyboardButton(
-                                "🔄 Cari Kembali",
-                                callback_data="regenerate_search")
-                        ],
-                        [
-                            InlineKeyboardButton(
-                                "🔙 Kembali",
-                                callback_data="back_to_categories")
-                        ]
-                    ]
-
                     nav_msg = await query.message.reply_text(
                         f"Halaman {current_page + 1} dari {total_pages}",
-                        reply_markup=InlineKeyboardMarkup([navigation_row] +
-                                                          bottom_buttons))
+                        reply_markup=keyboards.search_pages(current_page, total_pages))
                     new_message_ids.append(nav_msg.message_id)
 
                     # Store new message IDs
@@ -613,11 +368,14 @@ class CommandHandler:
                             logging.error(
                                 f"Error deleting message {msg_id}: {str(e)}")
 
-                    # Re-execute the search with the same parameters
+                    # Reshuffle from the same candidate pool, preferring
+                    # contacts the previous results did not show
                     search_pattern = last_search.get('pattern')
                     if search_pattern:
+                        shown = {result['id'] for result in
+                                 context.user_data.get('search_results', [])}
                         await self.show_results(update, context,
-                                                search_pattern)
+                                                search_pattern, avoid=shown)
                     else:
                         await query.message.reply_text(
                             "Tidak dapat mengulang pencarian sebelumnya.")
@@ -633,29 +391,28 @@ class CommandHandler:
             elif query.data == "back_to_main":
                 try:
                     user_id = query.from_user.id
-                    with app.app_context():
-                        credits = self.data_store.get_user_credits(user_id)
-                        is_member = await self.check_community_membership(context, user_id)
-                        message_text, reply_markup = await self.get_main_menu_markup(
-                            user_id=user_id,
-                            credits=credits,
-                            is_member=is_member
-                        )
+                    credits = self.data_store.get_user_credits(user_id)
+                    is_member = await self.check_community_membership(context, user_id)
+                    message_text, reply_markup = await self.get_main_menu_markup(
+                        user_id=user_id,
+                        credits=credits,
+                        is_member=is_member
+                    )
                         
-                        try:
-                            await query.message.edit_text(
-                                text=message_text,
-                                parse_mode='Markdown',
-                                reply_markup=reply_markup
-                            )
-                        except telegram.error.BadRequest as e:
-                            if "message is not modified" in str(e).lower():
-                                # Just answer the callback if content hasn't changed
-                                await query.answer()
-                                return
-                            raise  # Re-raise other BadRequest errors
+                    try:
+                        await query.message.edit_text(
+                            text=message_text,
+                            parse_mode='Markdown',
+                            reply_markup=reply_markup
+                        )
+                    except telegram.error.BadRequest as e:
+                        if "message is not modified" in str(e).lower():
+                            # Just answer the callback if content hasn't changed
+                            await query.answer()
+                            return
+                        raise  # Re-raise other BadRequest errors
                             
-                        await query.answer()
+                    await query.answer()
                         
                 except Exception as e:
                     logging.error(f"Error returning to main menu: {str(e)}")
@@ -666,39 +423,24 @@ class CommandHandler:
 
             elif query.data.startswith('order_'):
                 try:
-                    # Define valid credit packages
-                    credit_prices = {
-                        '75': 150000,
-                        '150': 300000,
-                        '250': 399000
-                    }
-                    
                     # Parse credit amount
                     _, credits = query.data.split('_')
-                    
+
                     # Validate credit amount
-                    if credits not in credit_prices:
+                    if not credits.isdigit() or int(credits) not in keyboards.CREDIT_PACKAGES:
                         await query.message.reply_text(
                             "Paket kredit tidak valid. Silakan pilih paket yang tersedia."
                         )
                         return
                         
-                    amount = credit_prices[credits]
+                    amount = keyboards.CREDIT_PACKAGES[int(credits)]
                     user_id = query.from_user.id
                     username = query.from_user.username or str(user_id)
                     order_id = f"BOT_{user_id}_{int(time.time())}"
 
                     # Insert order
-                    with self.engine.begin() as conn:
-                        conn.execute(text("""
-                            INSERT INTO credit_orders (order_id, user_id, credits, amount, status)
-                            VALUES (:order_id, :user_id, :credits, :amount, 'pending')
-                        """), {
-                            "order_id": order_id,
-                            "user_id": user_id,
-                            "credits": int(credits),
-                            "amount": int(amount)
-                        })
+                    self.data_store.create_credit_order(
+                        order_id, user_id, int(credits), int(amount))
             
                     # Payment instructions
                     payment_message = (
@@ -722,21 +464,10 @@ class CommandHandler:
                         f"5. Kredit akan ditambahkan setelah verifikasi"
                     )
             
-                    keyboard = [
-                        [InlineKeyboardButton(
-                            "📎 Kirim Bukti Transfer",
-                            url="https://t.me/afrizaladinur"
-                        )],
-                        [InlineKeyboardButton(
-                            "🔙 Kembali",
-                            callback_data="back_to_main"
-                        )]
-                    ]
-            
                     await query.message.reply_text(
                         payment_message,
                         parse_mode='Markdown',
-                        reply_markup=InlineKeyboardMarkup(keyboard)
+                        reply_markup=keyboards.PAYMENT_MENU
                     )
             
                     # Notify admin
@@ -752,19 +483,20 @@ class CommandHandler:
             
                     admin_keyboard = [[InlineKeyboardButton(
                         f"✅ Verifikasi & Berikan {credits} Kredit",
-                        callback_data=f"give_{user_id}_{credits}"
+                        callback_data=f"fulfill_{order_id}"
                     )]]
             
                     admin_ids = [6422072438]
                     for admin_id in admin_ids:
-                        await context.bot.send_message(
-                            chat_id=admin_id,
-                            text=admin_message,
+                        self.notifier.send(
+                            admin_id,
+                            admin_message,
+                            priority=PRIORITY_HIGH,
                             parse_mode='Markdown',
                             reply_markup=InlineKeyboardMarkup(admin_keyboard)
                         )
             
-                    logging.info(f"Payment order created: {order_id}")
+                    logging.info("Payment order created: %s", order_id)
             
                 except Exception as e:
                     logging.error(f"Error processing payment: {str(e)}", exc_info=True)
@@ -816,47 +548,16 @@ class CommandHandler:
                 for contact in current_contacts:
                     message_text, whatsapp_number, _ = Messages.format_importer(
                         contact, saved=True)
-                    keyboard = []
-                    if whatsapp_number:
-                        keyboard.append([
-                            InlineKeyboardButton(
-                                "💬 Chat di WhatsApp",
-                                url=f"https://wa.me/{whatsapp_number}")
-                        ])
                     sent_msg = await query.message.reply_text(
                         message_text,
                         parse_mode='Markdown',
-                        reply_markup=InlineKeyboardMarkup(keyboard)
-                        if keyboard else None)
+                        reply_markup=keyboards.whatsapp(whatsapp_number)
+                        if whatsapp_number else None)
                     new_messages.append(sent_msg.message_id)
 
-                # Add pagination buttons
-                pagination_buttons = []
-                if current_page > 0:
-                    pagination_buttons.append(
-                        InlineKeyboardButton("⬅️ Prev",
-                                             callback_data="show_saved_prev"))
-                pagination_buttons.append(
-                    InlineKeyboardButton(f"{current_page + 1}/{total_pages}",
-                                         callback_data="show_saved_page_info"))
-                if current_page < total_pages - 1:
-                    pagination_buttons.append(
-                        InlineKeyboardButton("Next ➡️",
-                                             callback_data="show_saved_next"))
-
-                export_buttons = [[
-                    InlineKeyboardButton("📥 Simpan ke CSV",
-                                         callback_data="export_saved_contacts")
-                ],
-                                  [
-                                      InlineKeyboardButton(
-                                          "🔙 Kembali",
-                                          callback_data="back_to_main")
-                                  ]]
                 await query.message.reply_text(
                     f"Halaman {current_page + 1} dari {total_pages}",
-                    reply_markup=InlineKeyboardMarkup([pagination_buttons] +
-                                                      export_buttons))
+                    reply_markup=keyboards.saved_pages(current_page, total_pages))
             elif query.data == "show_saved_page_info":
                 await query.answer("Halaman saat ini", show_alert=False)
 
@@ -873,45 +574,12 @@ class CommandHandler:
                         'category_type',
                         'buyer')  # Default to buyer if not found
 
-                    if category_type == 'supplier':
-                        # Go back to supplier categories
-                        keyboard = []
-                        for cat, data in Messages.SUPPLIER_CATEGORIES.items():
-                            keyboard.append([
-                                InlineKeyboardButton(
-                                    f"{data['emoji']} {cat}",
-                                    callback_data=
-                                    f"supplier_{cat.lower().replace(' ', '_')}"
-                                )
-                            ])
-                        keyboard.append([
-                            InlineKeyboardButton("🔙 Kembali",
-                                                 callback_data="back_to_main")
-                        ])
-
-                        await query.message.edit_text(
-                            "📤 *Kontak Supplier Indonesia*\n\nPilih kategori produk:",
-                            parse_mode='Markdown',
-                            reply_markup=InlineKeyboardMarkup(keyboard))
-                    else:
-                        # Go back to buyer categories
-                        keyboard = []
-                        for cat, data in Messages.BUYER_CATEGORIES.items():
-                            keyboard.append([
-                                InlineKeyboardButton(
-                                    f"{data['emoji']} {cat}",
-                                    callback_data=
-                                    f"buyer_{cat.lower().replace(' ', '_')}")
-                            ])
-                        keyboard.append([
-                            InlineKeyboardButton("🔙 Kembali",
-                                                 callback_data="back_to_main")
-                        ])
-
-                        await query.message.edit_text(
-                            "📥 *Kontak Buyer*\n\nPilih kategori buyer:",
-                            parse_mode='Markdown',
-                            reply_markup=InlineKeyboardMarkup(keyboard))
+                    node = self.data_store.catalog.side(
+                        'supplier' if category_type == 'supplier' else 'buyer')
+                    await query.message.edit_text(
+                        node.text,
+                        parse_mode='Markdown',
+                        reply_markup=node.markup)
                 except Exception as e:
                     logging.error(f"Error returning to categories: {str(e)}")
                     await query.message.reply_text(
@@ -923,44 +591,12 @@ class CommandHandler:
             elif query.data == "redeem_free_credits":
                 user_id = query.from_user.id
                 try:
-                    with self.engine.begin() as conn:
-                        # Check if already redeemed with row lock
-                        result = conn.execute(
-                            text("""
-                            SELECT has_redeemed_free_credits, credits 
-                            FROM user_credits 
-                            WHERE user_id = :user_id
-                            FOR UPDATE
-                        """), {
-                                "user_id": user_id
-                            }).first()
-
-                        if not result:
-                            # Initialize user if not exists
-                            conn.execute(
-                                text("""
-                                INSERT INTO user_credits (user_id, credits, has_redeemed_free_credits)
-                                VALUES (:user_id, 20, true)
-                            """), {"user_id": user_id})
-                            new_balance = 20.0
-                        else:
-                            has_redeemed, current_credits = result
-
-                            if has_redeemed:
-                                await query.message.reply_text(
-                                    "Anda sudah pernah mengklaim kredit gratis!"
-                                )
-                                return
-
-                            # Add credits and mark as redeemed
-                            conn.execute(
-                                text("""
-                                UPDATE user_credits 
-                                SET credits = credits + 10,
-                                    has_redeemed_free_credits = true
-                                WHERE user_id = :user_id
-                            """), {"user_id": user_id})
-                            new_balance = current_credits + 10.0
+                    redeemed, new_balance = self.data_store.redeem_free_credits(user_id)
+                    if not redeemed:
+                        await query.message.reply_text(
+                            "Anda sudah pernah mengklaim kredit gratis!"
+                        )
+                        return
 
                     await query.message.reply_text(
                         f"🎉 Selamat! 10 kredit gratis telah ditambahkan ke akun Anda!\n"
@@ -973,152 +609,56 @@ class CommandHandler:
             elif query.data == "show_help":
                 try:
                     user_id = query.from_user.id
-                    with app.app_context():
-                        self.data_store.track_user_command(user_id, 'help')
-                    keyboard = [[
-                        InlineKeyboardButton("🔙 Kembali",
-                                             callback_data="back_to_main")
-                    ]]
+                    self.data_store.track_user_command(user_id, 'help')
                     await query.message.edit_text(
                         Messages.HELP,
                         parse_mode='Markdown',
-                        reply_markup=InlineKeyboardMarkup(keyboard))
+                        reply_markup=keyboards.BACK_TO_MAIN)
                 except Exception as e:
                     logging.error(f"Errorshowing help: {str(e)}")
                     await query.message.reply_text(Messages.ERROR_MESSAGE)
             elif query.data == "show_credits":
                 try:
                     user_id = query.from_user.id
-                    with app.app_context():
-                        self.data_store.track_user_command(user_id, 'credits')
-                        credits = self.data_store.get_user_credits(
-                            user_id)  # Fixed typo here
-
-                    keyboard = [[
-                        InlineKeyboardButton(
-                            "🎁 Klaim 20 KreditGratis",
-                            callback_data="redeem_free_credits")
-                    ],
-                               [
-                                   InlineKeyboardButton(
-                                       "🛒 Beli 75 Kredit - Rp 150.000",
-                                       callback_data="order_75")
-                               ],
-                               [
-                                   InlineKeyboardButton(
-                                       "🛒 Beli 150 Kredit - Rp 300.000",
-                                       callback_data="order_150")
-                               ],
-                               [
-                                   InlineKeyboardButton(
-                                       "🛒 Beli 250 Kredit - Rp 399.000",
-                                       callback_data="order_250")
-                               ],
-                               [
-                                   InlineKeyboardButton(
-                                       "🔙 Kembali",
-                                       callback_data="back_to_main")
-                               ]]
+                    self.data_store.track_user_command(user_id, 'credits')
+                    credits = self.data_store.get_user_credits(
+                        user_id)  # Fixed typo here
 
                     await query.message.edit_text(
                         f"{Messages.CREDITS_REMAINING.format(credits)}\n\n{Messages.BUY_CREDITS_INFO}",
-                        reply_markup=InlineKeyboardMarkup(keyboard))
+                        reply_markup=keyboards.CREDITS_MENU)
                 except Exception as e:
                     logging.error(f"Error showing credits: {str(e)}")
                     await query.message.reply_text(
                         "Maaf, terjadi kesalahan. Silakan coba lagi.")
 
             elif query.data == "show_suppliers":
-                keyboard = []
-                for cat, data in Messages.SUPPLIER_CATEGORIES.items():
-                    keyboard.append([
-                        InlineKeyboardButton(
-                            f"{data['emoji']} {cat}",
-                            callback_data=
-                            f"supplier_{cat.lower().replace(' ', '_')}")
-                    ])
-                keyboard.append([
-                    InlineKeyboardButton("🔙 Kembali",
-                                         callback_data="back_to_main")
-                ])
-
+                node = self.data_store.catalog.side('supplier')
                 await query.message.edit_text(
-                    "📤 *Kontak Supplier Indonesia*\n\nPilih kategori produk:",
+                    node.text,
                     parse_mode='Markdown',
-                    reply_markup=InlineKeyboardMarkup(keyboard))
+                    reply_markup=node.markup)
 
             elif query.data == "show_buyers":
-                # Build keyboard for buyers categories
-                keyboard = []
-                for cat, data in Messages.BUYER_CATEGORIES.items():
-                    keyboard.append([
-                        InlineKeyboardButton(
-                            f"{data['emoji']} {cat}",
-                            callback_data=
-                            f"buyer_{cat.lower().replace(' ', '_')}")
-                    ])
-                keyboard.append([
-                    InlineKeyboardButton("🔙 Kembali",
-                                         callback_data="back_to_main")
-                ])
-
+                node = self.data_store.catalog.side('buyer')
                 await query.message.edit_text(
-                    "📥 *Kontak Buyer*\n\nPilih kategori buyer:",
+                    node.text,
                     parse_mode='Markdown',
-                    reply_markup=InlineKeyboardMarkup(keyboard))
+                    reply_markup=node.markup)
 
             elif query.data.startswith("supplier_") or query.data.startswith(
                     "buyer_"):
                 try:
                     category_type, category = query.data.split('_', 1)
-                    categories = Messages.SUPPLIER_CATEGORIES if category_type == "supplier" else Messages.BUYER_CATEGORIES
-
-                    cat_data = {}
-                    # Handle nested categories
-                    for key, data in categories.items():
-                        if key.lower().replace(' ', '_') == category:
-                            cat_data = data
-                            break
-
-                    if not cat_data:
+                    node = self.data_store.catalog.category(category_type, category)
+                    if node is None:
                         await query.message.reply_text("Category not found")
                         return
 
-                    keyboard = []
-                    if 'subcategories' in cat_data:
-                        with self.engine.connect() as conn:
-                            for sub_name, sub_data in cat_data[
-                                    'subcategories'].items():
-                                search_term = sub_data['search']
-                                count = conn.execute(
-                                    text("""
-                                    SELECT COUNT(*) FROM importers 
-                                    WHERE Role = :role 
-                                    AND LOWER(Product) LIKE LOWER(:search)
-                                    AND Phone IS NOT NULL 
-                                    AND Phone != ''
-                                    """), {
-                                        "role": "Exporter" if category_type == "supplier" else "Importer",
-                                        "search": f"%{search_term}%"
-                                    }).scalar()
-
-                                keyboard.append([
-                                    InlineKeyboardButton(
-                                        f"{sub_data['emoji']} {sub_name} ({count} kontak)",
-                                        callback_data=
-                                        f"search_{search_term.replace(' ', '_')}"
-                                    )
-                                ])
-
-                    keyboard.append([
-                        InlineKeyboardButton("🔙 Kembali",
-                                             callback_data="back_to_main")
-                    ])
-
                     await query.message.edit_text(
-                        f"📂 *{category.replace('_', ' ').title()}*\n\nPilih produk:",
+                        node.text,
                         parse_mode='Markdown',
-                        reply_markup=InlineKeyboardMarkup(keyboard))
+                        reply_markup=node.markup)
 
                 except Exception as e:
                     logging.error(f"Error in category navigation: {str(e)}",
@@ -1131,7 +671,7 @@ class CommandHandler:
                 try:
                     search_pattern = query.data.replace('search_',
                                                         '').replace('_', ' ')
-                    logging.info(f"Searching for pattern: {search_pattern}")
+                    logging.debug("Searching for pattern: %s", search_pattern)
 
                     # Clean up any existing messages first
                     message_ids = context.user_data.get(
@@ -1193,48 +733,15 @@ class CommandHandler:
                         for result in current_results:
                             message_text, _, _ = Messages.format_importer(
                                 result)
-                            save_button = [[
-                                InlineKeyboardButton(
-                                    "💾 Simpan Kontak",
-                                    callback_data=
-                                    f"save_{result['id']}"  # Use name instead of id
-                                )
-                            ]]
-
                             sent_msg = await reply_to.reply_text(
                                 message_text,
                                 parse_mode='Markdown',
-                                reply_markup=InlineKeyboardMarkup(save_button))
+                                reply_markup=keyboards.save_contact(result['id']))
                             message_ids.append(sent_msg.message_id)
 
-                        # Add pagination buttons in a single row
-                        navigation_row = []
-                        if total_pages > 1:
-                            navigation_row.append(
-                                InlineKeyboardButton(
-                                    "Next ➡️", callback_data="next_page"))
-                        navigation_row.append(
-                            InlineKeyboardButton(f"1/{total_pages}",
-                                                 callback_data="page_info"))
-
-                        # Add bottom navigation buttons
-                        bottom_buttons = [
-                            [
-                                InlineKeyboardButton(
-                                    "🔄 Cari Kembali",
-                                    callback_data="regenerate_search")
-                            ],
-                            [
-                                InlineKeyboardButton(
-                                    "🔙 Kembali",
-                                    callback_data="back_to_categories")
-                            ]
-                        ]
-
                         nav_msg = await reply_to.reply_text(
                             f"Halaman 1 dari {total_pages}",
-                            reply_markup=InlineKeyboardMarkup(
-                                [navigation_row] + bottom_buttons))
+                            reply_markup=keyboards.search_pages(0, total_pages))
                         message_ids.append(nav_msg.message_id)
 
                         # Store message IDs in context
@@ -1247,34 +754,42 @@ class CommandHandler:
                         "Maaf, terjadi kesalahan saat menampilkan hasil. Silakan coba lagi."
                     )
 
-            elif query.data.startswith('give_'):
+            elif query.data.startswith(('fulfill_', 'give_')):
                 try:
-                    _, target_user_id, credit_amount = query.data.split('_')
-                    if not self.data_store.get_user_credits(
-                            int(target_user_id)):
-                        await query.message.reply_text("User tidak ditemukan.")
+                    if not await self.check_admin_status(user_id):
+                        await query.message.reply_text("⛔️ Unauthorized")
                         return
 
-                    if self.data_store.add_credits(int(target_user_id),
-                                                   int(credit_amount)):
-                        new_balance = self.data_store.get_user_credits(
-                            int(target_user_id))
-                        await query.message.edit_text(
-                            f"{query.message.text}\n\n✅ Kredit telah ditambahkan!\nSaldo baru: {new_balance}",
-                            parse_mode='Markdown')
-                        # Notify user
-                        keyboard = [[
-                            InlineKeyboardButton("🔙 Kembali",
-                                                 callback_data="back_to_main")
-                        ]]
-                        await context.bot.send_message(
-                            chat_id=int(target_user_id),
-                            text=
-                            f"✅ {credit_amount} kredit telah ditambahkan ke akun Anda!\nSaldo saat ini: {new_balance} kredit",
-                            reply_markup=InlineKeyboardMarkup(keyboard))
+                    if query.data.startswith('fulfill_'):
+                        order_id = query.data.replace('fulfill_', '', 1)
                     else:
-                        await query.message.reply_text(
-                            "Gagal menambahkan kredit.")
+                        _, target_user_id, credit_amount = query.data.split('_')
+                        order_id = self.data_store.find_pending_order(
+                            int(target_user_id), int(credit_amount))
+                        if order_id is None:
+                            await query.message.reply_text(
+                                "Tidak ada pesanan tertunda untuk tombol ini.")
+                            return
+
+                    result, status = self.data_store.fulfill_order(order_id)
+                    if result is None:
+                        if status is None:
+                            await query.message.reply_text("Pesanan tidak ditemukan.")
+                        else:
+                            await query.message.reply_text(
+                                f"Pesanan `{order_id}` sudah berstatus {status}.",
+                                parse_mode='Markdown')
+                        return
+
+                    await query.message.edit_text(
+                        f"{query.message.text}\n\n✅ Kredit telah ditambahkan!\nSaldo baru: {result['balance']}",
+                        parse_mode='Markdown')
+                    # Notify user
+                    self.notifier.send(
+                        result['user_id'],
+                        f"✅ {result['added']} kredit telah ditambahkan ke akun Anda!\nSaldo saat ini: {result['balance']} kredit",
+                        priority=PRIORITY_HIGH,
+                        reply_markup=keyboards.BACK_TO_MAIN)
                 except Exception as e:
                     logging.error(f"Error giving credits: {str(e)}",
                                   exc_info=True)
@@ -1305,8 +820,7 @@ class CommandHandler:
                             return
                     
                     # Check credits
-                    with app.app_context():
-                        credits = self.data_store.get_user_credits(user_id)
+                    credits = self.data_store.get_user_credits(user_id)
             
                     if credits < 5:
                         await query.message.reply_text(
@@ -1317,17 +831,10 @@ class CommandHandler:
                         return
             
                     # Show join info
-                    keyboard = [[
-                        InlineKeyboardButton(
-                            "🚀 Gabung Sekarang", 
-                            callback_data="join_now"
-                        )
-                    ]]
-                    
                     sent_message = await query.message.reply_text(
                         Messages.COMMUNITY_INFO,
                         parse_mode='Markdown',
-                        reply_markup=InlineKeyboardMarkup(keyboard)
+                        reply_markup=keyboards.JOIN_COMMUNITY_MENU
                     )
                     context.user_data['join_message_id'] = sent_message.message_id
             
@@ -1339,8 +846,7 @@ class CommandHandler:
                     user_id = query.from_user.id
                     
                     # Check credits
-                    with app.app_context():
-                        credits = self.data_store.get_user_credits(user_id)
+                    credits = self.data_store.get_user_credits(user_id)
                         
                     if credits < 5:
                         await query.message.reply_text(
@@ -1351,29 +857,29 @@ class CommandHandler:
                         return
 
                     # Deduct credits and join
-                    with app.app_context():
-                        if self.data_store.use_credit(user_id, 5):
-                            group_id = -1002349486618
-                            try:
-                                invite_link = await context.bot.create_chat_invite_link(
-                                    chat_id=group_id,
-                                    member_limit=1
-                                )
-                                # Automatically open invite link
-                                await context.bot.send_message(
-                                    chat_id=user_id,
-                                    text=f"🔓 Anda telah bergabung dengan komunitas Kancil Global Network! Klik [di sini]({invite_link.invite_link}) untuk membuka grup.",
-                                    parse_mode='Markdown'
-                                )
-                            except Exception as e:
-                                logging.error(f"Error adding user to group: {str(e)}")
-                                await query.message.reply_text(
-                                    "Gagal menambahkan Anda ke grup. Silakan coba lagi."
-                                )
-                        else:
+                    if self.data_store.use_credit(user_id, 5):
+                        group_id = -1002349486618
+                        try:
+                            invite_link = await context.bot.create_chat_invite_link(
+                                chat_id=group_id,
+                                member_limit=1
+                            )
+                            # Automatically open invite link
+                            self.notifier.send(
+                                user_id,
+                                f"🔓 Anda telah bergabung dengan komunitas Kancil Global Network! Klik [di sini]({invite_link.invite_link}) untuk membuka grup.",
+                                priority=PRIORITY_HIGH,
+                                parse_mode='Markdown'
+                            )
+                        except Exception as e:
+                            logging.error(f"Error adding user to group: {str(e)}")
                             await query.message.reply_text(
-                                "Gagal menggunakan kredit. Silakan coba lagi."
+                                "Gagal menambahkan Anda ke grup. Silakan coba lagi."
                             )
+                    else:
+                        await query.message.reply_text(
+                            "Gagal menggunakan kredit. Silakan coba lagi."
+                        )
                 except Exception as e:
                     logging.error(f"Error in join community: {str(e)}")
                     await query.message.reply_text(
@@ -1381,7 +887,11 @@ class CommandHandler:
                     )
 
                 # Update main menu
-                message_text, keyboard = await self.get_main_menu_markup(user_id)
+                is_member = await self.check_community_membership(context, user_id)
+                message_text, keyboard = await self.get_main_menu_markup(
+                    user_id=user_id,
+                    is_member=is_member
+                )
                 await query.message.edit_text(
                     text=message_text,
                     parse_mode='Markdown',
@@ -1412,192 +922,268 @@ class CommandHandler:
             return False
             
         return False
+
+    async def capture_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Record the sender's profile before any handler runs"""
+        self.data_store.profiles.observe(update.effective_user)
+
+    def _order_user_line(self, user_id: int) -> str:
+        """Username line for order views, read from the local profile store"""
+        profile = self.data_store.profiles.get(user_id)
+        if profile is None:
+            return f"Username: User ID: {user_id}\n"
+        name_parts = []
+        if profile['username']:
+            name_parts.append(f"@{profile['username']}")
+        if profile['first_name']:
+            name_parts.append(profile['first_name'])
+        if profile['last_name']:
+            name_parts.append(profile['last_name'])
+        username = " | ".join(name_parts) if name_parts else f"User_{user_id}"
+        return f"Username: [{username}](tg://user?id={user_id})\n"
+
+    def _pending_order_view(self, order: Dict) -> tuple[str, InlineKeyboardMarkup]:
+        """Message text and buttons for one order of the pending queue"""
+        message_text = (
+            f"📦 Pending Order ({self.data_store.pending_order_count()} pending)\n\n"
+            f"🔖 Order ID: `{order['order_id']}`\n"
+            f"👤 User ID: `{order['user_id']}`\n"
+        )
+        message_text += self._order_user_line(order['user_id'])
+        message_text += (
+            f"💳 Credits: {order['credits']}\n"
+            f"💰 Amount: Rp {order['amount']:,}\n"
+            f"⏱️ Waiting since: {order['created_at'].strftime('%Y-%m-%d %H:%M:%S')}"
+        )
+
+        keyboard = []
+        nav_row = []
+        if order['has_newer']:
+            nav_row.append(InlineKeyboardButton("⬅️ Prev", callback_data=keyboards.order_page_callback('prev', order['id'])))
+        if order['has_older']:
+            nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=keyboards.order_page_callback('next', order['id'])))
+        if nav_row:
+            keyboard.append(nav_row)
+
+        keyboard.append([
+            InlineKeyboardButton("✅ Fulfill Order",
+                callback_data=f"fulfill_{order['order_id']}"),
+            InlineKeyboardButton("❌ Delete Order",
+                callback_data=f"delete_order_{order['order_id']}")
+        ])
+        keyboard.append([
+            InlineKeyboardButton("📥 Export to CSV", callback_data="export_orders")
+        ])
+        return message_text, InlineKeyboardMarkup(keyboard)
+
     async def orders(self, update: Update, context: ContextTypes.DEFAULT_TYPE, reply_to=None):
         """Show pending orders with pagination"""
         try:
             message = reply_to or update.message
-            if update.effective_user.id not in [6422072438]:
+            if not await self.check_admin_status(update.effective_user.id):
                 await message.reply_text("⛔️ Unauthorized")
                 return
 
-            # Get pending orders for display
-            with self.engine.connect() as conn:
-                pending_orders = conn.execute(text("""
-                    SELECT * FROM credit_orders 
-                    WHERE status = 'pending'
-                    ORDER BY created_at DESC
-                """)).fetchall()
-                logging.info(f"Pending orders: {pending_orders}")
-
-                if not pending_orders:
-                    await message.reply_text("No pending orders found.")
-                    return
+            current_order = self.data_store.get_pending_order()
+            if current_order is None:
+                await message.reply_text("No pending orders found.")
+                return
 
-                # Store for pagination
-                context.user_data['pending_orders'] = [dict(row._mapping) for row in pending_orders]
-                context.user_data['order_page'] = 0
+            message_text, keyboard_markup = self._pending_order_view(current_order)
+            await message.reply_text(
+                message_text,
+                reply_markup=keyboard_markup,
+                parse_mode='Markdown'
+            )
 
-                # Show first order
-                current_order = pending_orders[0]
-                total_pages = len(pending_orders)
+        except Exception as e:
+            logging.error(f"Error in orders command: {str(e)}")
+            if message:
+                await message.reply_text("Error retrieving orders. Please try again.")
+    async def stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show connection pool and cache statistics (admin only)"""
+        try:
+            if not await self.check_admin_status(update.effective_user.id):
+                await update.message.reply_text("⛔️ Unauthorized")
+                return
 
-                # Format message
-                message_text = (
-                    f"📦 Pending Order 1/{total_pages}\n\n"
-                    f"🔖 Order ID: `{current_order.order_id}`\n"
-                    f"👤 User ID: `{current_order.user_id}`\n"
-                )
+            runtime_stats = self.data_store.get_runtime_stats()
+            runtime_stats['notifier'] = self.notifier.stats()
+            runtime_stats['keyboards'] = keyboards.cache_stats()
+            loop_stats = monitor_stats()
+            if loop_stats:
+                runtime_stats['event_loop'] = loop_stats
+            lines = ["📊 Runtime stats"]
+            for section, values in runtime_stats.items():
+                lines.append(f"\n[{section}]")
+                lines.extend(f"{key}: {value}" for key, value in values.items())
+
+            await update.message.reply_text('\n'.join(lines))
+        except Exception as e:
+            logging.error(f"Error in stats command: {str(e)}", exc_info=True)
+            await update.message.reply_text("Error retrieving stats. Please try again.")
 
-                try:
-                    user = await context.bot.get_chat(current_order.user_id)
-                    username = f"@{user.username}" if user.username else "No username"
-                except Exception as e:
-                    username = "No username"
+    async def fulfill(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Fulfill several pending orders at once: /fulfill <order_id> ... (admin only)"""
+        if not await self.check_admin_status(update.effective_user.id):
+            await update.message.reply_text("⛔️ Unauthorized")
+            return
+        if not context.args:
+            await update.message.reply_text(
+                "Usage: /fulfill <order_id> [order_id ...]\nOr upload a CSV with an order_id column.")
+            return
+        await self._fulfill_batch(update.message, context.args)
 
-                message_text += f"Username: {username}\n"
-                message_text += (
-                    f"💳 Credits: {current_order.credits}\n"
-                    f"💰 Amount: Rp {current_order.amount:,}\n"
-                    f"⏱️ Waiting since: {current_order.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
-                )
+    async def grant(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Grant credits to several users: /grant <user_id>:<credits> ... (admin only)"""
+        if not await self.check_admin_status(update.effective_user.id):
+            await update.message.reply_text("⛔️ Unauthorized")
+            return
+        try:
+            grants = [arg.split(':') for arg in context.args]
+            grants = [(int(user_id), int(credits)) for user_id, credits in grants]
+        except ValueError:
+            grants = []
+        if not grants:
+            await update.message.reply_text(
+                "Usage: /grant <user_id>:<credits> [...]\nOr upload a CSV with user_id and credits columns.")
+            return
+        await self._grant_batch(update.message, grants)
 
-                # Build keyboard
-                keyboard = []
-                nav_row = []
-                if total_pages > 1:
-                    nav_row.append(InlineKeyboardButton("Next ➡️", callback_data="orders_next"))
-                if nav_row:
-                    keyboard.append(nav_row)
-
-                keyboard.append([
-                    InlineKeyboardButton("✅ Fulfill Order", 
-                        callback_data=f"give_{current_order.user_id}_{current_order.credits}"),
-                    InlineKeyboardButton("❌ Delete Order",
-                        callback_data=f"delete_order_{current_order.order_id}")
-                ])
-                keyboard.append([
-                    InlineKeyboardButton("📥 Export to CSV", callback_data="export_orders")
-                ])
+    async def broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Queue an announcement to every user: /broadcast <text> (admin only)"""
+        if not await self.check_admin_status(update.effective_user.id):
+            await update.message.reply_text("⛔️ Unauthorized")
+            return
+        parts = update.message.text.split(maxsplit=1)
+        if len(parts) < 2:
+            await update.message.reply_text("Usage: /broadcast <text>")
+            return
+        try:
+            queued = await self.notifier.broadcast(parts[1])
+            await update.message.reply_text(f"📣 Broadcast queued for {queued} users.")
+        except Exception as e:
+            logging.error(f"Error queueing broadcast: {str(e)}", exc_info=True)
+            await update.message.reply_text("Failed to queue broadcast. Please try again.")
 
+    async def admin_upload(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Run a batch operation from an uploaded CSV (admin only)"""
+        message = update.message
+        if not await self.check_admin_status(update.effective_user.id):
+            return
+        try:
+            if message.document.file_size and message.document.file_size > MAX_BATCH_UPLOAD_BYTES:
+                await message.reply_text("File too large for a batch operation.")
+                return
+
+            upload = await message.document.get_file()
+            content = bytes(await upload.download_as_bytearray()).decode('utf-8-sig')
+            reader = csv.DictReader(io.StringIO(content))
+            columns = {name.strip().lower(): name for name in reader.fieldnames or []}
+
+            if 'order_id' in columns:
+                order_ids = [row[columns['order_id']].strip() for row in reader
+                             if (row[columns['order_id']] or '').strip()]
+                await self._fulfill_batch(message, order_ids)
+            elif 'user_id' in columns and 'credits' in columns:
+                grants = [(int(row[columns['user_id']]), int(row[columns['credits']])) for row in reader]
+                await self._grant_batch(message, grants)
+            else:
                 await message.reply_text(
-                    message_text,
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode='Markdown'
-                )
+                    "CSV needs an order_id column (fulfill) or user_id and credits columns (grant).")
+        except (TypeError, ValueError, UnicodeDecodeError) as e:
+            await message.reply_text(f"Could not read CSV: {str(e)}")
+        except Exception as e:
+            logging.error(f"Error processing batch upload: {str(e)}", exc_info=True)
+            await message.reply_text("Batch operation failed. Please try again.")
 
+    async def _fulfill_batch(self, message, order_ids: List[str]):
+        try:
+            results = self.data_store.fulfill_orders(order_ids)
         except Exception as e:
-            logging.error(f"Error in orders command: {str(e)}")
-            if message:
-                await message.reply_text("Error retrieving orders. Please try again.")
-    async def export_saved_contacts(self, update: Update,
-                                    context: ContextTypes.DEFAULT_TYPE):
-        user_id = update.effective_user.id
-        saved_contacts = self.data_store.get_saved_contacts(user_id)
-        if not saved_contacts:
-            await update.message.reply_text("No saved contacts to export")
+            logging.error(f"Error fulfilling orders: {str(e)}", exc_info=True)
+            await message.reply_text("Batch fulfillment failed; no orders were changed.")
             return
-        csv_data = self.data_store.format_saved_contacts_to_csv(saved_contacts)
-        await context.bot.send_document(update.effective_chat.id,
-                                        document=csv_data,
-                                        filename='saved_contacts.csv')
-
-    async def export_orders(self, update: Update,
-                          context: ContextTypes.DEFAULT_TYPE):
-        from io import StringIO
-        from datetime import datetime
 
-        query = update.callback_query
-        if update.effective_user.id not in [6422072438]:
-            await update.message.reply_text("Unauthorized")
+        for result in results:
+            self.notifier.send(
+                result['user_id'],
+                f"✅ {result['added']} kredit telah ditambahkan ke akun Anda!\nSaldo saat ini: {result['balance']} kredit",
+                priority=PRIORITY_HIGH,
+                reply_markup=keyboards.BACK_TO_MAIN)
+
+        fulfilled = sum(len(result['order_ids']) for result in results)
+        await message.reply_text(
+            f"✅ Fulfilled {fulfilled} orders for {len(results)} users.\n"
+            f"Skipped {len(set(order_ids)) - fulfilled} (unknown or not pending).")
+
+    async def _grant_batch(self, message, grants: List[tuple]):
+        if any(credits <= 0 for _, credits in grants):
+            await message.reply_text("Credits must be positive.")
             return
-            
+
+        totals: Dict[int, int] = {}
+        for user_id, credits in grants:
+            totals[user_id] = totals.get(user_id, 0) + credits
         try:
-            # Get all orders from database
-            with self.engine.connect() as conn:
-                orders = conn.execute(text("""
-                    SELECT * FROM credit_orders 
-                    ORDER BY created_at DESC
-                """)).fetchall()
+            balances = self.data_store.grant_credits(totals)
+        except Exception as e:
+            logging.error(f"Error granting credits: {str(e)}", exc_info=True)
+            await message.reply_text("Batch grant failed; no credits were added.")
+            return
 
-                if not orders:
-                    await query.answer("No orders to export") 
-                    return
+        for user_id, balance in balances.items():
+            self.notifier.send(
+                user_id,
+                f"✅ {totals[user_id]} kredit telah ditambahkan ke akun Anda!\nSaldo saat ini: {balance} kredit",
+                priority=PRIORITY_HIGH,
+                reply_markup=keyboards.BACK_TO_MAIN)
 
-                # Generate CSV
-                output = StringIO()
-                writer = csv.writer(output)
-                writer.writerow(['User ID', 'Username', 'Time', 'Credits', 'Amount (Rp)', 'Status', 'Fulfilled At'])
+        await message.reply_text(
+            f"✅ Granted {sum(totals.values())} credits to {len(balances)} users.")
 
-                for order in orders:
-                    # Get username for each user
-                    try:
-                        user = await context.bot.get_chat(order.user_id)
-                        username = f"@{user.username}" if user.username else "No username"
-                    except Exception:
-                        username = "Unknown"
-
-                    writer.writerow([
-                        f"User_{order.user_id}",
-                        username,
-                        order.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                        order.credits, 
-                        f"{order.amount:,}",
-                        order.status,
-                        order.fulfilled_at.strftime('%Y-%m-%d %H:%M:%S') if order.fulfilled_at else '-'
-                    ])
-
-                # Save and send file
-                temp_file = f"orders_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-                with open(temp_file, 'w', encoding='utf-8') as f:
-                    f.write(output.getvalue())
+    async def export_orders(self, update: Update,
+                          context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        if not await self.check_admin_status(update.effective_user.id):
+            await query.message.reply_text("⛔️ Unauthorized")
+            return
 
+        try:
+            # Known users come from telegram_users; only strangers hit the Bot
+            # API, before the export opens its cursor
+            profiles = await self.data_store.profiles.resolve(
+                context.bot, self.data_store.order_user_ids())
+
+            export = self.data_store.export_orders_csv(profiles)
+            if export is None:
+                await query.message.reply_text("No orders to export")
+                return
+
+            with export:
                 await query.message.reply_document(
-                    document=open(temp_file, 'rb'),
-                    filename=f"orders_export.csv",
+                    document=export.finish(),
+                    filename=export.filename,
                     caption="All orders export file"
                 )
-                
-                # Cleanup
-                #os.remove(temp_file)
-                #await query.answer("Export complete!")
 
         except Exception as e:
-            logging.error(f"Error exporting orders: {e}")
-            await query.answer("Failed to export orders")
+            logging.error(f"Error exporting orders: {str(e)}", exc_info=True)
+            await query.message.reply_text("Failed to export orders")
 
     async def show_results(self, update: Update,
                         context: ContextTypes.DEFAULT_TYPE,
-                        search_pattern: str):
+                        search_pattern: str, avoid=()):
         """Show randomized search results with pagination"""
         try:
-            # Get random results from database
-            with self.engine.connect() as conn:
-                results = conn.execute(
-                    text("""
-                    SELECT 
-                        id,
-                        name as importer_name,
-                        phone as contact,
-                        email_1 as email,
-                        website,
-                        product,
-                        role as product_description,
-                        country,
-                        CASE 
-                            WHEN wa_availability = 'Available' THEN true
-                            ELSE false
-                        END as wa_available
-                    FROM importers 
-                    WHERE LOWER(product) SIMILAR TO :pattern
-                    AND phone IS NOT NULL AND phone != ''
-                    AND country IS NOT NULL AND country != ''
-                    ORDER BY RANDOM()  -- Randomize results
-                    LIMIT 10
-                    """), {
-                        "pattern": f"%{search_pattern.lower()}%"
-                    }).fetchall()
-
-                results = [dict(row._mapping) for row in results]
+            # Sample ids from the pattern's candidate pool (kept in memory),
+            # skipping contacts the user already saved, then load rows
+            # through the shared cache
+            saved = self.data_store.saved_importer_ids(update.effective_user.id)
+            result_ids = self.data_store.search_index.sample(
+                search_pattern, exclude=saved, avoid=avoid)
+
+            results = self.data_store.importers.get_many(result_ids)
 
             if not results:
                 reply_to = update.callback_query.message if hasattr(
@@ -1625,38 +1211,15 @@ class CommandHandler:
             # Display results
             for result in current_results:
                 message_text, _, _ = Messages.format_importer(result)
-                save_button = [[
-                    InlineKeyboardButton(
-                        "💾 Simpan Kontak",
-                        callback_data=f"save_{result['id']}"
-                    )
-                ]]
-
                 sent_msg = await reply_to.reply_text(
                     message_text,
                     parse_mode='Markdown',
-                    reply_markup=InlineKeyboardMarkup(save_button))
+                    reply_markup=keyboards.save_contact(result['id']))
                 message_ids.append(sent_msg.message_id)
 
-            # Navigation buttons
-            navigation_row = []
-            if total_pages > 1:
-                navigation_row.append(
-                    InlineKeyboardButton("Next ➡️", callback_data="next_page"))
-            navigation_row.append(
-                InlineKeyboardButton(f"1/{total_pages}", callback_data="page_info"))
-
-            bottom_buttons = [[
-                InlineKeyboardButton("🔄 Cari Kembali",
-                                    callback_data="regenerate_search")
-            ], [
-                InlineKeyboardButton("🔙 Kembali",
-                                    callback_data="back_to_categories")
-            ]]
-
             nav_msg = await reply_to.reply_text(
                 f"Halaman 1 dari {total_pages}",
-                reply_markup=InlineKeyboardMarkup([navigation_row] + bottom_buttons))
+                reply_markup=keyboards.search_pages(0, total_pages))
             message_ids.append(nav_msg.message_id)
 
             context.user_data['current_message_ids'] = message_ids
@@ -1677,7 +1240,7 @@ class CommandHandler:
                            update: Update):
         """Save contact to user's saved list"""
         try:
-            logging.info(f"Starting save contact process for user {user_id}")
+            logging.debug("Starting save contact process for user %s", user_id)
 
             # Get current credits
             current_credits = self.data_store.get_user_credits(user_id)
@@ -1688,61 +1251,34 @@ class CommandHandler:
                 return
 
             # Get importer data
-            with self.engine.connect() as conn:
-                result = conn.execute(
-                    text("""
-                    SELECT 
-                        id,
-                        name as importer_name,
-                        phone as contact,                      
-                        website,
-                        email_1 as email,
-                        product as hs_code,
-                        country,
-                        CASE 
-                            WHEN wa_availability = 'Available' THEN true
-                            ELSE false
-                        END as wa_available,
-                        role as product_description,
-                        CURRENT_TIMESTAMP as saved_at
-                    FROM importers 
-                    WHERE id = :id
-                """), {
-                        "id": contact_id
-                    }).first()
-
-                if not result:
-                    await update.callback_query.message.reply_text(
-                        "⚠️ Kontak tidak ditemukan. Silakan coba cari kembali."
-                    )
-                    return
+            importer = self.data_store.importers.get(contact_id)
+            if not importer:
+                await update.callback_query.message.reply_text(
+                    "⚠️ Kontak tidak ditemukan. Silakan coba cari kembali."
+                )
+                return
 
-                importer = dict(result._mapping)
-                logging.debug(f"Found importer data: {importer}")
+            if importer['id'] in self.data_store.saved_importer_ids(user_id):
+                await update.callback_query.message.reply_text(Messages.CONTACT_SAVE_FAILED)
+                return
 
-                # Save contact with transaction
-                try:
-                    # Then save contact
-                    success = await self.data_store.save_contact(
-                        user_id=user_id, importer=importer)
-
-                    if success:
-                        new_balance = self.data_store.get_user_credits(user_id)
-                        await update.callback_query.message.reply_text(
-                            f"✅ Kontak berhasil disimpan!\n\n"
-                            f"💳 Sisa kredit: {new_balance} kredit\n\n"
-                            f"Gunakan /saved untuk melihat kontak tersimpan.")
-                    else:
-                        # Rollback credit deduction if save fails
-                        self.data_store.add_credits(user_id, 1)
-                        await update.callback_query.message.reply_text(
-                            "⚠️ Gagal menyimpan kontak. Silakan coba lagi atau hubungi admin jika masalah berlanjut."
-                        )
+            logging.debug("Found importer data: %s", importer)
 
-                except Exception as e:
-                    logging.error(f"Transaction error: {str(e)}")
-                    conn.rollback()
-                    raise
+            # Save contact with transaction
+            success = await self.data_store.save_contact(
+                user_id=user_id, importer=importer)
+
+            if success:
+                new_balance = self.data_store.get_user_credits(user_id)
+                await update.callback_query.message.reply_text(
+                    f"✅ Kontak berhasil disimpan!\n\n"
+                    f"💳 Sisa kredit: {new_balance} kredit\n\n"
+                    f"Gunakan /saved untuk melihat kontak tersimpan.")
+            else:
+                # Nothing was deducted: the save and the debit share one transaction
+                await update.callback_query.message.reply_text(
+                    "⚠️ Gagal menyimpan kontak. Silakan coba lagi atau hubungi admin jika masalah berlanjut."
+                )
 
         except Exception as e:
             logging.error(f"Error saving contact: {str(e)}", exc_info=True)
@@ -1754,32 +1290,20 @@ class CommandHandler:
         query = update.callback_query
         try:
             user_id = query.from_user.id
-            
-            # Get CSV data
-            with app.app_context():
-                csv_data = self.data_store.format_saved_contacts_to_csv(user_id)
 
-            if csv_data == "No saved contacts found":
+            export = self.data_store.export_saved_contacts_csv(user_id)
+            if export is None:
                 await query.message.reply_text("Tidak ada kontak tersimpan untuk diekspor.")
                 return
 
-            # Create temporary file with CSV data
-            
-            with tempfile.NamedTemporaryFile(mode='w+', suffix='.csv', delete=False, encoding='utf-8') as temp_file:
-                temp_file.write(csv_data)
-                temp_file.flush()
-
-                # Send the CSV file
-                with open(temp_file.name, 'rb') as f:
-                    await context.bot.send_document(
-                        chat_id=query.message.chat_id,
-                        document=f,
-                        filename=f'saved_contacts_{user_id}.csv',
-                        caption="📥 Daftar kontak tersimpan Anda"
-                    )
-
-                # Clean up temp file
-                os.unlink(temp_file.name)
+            # The spooled buffer is dropped as soon as the upload finishes
+            with export:
+                await context.bot.send_document(
+                    chat_id=query.message.chat_id,
+                    document=export.finish(),
+                    filename=export.filename,
+                    caption="📥 Daftar kontak tersimpan Anda"
+                )
 
             await query.message.reply_text("✅ File CSV berhasil dikirim!")
             await query.answer()
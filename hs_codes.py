@@ -0,0 +1,149 @@
+"""Harmonized System code descriptions, stored in hs_codes.
+
+Load a CSV with code and description columns (chapters, headings and
+subheadings; dots in codes are ignored), then add the headings of a
+chapter to a product menu and publish it:
+
+    python hs_codes.py load hs_codes.csv
+    python hs_codes.py menu buyer "Produk Laut" 03 WW
+"""
+import csv
+import logging
+import sys
+from typing import Dict, Iterable, List, Tuple
+import queries
+
+# Button labels longer than this many characters are cut
+MAX_LABEL_LENGTH = 60
+
+UPSERT_HS_CODES = queries.register('upsert_hs_codes', """
+    INSERT INTO hs_codes (code, description)
+    SELECT * FROM unnest(
+        CAST(:codes AS VARCHAR[]),
+        CAST(:descriptions AS TEXT[])
+    )
+    ON CONFLICT (code) DO UPDATE SET description = EXCLUDED.description
+""", prepare=False)
+
+# Not prepared: the prefix has to be a literal for the planner to turn the
+# LIKE into a range scan of the text_pattern_ops index
+HS_CHILDREN = queries.register('hs_children', """
+    SELECT code, description FROM hs_codes
+    WHERE code LIKE :prefix AND LENGTH(code) = :length
+    ORDER BY code
+""", prepare=False)
+
+MENU_CATEGORY_POSITION = queries.register('menu_category_position', """
+    SELECT COALESCE(
+        MIN(category_position) FILTER (WHERE category = :category),
+        MAX(category_position) + 1,
+        0
+    )
+    FROM product_categories
+    WHERE side = :side
+""")
+
+
+def hs_digits(code: str) -> str:
+    """'0302.11' -> '030211'"""
+    return ''.join(ch for ch in code if ch.isdigit())
+
+
+def hs_prefix_filter(prefixes: Iterable[str], params: Dict, column: str = 'hs_code') -> str:
+    """SQL condition matching codes under any of the prefixes.
+
+    A chapter ('03'), heading ('0302') or subheading ('030211') becomes one
+    index range scan per prefix; the patterns are added to params.
+    """
+    clauses = []
+    for prefix in prefixes:
+        digits = hs_digits(prefix)
+        if not digits:
+            continue
+        param = f"hs_prefix_{len(params)}"
+        params[param] = f"{digits}%"
+        clauses.append(f"{column} LIKE :{param}")
+    return f"({' OR '.join(clauses)})" if clauses else "FALSE"
+
+
+def read_hs_csv(path: str) -> List[Tuple[str, str]]:
+    """(code, description) rows of a CSV with code and description columns"""
+    codes = {}
+    with open(path, "r", encoding="utf-8") as csvfile:
+        for row in csv.DictReader(csvfile):
+            row = {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+            code = hs_digits(row.get('code', ''))
+            description = row.get('description', '')
+            if 2 <= len(code) <= 10 and description:
+                codes[code] = description
+    return sorted(codes.items())
+
+
+def load_hs_codes(conn, rows: List[Tuple[str, str]]) -> int:
+    return UPSERT_HS_CODES.execute(conn, {
+        "codes": [code for code, _ in rows],
+        "descriptions": [description for _, description in rows]
+    }).rowcount
+
+
+def hs_children(conn, prefix: str) -> List[Tuple[str, str]]:
+    """Codes one level below prefix: chapter -> headings -> subheadings"""
+    digits = hs_digits(prefix)
+    return [tuple(row) for row in HS_CHILDREN.execute(conn, {
+        "prefix": f"{digits}%",
+        "length": len(digits) + 2
+    }).fetchall()]
+
+
+def add_menu_products(conn, side: str, category: str, prefix: str, origin: str) -> int:
+    """Add a menu product for each code below prefix, searching '<origin> <code>'"""
+    from catalog import SEED_CATALOG, BUMP_CATALOG_VERSION
+
+    children = hs_children(conn, prefix)
+    if not children:
+        return 0
+    category_position = MENU_CATEGORY_POSITION.execute(
+        conn, {"side": side, "category": category}).scalar()
+    names = []
+    for code, description in children:
+        label = f"{description} (HS {code})"
+        if len(label) > MAX_LABEL_LENGTH:
+            label = f"{description[:MAX_LABEL_LENGTH - len(code) - 9].rstrip()}… (HS {code})"
+        names.append(label)
+
+    inserted = SEED_CATALOG.execute(conn, {
+        "sides": [side] * len(children),
+        "categories": [category] * len(children),
+        "category_emojis": ['📦'] * len(children),
+        "category_positions": [category_position] * len(children),
+        "names": names,
+        "emojis": ['📦'] * len(children),
+        "search_terms": [f"{origin.upper()} {code}" for code, _ in children],
+        "positions": list(range(len(children)))
+    }).rowcount
+    if inserted:
+        BUMP_CATALOG_VERSION.execute(conn)
+    return inserted
+
+
+if __name__ == "__main__":
+    from db_pool import get_engine
+    from logging_config import setup_logging
+    setup_logging()
+    args = sys.argv[1:]
+    engine = get_engine()
+    if len(args) == 2 and args[0] == 'load':
+        rows = read_hs_csv(args[1])
+        with engine.begin() as conn:
+            loaded = load_hs_codes(conn, rows)
+        logging.info(f"Loaded {loaded} HS codes")
+    elif len(args) == 5 and args[0] == 'menu':
+        from catalog import publish_catalog
+        _, side, category, prefix, origin = args
+        with engine.begin() as conn:
+            added = add_menu_products(conn, side, category, prefix, origin)
+        publish_catalog(engine)
+        logging.info(f"Added {added} products to {side} menu {category}")
+    else:
+        print(__doc__)
+        sys.exit(1)
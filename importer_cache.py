@@ -0,0 +1,108 @@
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+from cache import LRUCache
+import queries
+
+# Canonical importer projection shared by search, save and render paths
+IMPORTER_SELECT_SQL = """
+    SELECT
+        id,
+        name as importer_name,
+        phone as contact,
+        email_1 as email,
+        website,
+        product,
+        origin,
+        hs_code,
+        role as product_description,
+        country,
+        wa_available
+    FROM importers
+"""
+
+GET_IMPORTERS_BY_ID = queries.register(
+    'get_importers_by_id', IMPORTER_SELECT_SQL + " WHERE id = ANY(:ids)")
+
+_invalidation_hooks: List[Callable[[Optional[Iterable[int]]], None]] = []
+
+
+def register_invalidation_hook(hook: Callable[[Optional[Iterable[int]]], None]) -> None:
+    """Register a callback run whenever importer rows change"""
+    if hook not in _invalidation_hooks:
+        _invalidation_hooks.append(hook)
+
+
+def invalidate_importers(ids: Optional[Iterable[int]] = None) -> None:
+    """Notify caches that importer rows changed (all rows when ids is None)"""
+    ids = list(ids) if ids is not None else None
+    for hook in _invalidation_hooks:
+        try:
+            hook(ids)
+        except Exception as e:
+            logging.error(f"Error running importer invalidation hook: {str(e)}", exc_info=True)
+
+
+class ImporterCache:
+    """Process-wide LRU/TTL cache of importer rows keyed by id"""
+
+    def __init__(self, engine, max_size: int = 5000, ttl: float = 600):
+        self.engine = engine
+        self._cache = LRUCache(max_size=max_size, ttl=ttl)
+        register_invalidation_hook(self.invalidate)
+
+    def get(self, importer_id) -> Optional[Dict]:
+        """Get a single importer row, loading it on a miss"""
+        rows = self.get_many([importer_id])
+        return rows[0] if rows else None
+
+    def get_many(self, ids: Iterable) -> List[Dict]:
+        """Get importer rows in the order of ids, fetching all misses in one query"""
+        try:
+            ids = [int(importer_id) for importer_id in ids]
+        except (TypeError, ValueError):
+            logging.warning(f"Invalid importer ids: {ids}")
+            return []
+
+        found = {}
+        missing = []
+        for importer_id in ids:
+            row = self._cache.get(importer_id)
+            if row is None:
+                missing.append(importer_id)
+            else:
+                found[importer_id] = row
+
+        if missing:
+            with self.engine.connect() as conn:
+                results = GET_IMPORTERS_BY_ID.execute(
+                    conn, {"ids": list(set(missing))}
+                ).fetchall()
+            for result in results:
+                row = dict(result._mapping)
+                self._cache.set(row['id'], row)
+                found[row['id']] = row
+
+        # Hand out copies so callers can't mutate cached rows
+        return [dict(found[importer_id]) for importer_id in ids if importer_id in found]
+
+    def invalidate(self, ids: Optional[Iterable[int]] = None) -> None:
+        """Drop the given ids, or everything when ids is None"""
+        if ids is None:
+            self._cache.clear()
+            return
+        for importer_id in ids:
+            self._cache.pop(importer_id)
+
+    def stats(self) -> Dict:
+        return self._cache.stats()
+
+
+_importer_cache: Optional[ImporterCache] = None
+
+
+def get_importer_cache(engine) -> ImporterCache:
+    """Return the process-wide importer cache, creating it on first use"""
+    global _importer_cache
+    if _importer_cache is None:
+        _importer_cache = ImporterCache(engine)
+    return _importer_cache
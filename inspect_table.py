@@ -23,8 +23,8 @@ for column in columns:
 
 # Count the number of rows in saved_contacts table
 with engine.connect() as connection:
-    result = connection.execute(text("""SELECT DISTINCT "wa_availability", COUNT(*) 
+    result = connection.execute(text("""SELECT DISTINCT "wa_available", COUNT(*) 
 FROM importers 
-GROUP BY "wa_availability" """))
+GROUP BY "wa_available" """))
     row_count = sum(row[1] for row in result)
     print(f"Number of rows in saved_contacts table: {row_count}")
\ No newline at end of file
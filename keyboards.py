@@ -0,0 +1,153 @@
+"""Inline keyboards shared between updates.
+
+Markups are immutable once built, so the constant menus are created once at
+import and the variants with a page counter or id are cached per value.
+"""
+from functools import lru_cache
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+ADMIN_URL = "https://t.me/afrizaladinur"
+COMMUNITY_URL = "https://t.me/+kuNU6lDtYoNlMTc1"
+
+# Credit packages on sale: credits -> price in rupiah
+CREDIT_PACKAGES = {
+    75: 150000,
+    150: 300000,
+    250: 399000
+}
+
+
+def _rupiah(amount: int) -> str:
+    return f"Rp {amount:,}".replace(',', '.')
+
+
+BACK_TO_MAIN_BUTTON = InlineKeyboardButton("🔙 Kembali", callback_data="back_to_main")
+BACK_TO_MAIN = InlineKeyboardMarkup([[BACK_TO_MAIN_BUTTON]])
+
+REFRESH_MENU = InlineKeyboardMarkup([[
+    InlineKeyboardButton("🔄 Refresh", callback_data="start")
+]])
+
+
+def _main_menu(is_member: bool) -> InlineKeyboardMarkup:
+    if is_member:
+        community_button = InlineKeyboardButton(
+            "🔓 Buka Kancil Global Network", url=COMMUNITY_URL)
+    else:
+        community_button = InlineKeyboardButton(
+            "🌟 Gabung Kancil Global Network", callback_data="join_community")
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("📤 Kontak Supplier", callback_data="show_suppliers"),
+            InlineKeyboardButton("📥 Kontak Buyer", callback_data="show_buyers")
+        ],
+        [InlineKeyboardButton("📁 Kontak Tersimpan", callback_data="saved")],
+        [InlineKeyboardButton("💳 Kredit Saya", callback_data="show_credits")],
+        [community_button],
+        [InlineKeyboardButton("❓ Bantuan", callback_data="show_help")],
+        [InlineKeyboardButton("👨‍💼 Hubungi Admin", url=ADMIN_URL)]
+    ])
+
+
+_MAIN_MENUS = {
+    True: _main_menu(True),
+    False: _main_menu(False)
+}
+
+
+def main_menu(is_member: bool) -> InlineKeyboardMarkup:
+    return _MAIN_MENUS[bool(is_member)]
+
+
+CREDITS_MENU = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("🎁 Klaim 20 Kredit Gratis", callback_data="redeem_free_credits")]]
+    + [[InlineKeyboardButton(f"🛒 Beli {credits} Kredit - {_rupiah(price)}",
+                             callback_data=f"order_{credits}")]
+       for credits, price in CREDIT_PACKAGES.items()]
+    + [[BACK_TO_MAIN_BUTTON]]
+)
+
+PAYMENT_MENU = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📎 Kirim Bukti Transfer", url=ADMIN_URL)],
+    [BACK_TO_MAIN_BUTTON]
+])
+
+JOIN_COMMUNITY_MENU = InlineKeyboardMarkup([[
+    InlineKeyboardButton("🚀 Gabung Sekarang", callback_data="join_now")
+]])
+
+_SEARCH_FOOTER = (
+    (InlineKeyboardButton("🔄 Cari Kembali", callback_data="regenerate_search"),),
+    (InlineKeyboardButton("🔙 Kembali", callback_data="back_to_categories"),)
+)
+
+_SAVED_FOOTER = (
+    (InlineKeyboardButton("📥 Export to CSV", callback_data="export_saved_contacts"),),
+    (BACK_TO_MAIN_BUTTON,)
+)
+
+
+def _page_row(page: int, total_pages: int, prev_data: str, info_data: str, next_data: str) -> tuple:
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("⬅️ Prev", callback_data=prev_data))
+    row.append(InlineKeyboardButton(f"{page + 1}/{total_pages}", callback_data=info_data))
+    if page < total_pages - 1:
+        row.append(InlineKeyboardButton("Next ➡️", callback_data=next_data))
+    return tuple(row)
+
+
+@lru_cache(maxsize=256)
+def search_pages(page: int, total_pages: int) -> InlineKeyboardMarkup:
+    """Navigation for page (0-based) of search results"""
+    return InlineKeyboardMarkup(
+        (_page_row(page, total_pages, "prev_page", "page_info", "next_page"),) + _SEARCH_FOOTER)
+
+
+@lru_cache(maxsize=256)
+def saved_pages(page: int, total_pages: int) -> InlineKeyboardMarkup:
+    """Navigation for page (0-based) of saved contacts"""
+    if total_pages <= 1:
+        return InlineKeyboardMarkup(_SAVED_FOOTER)
+    return InlineKeyboardMarkup(
+        (_page_row(page, total_pages, "show_saved_prev", "show_saved_page_info", "show_saved_next"),)
+        + _SAVED_FOOTER)
+
+
+@lru_cache(maxsize=4096)
+def save_contact(importer_id) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton("💾 Simpan Kontak", callback_data=f"save_{importer_id}")
+    ]])
+
+
+@lru_cache(maxsize=4096)
+def whatsapp(number: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton("💬 Chat WhatsApp", url=f"https://wa.me/{number}")
+    ]])
+
+
+def order_page_callback(action: str, order_id: int) -> str:
+    """Pending-order navigation: action 'next' pages older, 'prev' newer"""
+    return f"orders_{action}_{order_id}"
+
+
+def parse_order_page(data: str) -> tuple:
+    """'orders_next_<id>' -> ('older', id); 'orders_prev_<id>' -> ('newer', id)
+
+    The id is the order on screen, the keyset cursor to seek from; None
+    when it is missing or malformed.
+    """
+    action, _, cursor_id = data.partition('_')[2].partition('_')
+    direction = 'older' if action == 'next' else 'newer'
+    return direction, int(cursor_id) if cursor_id.isdigit() else None
+
+
+def cache_stats() -> dict:
+    """Hit counters of the cached keyboard builders"""
+    stats = {}
+    for builder in (search_pages, saved_pages, save_contact, whatsapp):
+        info = builder.cache_info()
+        stats[builder.__name__] = f"{info.hits}/{info.hits + info.misses}"
+    return stats
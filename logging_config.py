@@ -0,0 +1,135 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from env import env_int
+
+# LOG_LEVEL sets the root level; LOG_LEVELS overrides single loggers,
+# e.g. "httpx=WARNING,sqlalchemy.engine=INFO"
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# text, color (coloredlogs) or json
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+# Keep one of every LOG_SAMPLE_EVERY records of the sampled messages
+LOG_SAMPLE_EVERY = env_int('LOG_SAMPLE_EVERY', 20)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Libraries that log every HTTP request or pool event at INFO/DEBUG
+DEFAULT_LOGGER_LEVELS = {
+    'httpx': 'WARNING',
+    'httpcore': 'WARNING',
+    'telegram': 'INFO',
+    'telegram.ext.Updater': 'WARNING',
+    'apscheduler': 'WARNING',
+    'sqlalchemy': 'WARNING'
+}
+
+# High-volume messages that are sampled rather than logged every time
+SAMPLED_PREFIXES = (
+    'Received callback query',
+)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+class SamplingFilter(logging.Filter):
+    """Pass one in every `every` records whose message starts with a sampled prefix"""
+
+    def __init__(self, prefixes=SAMPLED_PREFIXES, every: int = LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.prefixes = prefixes
+        self.every = max(1, every)
+        self._counts = {prefix: 0 for prefix in prefixes}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Match on the unformatted template so dropped records are never rendered
+        if not isinstance(record.msg, str) or not record.msg.startswith(self.prefixes):
+            return True
+        prefix = next(prefix for prefix in self.prefixes if record.msg.startswith(prefix))
+        with self._lock:
+            count = self._counts[prefix]
+            self._counts[prefix] = count + 1
+        if count % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line for log shippers"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if getattr(record, 'sampled', None):
+            entry['sample_rate'] = 1 / record.sampled
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records unformatted; the listener thread does the formatting"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _formatter() -> logging.Formatter:
+    if LOG_FORMAT == 'json':
+        return JsonFormatter()
+    if LOG_FORMAT == 'color':
+        try:
+            import coloredlogs
+            return coloredlogs.ColoredFormatter(TEXT_FORMAT)
+        except ImportError:
+            pass
+    return logging.Formatter(TEXT_FORMAT)
+
+
+def setup_logging() -> None:
+    """Route all logging through a background queue listener"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler()
+    output.setFormatter(_formatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    levels = dict(DEFAULT_LOGGER_LEVELS)
+    levels.update(_parse_levels(os.environ.get('LOG_LEVELS', '')))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -1,58 +1,59 @@
 import logging
 import asyncio
-from bot import TelegramBot
-from app import app
-import coloredlogs
+from startup import STARTUP_PROFILE, StartupProfile
+from logging_config import setup_logging
+from diagnostics import start_monitor, stop_monitor
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG)
-
-# Configure coloredlogs
-coloredlogs.install(
-    level='DEBUG',
-    fmt='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-# Add custom logging for specific messages
-class CustomFilter(logging.Filter):
-    def filter(self, record):
-        if record.getMessage().startswith('Received callback query:'):
-            record.levelname = 'ORANGE'
-            record.msg = f'\033[1;33m{record.msg}\033[0m'  # Orange and bold
-        return True
-
-logger = logging.getLogger(__name__)
-logger.addFilter(CustomFilter())
+startup_profile = StartupProfile()
 
+# Queue-based logging; see logging_config for LOG_LEVEL/LOG_LEVELS/LOG_FORMAT
+setup_logging()
 logger = logging.getLogger(__name__)
 
 
 async def run_bot():
     """Setup and run the Telegram bot"""
     try:
+        if STARTUP_PROFILE:
+            startup_profile.import_modules()
+        with startup_profile.step("import bot"):
+            from bot import TelegramBot
+
         # Initialize bot
-        bot = TelegramBot()
-        application = bot.get_application()
+        with startup_profile.step("init bot"):
+            bot = TelegramBot()
+            application = bot.get_application()
 
-        # Important: Delete webhook and drop pending updates
-        await application.bot.delete_webhook(drop_pending_updates=True)
-        await bot.setup()
+        # Independent network round trips overlap; start_polling deletes
+        # any webhook itself, so no separate delete_webhook call is needed
+        data_store = bot.command_handler.data_store
+        await startup_profile.gather(
+            ("database warm-up", asyncio.to_thread(data_store.warm_up)),
+            ("initialize", application.initialize()),
+            ("register commands", bot.register_commands())
+        )
 
         logger.info("Starting bot...")
-        await application.initialize()
-        await application.start()
+        await startup_profile.gather(
+            ("start services", bot.start_services()),
+            ("start", application.start())
+        )
 
         # Configure update fetching with proper locking settings
-        await application.updater.start_polling(
-            allowed_updates=["message", "callback_query"],
-            drop_pending_updates=True,
-            read_timeout=10,
-            timeout=10,
-            bootstrap_retries=3,
-            pool_timeout=None,
-            write_timeout=30,
-            connect_timeout=30)
+        with startup_profile.step("start polling"):
+            await application.updater.start_polling(
+                allowed_updates=["message", "callback_query"],
+                drop_pending_updates=True,
+                read_timeout=10,
+                timeout=10,
+                bootstrap_retries=3,
+                pool_timeout=None,
+                write_timeout=30,
+                connect_timeout=30)
+        logger.info(startup_profile.report())
+
+        # DIAGNOSTICS=on|debug: loop lag sampling and blocking-call reports
+        start_monitor()
 
         try:
             # Keep the bot running
@@ -61,6 +62,8 @@ async def run_bot():
         except asyncio.CancelledError:
             logger.info("Bot stopped")
         finally:
+            await stop_monitor()
+            await bot.shutdown()
             await application.stop()
 
     except Exception as e:
@@ -1,5 +1,53 @@
 import logging
 from typing import Optional
+from cache import LRUCache
+from countries import country_flag, normalize_country
+
+CENSOR = "X" * 6
+
+# Lookup tables built once at import instead of on every render
+CREDIT_COST_TEXT = {
+    3: "3 kredit - Kontak lengkap dengan WhatsApp",
+    2: "2 kredit - Kontak lengkap tanpa WhatsApp",
+    1: "1 kredit - Kontak tidak lengkap tanpa WhatsApp"
+}
+
+
+def _censor_name(text: str) -> str:
+    return text[:6] + CENSOR if len(text) > 3 else text
+
+
+def _censor_email(text: str) -> str:
+    return text[:6] + CENSOR
+
+
+def _censor_phone(text: str) -> str:
+    if '+' not in text:
+        return "+1 65" + CENSOR
+    parts = text.split()
+    return parts[0] + " " + (parts[1][:2] if len(parts) > 1 else "65") + CENSOR
+
+
+def _censor_website(_: str) -> str:
+    return "www." + CENSOR
+
+
+CENSOR_RULES = {
+    'name': _censor_name,
+    'email': _censor_email,
+    'phone': _censor_phone,
+    'website': _censor_website
+}
+
+
+def _base_url(url: str) -> str:
+    """Strip path and query from a website, keeping scheme and host"""
+    clean_url = url.strip()
+    if '//' not in clean_url:
+        return clean_url
+    parts = clean_url.split('/', 3)
+    return parts[0] + '//' + parts[2]
+
 
 class Messages:
 
@@ -99,7 +147,8 @@ Setiap pengguna baru mendapat 20 kredit gratis!
     CONTACT_SAVE_FAILED = "❌ Gagal menyimpan kontak. Kontak mungkin sudah tersimpan sebelumnya."
     NO_SAVED_CONTACTS = "Anda belum memiliki kontak yang tersimpan. Gunakan perintah /search untuk mencari dan menyimpan kontak."
 
-
+    # Initial menus, seeded into product_categories by migrate.py; the bot
+    # serves menus from the catalog (see catalog.py)
     SUPPLIER_CATEGORIES = {
         'Hasil Laut': {
             'emoji': '🐟',
@@ -162,45 +211,7 @@ Setiap pengguna baru mendapat 20 kredit gratis!
     @staticmethod
     def get_country_emoji(country: str) -> str:
         """Get emoji for a country"""
-        country_emojis = {
-            'China': '🇨🇳',
-            'Japan': '🇯🇵',
-            'Korea': '🇰🇷',
-            'South Korea': '🇰🇷',
-            'United States': '🇺🇸',
-            'USA': '🇺🇸',
-            'U.S.': '🇺🇸',
-            'Vietnam': '🇻🇳',
-            'Thailand': '🇹🇭',
-            'Singapore': '🇸🇬',
-            'Malaysia': '🇲🇾',
-            'Indonesia': '🇮🇩',
-            'India': '🇮🇳',
-            'Taiwan': '🇹🇼',
-            'Hong Kong': '🇭🇰',
-            'Philippines': '🇵🇭',
-            'Australia': '🇦🇺',
-            'New Zealand': '🇳🇿',
-            'Canada': '🇨🇦',
-            'Mexico': '🇲🇽',
-            'Brazil': '🇧🇷',
-            'United Kingdom': '🇬🇧',
-            'UK': '🇬🇧',
-            'Germany': '🇩🇪',
-            'France': '🇫🇷',
-            'Italy': '🇮🇹',
-            'Spain': '🇪🇸',
-            'Netherlands': '🇳🇱',
-            'Russia': '🇷🇺',
-            'Saudi Arabia': '🇸🇦',
-            'UAE': '🇦🇪',
-            'United Arab Emirates': '🇦🇪'
-        }
-        # Case-insensitive lookup
-        for key, value in country_emojis.items():
-            if country.lower() == key.lower():
-                return value
-        return '🌐'
+        return country_flag(country)
 
 
     @staticmethod
@@ -212,28 +223,16 @@ Setiap pengguna baru mendapat 20 kredit gratis!
             text = text.replace(char, '\\' + char)
         return text
 
-    @staticmethod 
+    @staticmethod
     def _censor_contact(text: str, field_type: str, saved: bool = False) -> str:
-        CENSOR = "X" * 6
-
         if saved:
             return text or ""
 
         if not text:
             return CENSOR
 
-        def prefix_with_censor(prefix: str) -> str:
-            return prefix + CENSOR
-
-        censor_rules = {
-            'name': lambda t: prefix_with_censor(t[:6]) if len(t) > 3 else t,
-            'email': lambda t: prefix_with_censor(t[:6]),
-            'phone': lambda t: prefix_with_censor("+1 65") if '+' not in t else \
-                    prefix_with_censor(t.split()[0] + " " + (t.split()[1][:2] if len(t.split()) > 1 else "65")),
-            'website': lambda _: prefix_with_censor("www.")
-        }
-
-        return censor_rules.get(field_type, lambda _: CENSOR)(text)
+        rule = CENSOR_RULES.get(field_type)
+        return rule(text) if rule else CENSOR
 
     @staticmethod
     def _format_phone_for_whatsapp(phone: str) -> str:
@@ -270,8 +269,45 @@ Setiap pengguna baru mendapat 20 kredit gratis!
         end_idx = start_idx + items_per_page
         return results[start_idx:end_idx], total_pages
 
+    # Rendered cards keyed by (importer id, saved flag, data version). Imports
+    # run in another process and cannot invalidate this cache, so cards
+    # expire with the importer rows they were rendered from (ImporterCache)
+    _render_cache = LRUCache(max_size=2048, ttl=600)
+    data_version = 0
+
+    @classmethod
+    def invalidate_render_cache(cls, ids=None) -> None:
+        """Drop the cards of the given importer ids, or all cards when ids is None"""
+        if ids is None:
+            cls.data_version += 1
+            cls._render_cache.clear()
+            return
+        for importer_id in ids:
+            for saved in (False, True):
+                cls._render_cache.pop((importer_id, saved, cls.data_version))
+
     @staticmethod
     def format_importer(importer: dict, saved: bool = False):
+        importer_id = importer.get('id')
+        if importer_id is None:
+            rendered = Messages._render_importer(importer, saved)
+        else:
+            cache_key = (importer_id, saved, Messages.data_version)
+            rendered = Messages._render_cache.get(cache_key)
+            if rendered is None:
+                rendered = Messages._render_importer(importer, saved)
+                Messages._render_cache.set(cache_key, rendered)
+
+        if not saved:
+            return rendered
+        # The cached card is shared by everyone who saved the importer;
+        # the save time belongs to this user
+        message_text, whatsapp_number, callback_data = rendered
+        message_text += f"\n📅 Disimpan pada: {importer.get('saved_at', '')}"
+        return message_text, whatsapp_number, callback_data
+
+    @staticmethod
+    def _render_importer(importer: dict, saved: bool = False):
         try:
             # Basic info formatting
             name = Messages._censor_contact(importer.get('name', '') or importer.get('importer_name', ''), 'name', saved)
@@ -279,59 +315,45 @@ Setiap pengguna baru mendapat 20 kredit gratis!
             phone = Messages._censor_contact(importer.get('contact', ''), 'phone', saved)
             website = Messages._censor_contact(importer.get('website', ''), 'website', saved)
             role = importer.get('role', '') or importer.get('product_description', '')
-            product = importer.get('product', '')
-            country = importer.get('country', '')
+            product = importer.get('product', '') or ''
+            country = normalize_country(importer.get('country', ''))
             wa_status = "✅ Tersedia" if importer.get('wa_available') else "❌ Tidak Tersedia"
-    
+
             # Build message without formatting tags
-            message_parts = []
-            message_parts.append(f"🏢 {name}")
-            message_parts.append(f"Peran: {role}")
-    
+            message_parts = [f"🏢 {name}", f"Peran: {role}"]
+
             if role == 'Importer':
-                import_status = "Ya" if product.startswith('ID ') else "Tidak"
+                import_status = "Ya" if importer.get('origin') == 'ID' else "Tidak"
                 message_parts.append(f"Pernah Impor dari Indonesia?: {import_status}")
-    
+
             country_emoji = Messages.get_country_emoji(country)
             message_parts.append(f"🌏 Negara: {country_emoji} {country}")
-    
-            hs_code = product.replace('ID ', '').replace('WW ', '') if product else ''
+
+            # product keeps its 'ID '/'WW ' prefix when origin was split out of it
+            hs_code = importer.get('hs_code') or (product[3:] if importer.get('origin') else product)
             if hs_code:
                 message_parts.append(f"📦 Kode HS/Product: {hs_code}")
-    
+
             if phone:
                 message_parts.append(f"📱 Kontak: {phone}")
             if email:
                 message_parts.append(f"📧 Email: {email}")
             if website:
-                clean_url = website.strip()
-                if '//' in clean_url:
-                    base_url = clean_url.split('/')[0] + '//' + clean_url.split('/')[2]
-                    message_parts.append(f"🌐 Website: {base_url}")
-                else:
-                    message_parts.append(f"🌐 Website: {clean_url}")
-    
+                message_parts.append(f"🌐 Website: {_base_url(website)}")
+
             message_parts.append(f"📱 WhatsApp: {wa_status}")
             whatsapp_number = Messages._format_phone_for_whatsapp(importer.get('contact', ''))
             callback_data = None
-            
+
             if not saved:
                 credit_cost = Messages._calculate_credit_cost(importer)
                 message_parts.append("\n💳 Biaya kredit yang diperlukan:")
-                cost_text = {
-                    3: "3 kredit - Kontak lengkap dengan WhatsApp",
-                    2: "2 kredit - Kontak lengkap tanpa WhatsApp",
-                    1: "1 kredit - Kontak tidak lengkap tanpa WhatsApp"
-                }.get(credit_cost, "1 kredit - Kontak tidak lengkap tanpa WhatsApp")
-                message_parts.append(cost_text)
+                message_parts.append(CREDIT_COST_TEXT.get(credit_cost, CREDIT_COST_TEXT[1]))
                 message_parts.append("\n💡 Simpan kontak untuk melihat informasi lengkap")
-            else:
-                saved_at = importer.get('saved_at', '')
-                message_parts.append(f"📅 Disimpan pada: {saved_at}")
-    
+
             message_text = '\n'.join(message_parts)
             return message_text, whatsapp_number, callback_data
-    
+
         except Exception as e:
             logging.error(f"Error formatting importer: {str(e)}", exc_info=True)
             raise
@@ -0,0 +1,276 @@
+"""Schema setup, run once per deploy before the bot starts:
+
+    python migrate.py          # bot and importer tables
+    python migrate.py --orm    # also the Flask models and sample data
+"""
+import logging
+import sys
+from sqlalchemy import text
+from db_pool import get_engine
+
+
+def create_bot_tables(engine) -> None:
+    """Create the tables and indexes the bot reads and writes"""
+    try:
+        # Don't drop tables on init, only create if not exists
+        # A save is (user_id, importer_id); contact details are read from
+        # importers. The copied columns only hold contacts saved before
+        # importer_id existed that could not be linked to an importer.
+        create_saved_contacts_sql = """
+        CREATE TABLE IF NOT EXISTS saved_contacts (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            importer_id INTEGER,
+            price_paid NUMERIC(10,1),
+            saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            importer_name VARCHAR(255),
+            country VARCHAR(100),
+            phone VARCHAR(50),
+            email VARCHAR(255),
+            website TEXT,
+            wa_availability BOOLEAN,
+            hs_code VARCHAR(255),
+            product_description TEXT,
+            role VARCHAR(50)
+        );
+        """
+
+        # Importer each unlinked copy was saved from: the row with its name
+        # and product (the copy kept the product in hs_code), else the only
+        # row with its name. Importer names repeat once per product, so a
+        # name alone is not trusted when it is ambiguous.
+        legacy_matches_sql = """
+            SELECT sc.id, sc.user_id, sc.saved_at,
+                   COALESCE(by_product.id, by_name.id) AS importer_id
+            FROM saved_contacts sc
+            LEFT JOIN (
+                SELECT name, product, MIN(id) AS id FROM importers GROUP BY name, product
+            ) by_product
+                ON by_product.name = sc.importer_name AND by_product.product = TRIM(sc.hs_code)
+            LEFT JOIN (
+                SELECT name, MIN(id) AS id FROM importers GROUP BY name HAVING COUNT(*) = 1
+            ) by_name
+                ON by_name.name = sc.importer_name
+            WHERE sc.importer_id IS NULL
+        """
+
+        # Normalize rows saved as copies. Saves of the same importer (linked,
+        # or a copy matched to it) are deduplicated first, keeping the
+        # earliest; the remaining copies are then linked and their copied
+        # values dropped. Copies without a match keep their values. Every
+        # step is a no-op on a re-run.
+        normalize_saved_contacts_sql = f"""
+        ALTER TABLE saved_contacts ADD COLUMN IF NOT EXISTS importer_id INTEGER;
+        ALTER TABLE saved_contacts ADD COLUMN IF NOT EXISTS price_paid NUMERIC(10,1);
+        ALTER TABLE saved_contacts ALTER COLUMN importer_name DROP NOT NULL;
+
+        DELETE FROM saved_contacts
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY user_id, importer_id ORDER BY saved_at, id) AS copy
+                FROM (
+                    SELECT id, user_id, saved_at, importer_id
+                    FROM saved_contacts WHERE importer_id IS NOT NULL
+                    UNION ALL
+                    {legacy_matches_sql}
+                ) resolved
+                WHERE importer_id IS NOT NULL
+            ) ranked
+            WHERE copy > 1
+        );
+
+        UPDATE saved_contacts sc
+        SET importer_id = legacy.importer_id
+        FROM ({legacy_matches_sql}) legacy
+        WHERE sc.id = legacy.id AND legacy.importer_id IS NOT NULL;
+
+        DROP INDEX IF EXISTS idx_saved_contacts_user_importer;
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_saved_contacts_user_importer
+        ON saved_contacts (user_id, importer_id) INCLUDE (saved_at, price_paid);
+
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'fk_saved_contacts_importer'
+            ) THEN
+                ALTER TABLE saved_contacts
+                ADD CONSTRAINT fk_saved_contacts_importer
+                FOREIGN KEY (importer_id) REFERENCES importers (id);
+            END IF;
+        END $$;
+
+        UPDATE saved_contacts
+        SET importer_name = NULL, country = NULL, phone = NULL, email = NULL,
+            website = NULL, wa_availability = NULL, hs_code = NULL,
+            product_description = NULL, role = NULL
+        WHERE importer_id IS NOT NULL AND importer_name IS NOT NULL;
+        """
+
+        create_user_stats_sql = """
+        CREATE TABLE IF NOT EXISTS user_stats (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            command VARCHAR(50) NOT NULL,
+            usage_count INTEGER DEFAULT 1,
+            last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, command)
+        );
+        """
+
+        create_credit_orders_sql = """
+        CREATE TABLE IF NOT EXISTS credit_orders (
+            id SERIAL PRIMARY KEY,
+            order_id VARCHAR(50) NOT NULL UNIQUE,
+            user_id BIGINT NOT NULL,
+            credits INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            fulfilled_at TIMESTAMP
+        );
+        """
+
+        # Partial index backing the admin pending-order queue
+        create_pending_orders_index_sql = """
+        CREATE INDEX IF NOT EXISTS idx_credit_orders_pending
+        ON credit_orders (created_at, id)
+        WHERE status = 'pending';
+        """
+
+        create_telegram_users_sql = """
+        CREATE TABLE IF NOT EXISTS telegram_users (
+            user_id BIGINT PRIMARY KEY,
+            username VARCHAR(255),
+            first_name VARCHAR(255),
+            last_name VARCHAR(255),
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+
+        # Outbound messages not yet delivered by the notifier
+        create_notification_queue_sql = """
+        CREATE TABLE IF NOT EXISTS notification_queue (
+            key VARCHAR(32) PRIMARY KEY,
+            chat_id BIGINT NOT NULL,
+            text TEXT NOT NULL,
+            options JSONB,
+            priority SMALLINT NOT NULL DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+
+        create_bot_settings_sql = """
+        CREATE TABLE IF NOT EXISTS bot_settings (
+            key VARCHAR(100) PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+
+        create_user_credits_sql = """
+        DO $$ 
+        BEGIN
+            CREATE TABLE IF NOT EXISTS user_credits (
+                id SERIAL PRIMARY KEY,
+                user_id BIGINT NOT NULL UNIQUE,
+                credits NUMERIC(10,1) NOT NULL DEFAULT 3.0 CHECK (credits >= 0),
+                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                has_redeemed_free_credits BOOLEAN DEFAULT FALSE,
+                CONSTRAINT positive_credits CHECK (credits >= 0)
+            );
+
+            -- Add has_redeemed_free_credits column if it doesn't exist
+            IF NOT EXISTS (
+                SELECT 1 
+                FROM information_schema.columns 
+                WHERE table_name='user_credits' 
+                AND column_name='has_redeemed_free_credits'
+            ) THEN
+                ALTER TABLE user_credits 
+                ADD COLUMN has_redeemed_free_credits BOOLEAN DEFAULT FALSE;
+            END IF;
+        END $$;
+        """
+
+        # Product menus; edit rows, then run `python catalog.py` to publish
+        create_product_categories_sql = """
+        CREATE TABLE IF NOT EXISTS product_categories (
+            id SERIAL PRIMARY KEY,
+            side VARCHAR(10) NOT NULL CHECK (side IN ('supplier', 'buyer')),
+            category VARCHAR(100) NOT NULL,
+            category_emoji VARCHAR(16),
+            category_position INTEGER NOT NULL DEFAULT 0,
+            name VARCHAR(100) NOT NULL,
+            emoji VARCHAR(16),
+            search_term VARCHAR(255) NOT NULL,
+            position INTEGER NOT NULL DEFAULT 0,
+            active BOOLEAN NOT NULL DEFAULT TRUE,
+            UNIQUE (side, category, name)
+        );
+        """
+
+        # Menu search term -> matching importer ids, maintained by csv_importer
+        create_search_term_index_sql = """
+        CREATE TABLE IF NOT EXISTS search_term_index (
+            term VARCHAR(255) PRIMARY KEY,
+            importer_ids INTEGER[] NOT NULL DEFAULT '{}',
+            exporter_count INTEGER NOT NULL DEFAULT 0,
+            importer_count INTEGER NOT NULL DEFAULT 0,
+            refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+
+        # HS code descriptions, loaded with `python hs_codes.py load`
+        create_hs_codes_sql = """
+        CREATE TABLE IF NOT EXISTS hs_codes (
+            code VARCHAR(10) PRIMARY KEY CHECK (code ~ '^[0-9]{2,10}$'),
+            description TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_hs_codes_code_pattern
+        ON hs_codes (code text_pattern_ops);
+        """
+
+        with engine.connect() as conn:
+            conn.execute(text(create_saved_contacts_sql))
+            conn.execute(text(normalize_saved_contacts_sql))
+            conn.execute(text(create_user_stats_sql))
+            conn.execute(text(create_user_credits_sql))
+            conn.execute(text(create_credit_orders_sql))
+            conn.execute(text(create_pending_orders_index_sql))
+            conn.execute(text(create_telegram_users_sql))
+            conn.execute(text(create_notification_queue_sql))
+            conn.execute(text(create_bot_settings_sql))
+            conn.execute(text(create_product_categories_sql))
+            conn.execute(text(create_search_term_index_sql))
+            conn.execute(text(create_hs_codes_sql))
+            conn.commit()
+            logging.info("Tables initialized successfully")
+    except Exception as e:
+        logging.error(f"Error creating tables: {str(e)}", exc_info=True)
+        raise
+
+
+def migrate(engine, orm: bool = False) -> None:
+    """Apply every idempotent schema step"""
+    from csv_importer import create_tables as create_importer_tables
+    from catalog import seed_catalog
+    from search_index import rebuild_search_index
+
+    create_importer_tables(engine)
+    create_bot_tables(engine)
+    with engine.begin() as conn:
+        seeded = seed_catalog(conn)
+        # Full rebuild picks up catalog terms added since the last deploy
+        rebuild_search_index(conn)
+    logging.info(f"Seeded {seeded} catalog products; search term index rebuilt")
+    if orm:
+        from app import init_database
+        init_database()
+
+
+if __name__ == "__main__":
+    from logging_config import setup_logging
+    setup_logging()
+    migrate(get_engine(), orm='--orm' in sys.argv[1:])
+    logging.info("Migrations complete")
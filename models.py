@@ -10,7 +10,9 @@ class Importer(db.Model):
     email_1 = db.Column(db.String(255))
     email_2 = db.Column(db.String(255))
     product = db.Column(db.String(50))
-    wa_availability = db.Column(db.String(50))
+    origin = db.Column(db.String(2))
+    hs_code = db.Column(db.String(10))
+    wa_available = db.Column(db.Boolean, nullable=False, default=False)
     status = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -39,6 +41,8 @@ class SavedContact(db.Model):
     contact = db.Column(db.String(50))
     email = db.Column(db.String(255))
     website = db.Column(db.Text)
+    # Copied flag of a legacy save; the bot's saved_contacts keeps it only on
+    # rows not linked to an importer (importers.wa_available is the live one)
     wa_availability = db.Column(db.Boolean)
     hs_code = db.Column(db.String(10))
     product_description = db.Column(db.Text)
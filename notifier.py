@@ -0,0 +1,301 @@
+import asyncio
+import itertools
+import json
+import logging
+import time
+import uuid
+from typing import Dict, List, Optional
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+import queries
+from env import env_int, env_float
+
+# Telegram allows roughly 30 messages per second per bot; stay below it
+NOTIFY_RATE = env_float('NOTIFY_RATE', 25)
+# ...and about one message per second to a single private chat,
+# twenty per minute to a group
+CHAT_RATE = 1.0
+GROUP_RATE = 20 / 60
+NOTIFY_CONCURRENCY = env_int('NOTIFY_CONCURRENCY', 8)
+NOTIFY_MAX_ATTEMPTS = 3
+# Seconds between writes of queued/delivered notifications to the database
+PERSIST_INTERVAL = 1.0
+
+PRIORITY_HIGH = 0      # transactional: credits, invites, admin alerts
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2      # broadcasts
+
+INSERT_NOTIFICATIONS = queries.register('insert_notifications', """
+    INSERT INTO notification_queue (key, chat_id, text, options, priority)
+    SELECT key, chat_id, text, CAST(options AS JSONB), priority
+    FROM unnest(
+        CAST(:keys AS VARCHAR[]),
+        CAST(:chat_ids AS BIGINT[]),
+        CAST(:texts AS TEXT[]),
+        -- Prepared, $n only gets assignment casts, and text[] has none to
+        -- jsonb[]: pass text and cast each element
+        CAST(:options AS TEXT[]),
+        CAST(:priorities AS SMALLINT[])
+    ) AS queued(key, chat_id, text, options, priority)
+    ON CONFLICT (key) DO NOTHING
+""")
+
+DELETE_NOTIFICATIONS = queries.register('delete_notifications', """
+    DELETE FROM notification_queue WHERE key = ANY(:keys)
+""")
+
+LOAD_NOTIFICATIONS = queries.register('load_notifications', """
+    SELECT key, chat_id, text, options, priority
+    FROM notification_queue
+    ORDER BY priority, created_at
+""", prepare=False)
+
+BROADCAST_RECIPIENTS = queries.register('broadcast_recipients', """
+    SELECT user_id FROM user_credits
+""", prepare=False)
+
+
+def retry_after_seconds(delay) -> float:
+    """RetryAfter.retry_after is an int or a timedelta depending on the PTB version"""
+    return delay.total_seconds() if hasattr(delay, 'total_seconds') else float(delay)
+
+
+class TokenBucket:
+    """Allow rate events per second with bursts of up to capacity"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Consume a token, or return the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def idle(self) -> bool:
+        return time.monotonic() - self.updated > self.capacity / self.rate
+
+
+class Notification:
+    __slots__ = ('key', 'chat_id', 'text', 'kwargs', 'priority')
+
+    def __init__(self, chat_id: int, text: str, kwargs: Dict, priority: int, key: Optional[str] = None):
+        self.key = key or uuid.uuid4().hex
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.priority = priority
+
+    def options(self) -> str:
+        """kwargs as JSON for the persistent queue"""
+        options = dict(self.kwargs)
+        if isinstance(options.get('reply_markup'), InlineKeyboardMarkup):
+            options['reply_markup'] = options['reply_markup'].to_dict()
+        return json.dumps(options)
+
+
+class Notifier:
+    """Prioritised, paced and persistent sender for outbound bot messages"""
+
+    def __init__(self, engine=None, rate: float = NOTIFY_RATE):
+        self.engine = engine
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._sequence = itertools.count()
+        self._global = TokenBucket(rate, capacity=rate)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._slots = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+        self._resume_at = 0.0
+        self._deferred = 0
+        self._task: Optional[asyncio.Task] = None
+        self._persist_task: Optional[asyncio.Task] = None
+        # Keys queued but not yet written, and keys finished since the last write
+        self._unsaved: Dict[str, Notification] = {}
+        self._finished: List[str] = []
+        self.bot = None
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    async def start(self, bot) -> None:
+        """Reload sends left over from the last run and begin delivering"""
+        self.bot = bot
+        if self.engine is not None:
+            try:
+                restored = await asyncio.to_thread(self._load)
+                if restored:
+                    logging.info(f"Restored {restored} pending notifications")
+            except Exception as e:
+                logging.error(f"Error restoring notifications: {str(e)}", exc_info=True)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.persist()
+
+    def send(self, chat_id: int, text: str, priority: int = PRIORITY_NORMAL, **kwargs) -> None:
+        """Queue a message; kwargs are passed to bot.send_message"""
+        notification = Notification(chat_id, text, kwargs, priority)
+        if self.engine is not None:
+            self._unsaved[notification.key] = notification
+            self._schedule_persist()
+        self._enqueue(notification)
+
+    async def broadcast(self, text: str, **kwargs) -> int:
+        """Queue text for every user with a credit account at bulk priority"""
+        user_ids = await asyncio.to_thread(self._recipients)
+        for user_id in user_ids:
+            self.send(user_id, text, priority=PRIORITY_BULK, **kwargs)
+        return len(user_ids)
+
+    def _recipients(self) -> List[int]:
+        with self.engine.connect() as conn:
+            return BROADCAST_RECIPIENTS.execute(conn).scalars().all()
+
+    def _enqueue(self, notification: Notification) -> None:
+        self._queue.put_nowait((notification.priority, next(self._sequence), notification))
+
+    def _requeue(self, notification: Notification) -> None:
+        self._deferred -= 1
+        self._enqueue(notification)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle()}
+            bucket = TokenBucket(GROUP_RATE if chat_id < 0 else CHAT_RATE)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, notification = await self._queue.get()
+
+            # A busy chat must not hold up everyone else behind it
+            wait = self._chat_bucket(notification.chat_id).take()
+            if wait > 0:
+                self._deferred += 1
+                loop.call_later(wait, self._requeue, notification)
+                continue
+
+            while True:
+                pause = self._resume_at - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                    continue
+                wait = self._global.take()
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+
+            await self._slots.acquire()
+            task = loop.create_task(self._deliver(notification))
+            task.add_done_callback(lambda _: self._slots.release())
+
+    async def _deliver(self, notification: Notification) -> None:
+        for attempt in range(1, NOTIFY_MAX_ATTEMPTS + 1):
+            try:
+                await self.bot.send_message(
+                    chat_id=notification.chat_id, text=notification.text, **notification.kwargs)
+                self.sent += 1
+                break
+            except RetryAfter as e:
+                # Flood control applies to the whole bot: pause every send
+                self.retried += 1
+                delay = retry_after_seconds(e.retry_after)
+                self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                await asyncio.sleep(delay)
+            except (Forbidden, BadRequest) as e:
+                # Blocked bot, deleted account, bad markup: retrying will not help
+                logging.warning(f"Dropping notification to {notification.chat_id}: {str(e)}")
+                self.failed += 1
+                break
+            except NetworkError as e:
+                self.retried += 1
+                logging.warning(f"Notification to {notification.chat_id} failed (attempt {attempt}): {str(e)}")
+                await asyncio.sleep(2 ** attempt)
+            except TelegramError as e:
+                # Migrated chat, revoked token and the like: give up on this send
+                logging.error(f"Dropping notification to {notification.chat_id}: {str(e)}")
+                self.failed += 1
+                break
+            except Exception as e:
+                logging.error(f"Error sending notification to {notification.chat_id}: {str(e)}", exc_info=True)
+                self.failed += 1
+                break
+        else:
+            self.failed += 1
+
+        if self.engine is not None:
+            if self._unsaved.pop(notification.key, None) is None:
+                self._finished.append(notification.key)
+                self._schedule_persist()
+
+    def _schedule_persist(self) -> None:
+        if self._persist_task is None or self._persist_task.done():
+            self._persist_task = asyncio.get_running_loop().create_task(self._persist_later())
+
+    async def _persist_later(self) -> None:
+        await asyncio.sleep(PERSIST_INTERVAL)
+        await self.persist()
+
+    async def persist(self) -> None:
+        """Write newly queued sends and drop delivered ones in one transaction"""
+        if self.engine is None or not (self._unsaved or self._finished):
+            return
+        unsaved, self._unsaved = list(self._unsaved.values()), {}
+        finished, self._finished = self._finished, []
+        try:
+            await asyncio.to_thread(self._save, unsaved, finished)
+        except Exception as e:
+            logging.error(f"Error persisting notifications: {str(e)}", exc_info=True)
+            self._unsaved.update((notification.key, notification) for notification in unsaved)
+            self._finished.extend(finished)
+
+    def _save(self, unsaved: List[Notification], finished: List[str]) -> None:
+        with self.engine.begin() as conn:
+            if unsaved:
+                INSERT_NOTIFICATIONS.execute(conn, {
+                    "keys": [notification.key for notification in unsaved],
+                    "chat_ids": [notification.chat_id for notification in unsaved],
+                    "texts": [notification.text for notification in unsaved],
+                    "options": [notification.options() for notification in unsaved],
+                    "priorities": [notification.priority for notification in unsaved]
+                })
+            if finished:
+                DELETE_NOTIFICATIONS.execute(conn, {"keys": finished})
+
+    def _load(self) -> int:
+        with self.engine.connect() as conn:
+            rows = LOAD_NOTIFICATIONS.execute(conn).fetchall()
+        for row in rows:
+            kwargs = dict(row.options or {})
+            if kwargs.get('reply_markup'):
+                kwargs['reply_markup'] = InlineKeyboardMarkup.de_json(kwargs['reply_markup'], self.bot)
+            self._enqueue(Notification(row.chat_id, row.text, kwargs, row.priority, key=row.key))
+        return len(rows)
+
+    def stats(self) -> Dict:
+        return {
+            'queued': self._queue.qsize(),
+            'deferred': self._deferred,
+            'unsaved': len(self._unsaved),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried
+        }
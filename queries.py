@@ -0,0 +1,460 @@
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError
+
+_BIND_PARAM = re.compile(r"(?<![:\w]):(\w+)")
+
+
+def _prepared_statements_enabled() -> bool:
+    """SQL-level PREPARE does not survive transaction-mode poolers (pgbouncer)"""
+    setting = os.environ.get('DB_PREPARED_STATEMENTS', 'auto').lower()
+    if setting == 'auto':
+        return '-pooler' not in os.environ.get('DATABASE_URL', '')
+    return setting in ('1', 'true', 'yes', 'on')
+
+
+PREPARED_STATEMENTS = _prepared_statements_enabled()
+
+# EXECUTE errors after which the statement is prepared again:
+# invalid_sql_statement_name (the server lost it) and feature_not_supported
+# ("cached plan must not change result type" after a column type change)
+REPREPARE_ERRORS = ('26000', '0A000')
+
+
+class Query:
+    """A named statement compiled once and prepared once per connection"""
+
+    def __init__(self, name: str, sql: str, prepare: bool = True):
+        self.name = name
+        self.sql = sql
+        self.statement = text(sql)
+        self.prepare = prepare
+
+        # PREPARE needs positional $n placeholders; remember the name order
+        self.param_names: List[str] = []
+
+        def _positional(match):
+            param = match.group(1)
+            if param not in self.param_names:
+                self.param_names.append(param)
+            return f"${self.param_names.index(param) + 1}"
+
+        self.prepare_sql = f"PREPARE {name} AS {_BIND_PARAM.sub(_positional, sql)}"
+        args = ', '.join(f":{param}" for param in self.param_names)
+        self.execute_statement = text(f"EXECUTE {name}({args})" if args else f"EXECUTE {name}")
+
+        self._lock = threading.Lock()
+        self.prepared_executions = 0
+        self.plain_executions = 0
+        self.prepares = 0
+        self.prepare_failures = 0
+
+    def execute(self, conn, params: Optional[Dict] = None):
+        """Execute through the connection's prepared statement when available"""
+        params = params or {}
+        info = conn.connection.info
+        prepared = info.get('prepared_statements', ())
+        stale = info.setdefault('stale_statements', set())
+        if self.prepare and self.name in stale and not conn.in_transaction():
+            self._reprepare(conn)
+        if not (self.prepare and self.name in prepared):
+            self._count('plain_executions')
+            return conn.execute(self.statement, params)
+
+        self._count('prepared_executions')
+        # Only a statement that opens the transaction can be retried
+        # without losing the caller's earlier work
+        opens_transaction = not conn.in_transaction()
+        try:
+            return conn.execute(self.execute_statement, params)
+        except DBAPIError as e:
+            if getattr(e.orig, 'pgcode', None) not in REPREPARE_ERRORS:
+                raise
+            prepared.discard(self.name)
+            stale.add(self.name)
+            if not opens_transaction:
+                # Re-prepared by a later call made outside a transaction
+                raise
+        conn.rollback()
+        if self._reprepare(conn):
+            return conn.execute(self.execute_statement, params)
+        return conn.execute(self.statement, params)
+
+    def _reprepare(self, conn) -> bool:
+        """Replace the connection's copy of the statement; call outside a transaction"""
+        info = conn.connection.info
+        info.setdefault('stale_statements', set()).discard(self.name)
+        dbapi_connection = conn.connection.dbapi_connection
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s", (self.name,))
+            if cursor.fetchone():
+                cursor.execute(f"DEALLOCATE {self.name}")
+            cursor.execute(self.prepare_sql)
+            dbapi_connection.commit()
+        except Exception as e:
+            dbapi_connection.rollback()
+            self._count('prepare_failures')
+            logging.error(f"Could not re-prepare {self.name}: {str(e)}")
+            return False
+        finally:
+            cursor.close()
+        info.setdefault('prepared_statements', set()).add(self.name)
+        self._count('prepares')
+        return True
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            executions = self.prepared_executions + self.plain_executions
+            return {
+                'executions': executions,
+                'prepared_executions': self.prepared_executions,
+                'hit_ratio': round(self.prepared_executions / executions, 3) if executions else 0.0,
+                'prepares': self.prepares,
+                'prepare_failures': self.prepare_failures
+            }
+
+
+QUERIES: Dict[str, Query] = {}
+
+
+def register(name: str, sql: str, prepare: bool = True) -> Query:
+    """Add a named statement to the registry"""
+    if name in QUERIES:
+        raise ValueError(f"Query {name} is already registered")
+    query = Query(name, sql, prepare)
+    QUERIES[name] = query
+    return query
+
+
+def _prepare_all(dbapi_connection, connection_record) -> None:
+    """Prepare every registered statement on a freshly opened connection"""
+    prepared = set()
+    connection_record.info['prepared_statements'] = prepared
+    candidates = [query for query in QUERIES.values() if query.prepare]
+    if not candidates:
+        return
+
+    cursor = dbapi_connection.cursor()
+    try:
+        # One round trip for the whole batch in the common case
+        cursor.execute(';\n'.join(query.prepare_sql for query in candidates))
+        dbapi_connection.commit()
+        prepared.update(query.name for query in candidates)
+        for query in candidates:
+            query._count('prepares')
+    except Exception as e:
+        dbapi_connection.rollback()
+        logging.warning(f"Batch PREPARE failed, preparing statements one by one: {str(e)}")
+        for query in candidates:
+            try:
+                cursor.execute(query.prepare_sql)
+                dbapi_connection.commit()
+                prepared.add(query.name)
+                query._count('prepares')
+            except Exception as query_error:
+                dbapi_connection.rollback()
+                query._count('prepare_failures')
+                logging.error(f"Could not prepare {query.name}: {str(query_error)}")
+    finally:
+        cursor.close()
+
+
+def install(engine) -> None:
+    """Prepare registered statements on every new connection of engine"""
+    if not PREPARED_STATEMENTS or getattr(engine, '_queries_installed', False):
+        return
+    event.listen(engine, "connect", _prepare_all)
+    engine._queries_installed = True
+    logging.info(f"Prepared statements enabled for {len(QUERIES)} registered queries")
+
+
+def query_stats() -> Dict[str, Dict]:
+    """Per-query execution and prepare counters"""
+    return {name: query.stats() for name, query in QUERIES.items()}
+
+
+# Credits
+GET_USER_CREDITS = register('get_user_credits', """
+    SELECT credits FROM user_credits WHERE user_id = :user_id
+""")
+
+INSERT_USER_CREDITS = register('insert_user_credits', """
+    INSERT INTO user_credits (user_id, credits)
+    VALUES (:user_id, :credits)
+    RETURNING credits
+""")
+
+USE_CREDIT = register('use_credit', """
+    WITH credit_update AS (
+        UPDATE user_credits
+        SET credits = ROUND(CAST(credits - :amount AS NUMERIC), 1),
+            last_updated = CURRENT_TIMESTAMP
+        WHERE user_id = :user_id AND credits >= :amount
+        RETURNING credits
+    )
+    SELECT credits FROM credit_update
+""")
+
+ADD_CREDITS = register('add_credits', """
+    INSERT INTO user_credits (user_id, credits)
+    VALUES (:user_id, :amount)
+    ON CONFLICT (user_id)
+    DO UPDATE SET
+        credits = user_credits.credits + :amount,
+        last_updated = CURRENT_TIMESTAMP
+    RETURNING credits
+""")
+
+REDEEM_FREE_CREDITS = register('redeem_free_credits', """
+    INSERT INTO user_credits (user_id, credits, has_redeemed_free_credits)
+    VALUES (:user_id, 20, true)
+    ON CONFLICT (user_id)
+    DO UPDATE SET
+        credits = user_credits.credits + 10,
+        has_redeemed_free_credits = true,
+        last_updated = CURRENT_TIMESTAMP
+    WHERE NOT COALESCE(user_credits.has_redeemed_free_credits, false)
+    RETURNING credits
+""")
+
+LOCK_USER_CREDITS = register('lock_user_credits', """
+    SELECT credits FROM user_credits WHERE user_id = :user_id FOR UPDATE
+""")
+
+DEDUCT_CREDITS = register('deduct_credits', """
+    UPDATE user_credits
+    SET credits = ROUND(CAST(credits - :credit_cost AS NUMERIC), 1),
+        last_updated = CURRENT_TIMESTAMP
+    WHERE user_id = :user_id
+    RETURNING credits
+""")
+
+# Saved contacts
+# Returns no row when the user already saved this importer
+INSERT_SAVED_CONTACT = register('insert_saved_contact', """
+    INSERT INTO saved_contacts (user_id, importer_id, price_paid)
+    VALUES (:user_id, :importer_id, :price_paid)
+    ON CONFLICT (user_id, importer_id) DO NOTHING
+    RETURNING id
+""")
+
+# Current importer data, or the copied values of unlinked legacy saves.
+# saved_contacts.wa_availability is one of those copies (a boolean,
+# cleared once the row is linked); importers.wa_available is the live flag.
+GET_SAVED_CONTACTS = register('get_saved_contacts', """
+    SELECT
+        sc.id,
+        sc.importer_id,
+        COALESCE(i.name, sc.importer_name) AS importer_name,
+        COALESCE(i.country, sc.country) AS country,
+        COALESCE(i.phone, sc.phone) AS phone,
+        COALESCE(i.email_1, sc.email) AS email,
+        COALESCE(i.website, sc.website) AS website,
+        COALESCE(i.wa_available, sc.wa_availability) AS wa_available,
+        sc.saved_at,
+        sc.price_paid,
+        COALESCE(i.product, sc.hs_code) AS product,
+        i.origin,
+        i.hs_code,
+        COALESCE(CAST(i.role AS TEXT), sc.product_description) AS product_description,
+        COALESCE(CAST(i.role AS TEXT), sc.role) AS role
+    FROM saved_contacts sc
+    LEFT JOIN importers i ON i.id = sc.importer_id
+    WHERE sc.user_id = :user_id
+    ORDER BY sc.saved_at DESC
+""")
+
+GET_SAVED_IMPORTER_IDS = register('get_saved_importer_ids', """
+    SELECT importer_id FROM saved_contacts
+    WHERE user_id = :user_id AND importer_id IS NOT NULL
+""")
+
+# Usage statistics
+TRACK_USER_COMMAND = register('track_user_command', """
+    INSERT INTO user_stats (user_id, command, usage_count, last_used)
+    VALUES (:user_id, :command, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id, command)
+    DO UPDATE SET
+        usage_count = user_stats.usage_count + 1,
+        last_used = CURRENT_TIMESTAMP
+""")
+
+GET_USER_STATS = register('get_user_stats', """
+    SELECT command, usage_count
+    FROM user_stats
+    WHERE user_id = :user_id
+""")
+
+# Importers
+# Search candidates; results pages are sampled from these in memory
+MATCHING_IMPORTER_IDS = register('matching_importer_ids', """
+    SELECT id
+    FROM importers
+    WHERE LOWER(product) SIMILAR TO :pattern
+    AND phone IS NOT NULL AND phone != ''
+    AND country IS NOT NULL AND country != ''
+""")
+
+COUNT_CATEGORY_CONTACTS = register('count_category_contacts', """
+    SELECT COUNT(*) FROM importers
+    WHERE role = :role
+    AND LOWER(product) LIKE LOWER(:search)
+    AND phone IS NOT NULL
+    AND phone != ''
+""")
+
+# Settings
+GET_SETTING = register('get_setting', """
+    SELECT value FROM bot_settings WHERE key = :key
+""")
+
+SET_SETTING = register('set_setting', """
+    INSERT INTO bot_settings (key, value)
+    VALUES (:key, :value)
+    ON CONFLICT (key)
+    DO UPDATE SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP
+""")
+
+# Credit orders
+INSERT_CREDIT_ORDER = register('insert_credit_order', """
+    INSERT INTO credit_orders (order_id, user_id, credits, amount, status)
+    VALUES (:order_id, :user_id, :credits, :amount, 'pending')
+""")
+
+DELETE_CREDIT_ORDER = register('delete_credit_order', """
+    DELETE FROM credit_orders WHERE order_id = :order_id
+    RETURNING status
+""")
+
+# Pending -> fulfilled and the credit grant commit together; the row lock
+# taken by the UPDATE makes a concurrent second click match nothing
+FULFILL_ORDER = register('fulfill_order', """
+    WITH fulfilled AS (
+        UPDATE credit_orders
+        SET status = 'fulfilled',
+            fulfilled_at = CURRENT_TIMESTAMP
+        WHERE order_id = :order_id AND status = 'pending'
+        RETURNING user_id, credits
+    ), credited AS (
+        INSERT INTO user_credits (user_id, credits)
+        SELECT user_id, credits FROM fulfilled
+        ON CONFLICT (user_id)
+        DO UPDATE SET
+            credits = user_credits.credits + EXCLUDED.credits,
+            last_updated = CURRENT_TIMESTAMP
+        RETURNING user_id, credits
+    )
+    SELECT fulfilled.user_id, fulfilled.credits AS added, credited.credits AS balance
+    FROM fulfilled JOIN credited USING (user_id)
+""")
+
+# Batch reconciliation: every order in the list and the summed credits
+# per user in a single statement
+FULFILL_ORDERS = register('fulfill_orders', """
+    WITH fulfilled AS (
+        UPDATE credit_orders
+        SET status = 'fulfilled',
+            fulfilled_at = CURRENT_TIMESTAMP
+        WHERE order_id = ANY(:order_ids) AND status = 'pending'
+        RETURNING order_id, user_id, credits
+    ), totals AS (
+        SELECT user_id, SUM(credits) AS credits
+        FROM fulfilled
+        GROUP BY user_id
+    ), credited AS (
+        INSERT INTO user_credits (user_id, credits)
+        SELECT user_id, credits FROM totals
+        ON CONFLICT (user_id)
+        DO UPDATE SET
+            credits = user_credits.credits + EXCLUDED.credits,
+            last_updated = CURRENT_TIMESTAMP
+        RETURNING user_id, credits
+    )
+    SELECT totals.user_id, totals.credits AS added, credited.credits AS balance,
+           ARRAY_AGG(fulfilled.order_id) AS order_ids
+    FROM totals
+    JOIN credited USING (user_id)
+    JOIN fulfilled USING (user_id)
+    GROUP BY totals.user_id, totals.credits, credited.credits
+""")
+
+GRANT_CREDITS = register('grant_credits', """
+    INSERT INTO user_credits (user_id, credits)
+    SELECT user_id, SUM(amount)
+    FROM unnest(CAST(:user_ids AS BIGINT[]), CAST(:amounts AS INTEGER[])) AS grants(user_id, amount)
+    GROUP BY user_id
+    ON CONFLICT (user_id)
+    DO UPDATE SET
+        credits = user_credits.credits + EXCLUDED.credits,
+        last_updated = CURRENT_TIMESTAMP
+    RETURNING user_id, credits
+""")
+
+GET_ORDER_STATUS = register('get_order_status', """
+    SELECT status FROM credit_orders WHERE order_id = :order_id
+""")
+
+# Buttons sent before orders were addressed by id only carry user and credits
+FIND_PENDING_ORDER = register('find_pending_order', """
+    SELECT order_id FROM credit_orders
+    WHERE user_id = :user_id AND credits = :credits AND status = 'pending'
+    ORDER BY created_at, id
+    LIMIT 1
+""")
+
+COUNT_PENDING_ORDERS = register('count_pending_orders', """
+    SELECT COUNT(*) FROM credit_orders WHERE status = 'pending'
+""")
+
+# Pending-order queue, newest first, walked by (created_at, id) keyset
+# seeks on idx_credit_orders_pending; the neighbour flags drive the buttons
+_PENDING_ORDER_SQL = """
+    SELECT t.*,
+        EXISTS (
+            SELECT 1 FROM credit_orders n
+            WHERE n.status = 'pending' AND (n.created_at, n.id) > (t.created_at, t.id)
+        ) AS has_newer,
+        EXISTS (
+            SELECT 1 FROM credit_orders n
+            WHERE n.status = 'pending' AND (n.created_at, n.id) < (t.created_at, t.id)
+        ) AS has_older
+    FROM (
+        SELECT o.id, o.order_id, o.user_id, o.credits, o.amount, o.created_at
+        FROM credit_orders o
+        WHERE o.status = 'pending' {seek}
+        ORDER BY o.created_at {direction}, o.id {direction}
+        LIMIT 1
+    ) t
+"""
+
+_SEEK_FROM = "(SELECT created_at, id FROM credit_orders WHERE id = :cursor_id)"
+
+NEWEST_PENDING_ORDER = register('newest_pending_order', _PENDING_ORDER_SQL.format(
+    seek="", direction="DESC"))
+
+OLDER_PENDING_ORDER = register('older_pending_order', _PENDING_ORDER_SQL.format(
+    seek=f"AND (o.created_at, o.id) < {_SEEK_FROM}", direction="DESC"))
+
+NEWER_PENDING_ORDER = register('newer_pending_order', _PENDING_ORDER_SQL.format(
+    seek=f"AND (o.created_at, o.id) > {_SEEK_FROM}", direction="ASC"))
+
+# Buyers named in the orders export, resolved before the export streams
+ORDER_USER_IDS = register('order_user_ids', """
+    SELECT DISTINCT user_id FROM credit_orders
+""")
+
+# Exports stream through a server-side cursor, which cannot wrap EXECUTE
+EXPORT_CREDIT_ORDERS = register('export_credit_orders', """
+    SELECT order_id, user_id, credits, amount, status, created_at, fulfilled_at
+    FROM credit_orders
+    ORDER BY created_at DESC
+""", prepare=False)
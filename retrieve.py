@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from db_pool import create_db_engine
 from app import db
 
 def get_unique_role_product_pairs(database_url: Optional[str] = None) -> List[Tuple[str, str]]:
@@ -9,7 +10,7 @@ def get_unique_role_product_pairs(database_url: Optional[str] = None) -> List[Tu
     if not database_url:
         raise ValueError("DATABASE_URL environment variable not set")
 
-    engine = create_engine(database_url, pool_pre_ping=True)
+    engine = create_db_engine(database_url)
     unique_pairs = []
 
     with engine.connect() as conn:
@@ -0,0 +1,172 @@
+import logging
+import random
+import threading
+import time
+from typing import Collection, Dict, List, Optional, Tuple
+from cache import LRUCache
+import queries
+from env import env_float
+
+# Seconds the bot keeps the loaded index before re-reading it
+INDEX_TTL = 300
+# Seconds a scanned candidate pool (search outside the indexed menu terms)
+# is reused for further pages, repeat clicks and regenerate
+SEARCH_POOL_TTL = env_float('SEARCH_POOL_TTL', 120)
+
+
+# Same predicates as the scan in show_results (ids) and the menu counts
+# (per role), for every term in the product catalog; terms are stored
+# lower-cased
+_MATCHES_SQL = """
+    SELECT t.term,
+        COALESCE(
+            ARRAY_AGG(i.id ORDER BY i.id)
+                FILTER (WHERE i.country IS NOT NULL AND i.country != ''),
+            '{{}}'
+        ) AS importer_ids,
+        COUNT(i.id) FILTER (WHERE i.role = 'Exporter') AS exporter_count,
+        COUNT(i.id) FILTER (WHERE i.role = 'Importer') AS importer_count
+    FROM (SELECT DISTINCT LOWER(search_term) AS term FROM product_categories) t
+    LEFT JOIN importers i
+        ON LOWER(i.product) LIKE '%' || t.term || '%'
+        AND i.phone IS NOT NULL AND i.phone != ''
+        {extra}
+    GROUP BY t.term
+"""
+
+REBUILD_SEARCH_INDEX = queries.register('rebuild_search_index', f"""
+    INSERT INTO search_term_index (term, importer_ids, exporter_count, importer_count, refreshed_at)
+    SELECT term, importer_ids, exporter_count, importer_count, CURRENT_TIMESTAMP
+    FROM ({_MATCHES_SQL.format(extra='')}) matches
+    ON CONFLICT (term)
+    DO UPDATE SET
+        importer_ids = EXCLUDED.importer_ids,
+        exporter_count = EXCLUDED.exporter_count,
+        importer_count = EXCLUDED.importer_count,
+        refreshed_at = CURRENT_TIMESTAMP
+""", prepare=False)
+
+# Merge rows with id > :after_id (one load's inserts) into the lists
+EXTEND_SEARCH_INDEX = queries.register('extend_search_index', f"""
+    INSERT INTO search_term_index (term, importer_ids, exporter_count, importer_count, refreshed_at)
+    SELECT term, importer_ids, exporter_count, importer_count, CURRENT_TIMESTAMP
+    FROM ({_MATCHES_SQL.format(extra='AND i.id > :after_id')}) matches
+    ON CONFLICT (term)
+    DO UPDATE SET
+        importer_ids = ARRAY(
+            SELECT DISTINCT id
+            FROM unnest(search_term_index.importer_ids || EXCLUDED.importer_ids) AS id
+            ORDER BY id
+        ),
+        exporter_count = search_term_index.exporter_count + EXCLUDED.exporter_count,
+        importer_count = search_term_index.importer_count + EXCLUDED.importer_count,
+        refreshed_at = CURRENT_TIMESTAMP
+""", prepare=False)
+
+LOAD_SEARCH_INDEX = queries.register('load_search_index', """
+    SELECT term, importer_ids, exporter_count, importer_count
+    FROM search_term_index
+""")
+
+
+def rebuild_search_index(conn) -> None:
+    """Recompute every catalog term's id list and counts from importers"""
+    REBUILD_SEARCH_INDEX.execute(conn)
+
+
+def extend_search_index(conn, after_id: int) -> None:
+    """Add importers with id > after_id to the index"""
+    EXTEND_SEARCH_INDEX.execute(conn, {"after_id": after_id})
+
+
+class SearchIndex:
+    """Candidate id pools for searches, sampled in memory
+
+    Menu terms come from an in-process copy of search_term_index; any other
+    pattern is scanned once and its pool kept for SEARCH_POOL_TTL seconds.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._entries: Dict[str, Tuple[List[int], int, int]] = {}
+        # (pattern, filters) -> candidate ids; the filters (phone and country
+        # present) are fixed today but are part of what the pool means
+        self._pools = LRUCache(max_size=256, ttl=SEARCH_POOL_TTL)
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> Dict[str, Tuple[List[int], int, int]]:
+        with self._lock:
+            if self._entries and time.monotonic() - self._loaded_at < INDEX_TTL:
+                return self._entries
+            with self.engine.connect() as conn:
+                rows = LOAD_SEARCH_INDEX.execute(conn).fetchall()
+            self._entries = {
+                row.term: (row.importer_ids, row.exporter_count, row.importer_count)
+                for row in rows
+            }
+            self._loaded_at = time.monotonic()
+            return self._entries
+
+    def invalidate(self, ids=None) -> None:
+        with self._lock:
+            self._loaded_at = 0.0
+        self._pools.clear()
+
+    def _entry(self, term: str) -> Optional[Tuple[List[int], int, int]]:
+        try:
+            entry = self._load().get(term.lower())
+        except Exception as e:
+            logging.error(f"Error loading search index: {str(e)}", exc_info=True)
+            entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def candidates(self, term: str) -> List[int]:
+        """Every importer id a search for term may show"""
+        entry = self._entry(term)
+        if entry is not None:
+            return entry[0]
+
+        key = (term.lower(), 'phone,country')
+        ids = self._pools.get(key)
+        if ids is None:
+            with self.engine.connect() as conn:
+                ids = queries.MATCHING_IMPORTER_IDS.execute(conn, {
+                    "pattern": f"%{term.lower()}%"
+                }).scalars().all()
+            self._pools.set(key, ids)
+        return ids
+
+    def sample(self, term: str, limit: int = 10, exclude: Collection[int] = (),
+               avoid: Collection[int] = ()) -> List[int]:
+        """Random ids for term without any in exclude, and without those in
+        avoid while enough others remain"""
+        ids = self.candidates(term)
+        if exclude:
+            ids = [importer_id for importer_id in ids if importer_id not in exclude]
+        if avoid:
+            remaining = [importer_id for importer_id in ids if importer_id not in avoid]
+            if len(remaining) >= limit:
+                ids = remaining
+        return random.sample(ids, min(limit, len(ids)))
+
+    def count(self, term: str, role: str) -> Optional[int]:
+        """Contacts for term with role ('Exporter'/'Importer'), None when not indexed"""
+        entry = self._entry(term)
+        if entry is None:
+            return None
+        return entry[1] if role == 'Exporter' else entry[2]
+
+    def stats(self) -> Dict:
+        return {
+            'terms': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'pools': self._pools.stats()['size']
+        }
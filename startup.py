@@ -0,0 +1,63 @@
+import asyncio
+import importlib
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Iterable, List, Tuple
+
+# STARTUP_PROFILE=1 adds a per-module import breakdown to the startup timeline
+STARTUP_PROFILE = os.environ.get('STARTUP_PROFILE', 'false').lower() in ('1', 'true', 'yes', 'on')
+
+# Heaviest third-party imports first, so each app module's time is its own
+PROFILED_IMPORTS = (
+    'telegram',
+    'telegram.ext',
+    'sqlalchemy',
+    'psycopg2',
+    'db_pool',
+    'queries',
+    'messages',
+    'data_store',
+    'handlers',
+    'bot'
+)
+
+
+class StartupProfile:
+    """Timeline of named startup steps relative to process start"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.steps: List[Tuple[str, float, float]] = []
+
+    @contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, start - self.origin, time.perf_counter() - start))
+
+    async def timed(self, name: str, awaitable: Awaitable):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.steps.append((name, start - self.origin, time.perf_counter() - start))
+
+    async def gather(self, *steps: Tuple[str, Awaitable]) -> list:
+        """Run independent steps concurrently, timing each one"""
+        return await asyncio.gather(*(self.timed(name, awaitable) for name, awaitable in steps))
+
+    def import_modules(self, modules: Iterable[str] = PROFILED_IMPORTS) -> None:
+        """Import modules one at a time to attribute import cost"""
+        for module in modules:
+            with self.step(f"import {module}"):
+                importlib.import_module(module)
+
+    def report(self) -> str:
+        lines = [f"Startup timeline ({(time.perf_counter() - self.origin) * 1000:.0f} ms total):"]
+        for name, started, duration in sorted(self.steps, key=lambda step: step[1]):
+            lines.append(f"  {started * 1000:8.1f} ms  +{duration * 1000:7.1f} ms  {name}")
+        return '\n'.join(lines)
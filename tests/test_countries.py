@@ -0,0 +1,34 @@
+import pytest
+from countries import DEFAULT_FLAG, country_flag, normalize_country, resolve_country
+
+
+@pytest.mark.parametrize("value", [
+    "United States", "USA", "US", "u.s.a.", "  united   states of america ", "America"
+])
+def test_aliases_and_codes_resolve_to_canonical_name(value):
+    assert resolve_country(value) == ("United States", "🇺🇸")
+
+
+def test_accents_and_punctuation_are_ignored():
+    assert normalize_country("Cote d'Ivoire") == "Côte d'Ivoire"
+    assert normalize_country("Ivory Coast") == "Côte d'Ivoire"
+    assert normalize_country("viet nam") == "Vietnam"
+    assert normalize_country("Korea, Republic of") == "South Korea"
+
+
+def test_unknown_country_is_kept_stripped():
+    assert resolve_country("Atlantis") is None
+    assert normalize_country("  Atlantis ") == "Atlantis"
+    assert country_flag("Atlantis") == DEFAULT_FLAG
+
+
+@pytest.mark.parametrize("value", ["", None])
+def test_empty_country(value):
+    assert resolve_country(value) is None
+    assert normalize_country(value) == ""
+    assert country_flag(value) == DEFAULT_FLAG
+
+
+def test_flag_is_built_from_alpha2():
+    assert country_flag("Indonesia") == "🇮🇩"
+    assert country_flag("GBR") == "🇬🇧"
@@ -0,0 +1,38 @@
+import pytest
+from csv_importer import parse_product, process_csv_row
+
+
+@pytest.mark.parametrize("product, expected", [
+    ("WW 0901", ("WW", "0901")),
+    ("WW 44029010", ("WW", "44029010")),
+    ("id 1511", ("ID", "1511")),
+    ("ID Coffee", ("ID", None)),
+    ("0302", (None, "0302")),
+    (" Mangosteen", (None, None)),
+    ("ID", (None, None)),
+    ("", (None, None)),
+])
+def test_parse_product(product, expected):
+    assert parse_product(product) == expected
+
+
+def test_process_csv_row():
+    row = process_csv_row({
+        "Name": " PT Laut ", "Role": "Exporter", "Product": "WW 0302",
+        "Country": "Indonesia", "WA Availability": "Available",
+    })
+    assert row["name"] == "PT Laut"
+    assert row["role"] == "Exporter"
+    assert (row["product"], row["origin"], row["hs_code"]) == ("WW 0302", "WW", "0302")
+    assert row["wa_available"] is True
+
+
+def test_process_csv_row_unknown_role_and_no_whatsapp():
+    row = process_csv_row({"Name": "Acme", "Role": "Broker", "WA Availability": "Not Available"})
+    assert row["role"] is None
+    assert row["product"] is None
+    assert row["wa_available"] is False
+
+
+def test_process_csv_row_without_name():
+    assert process_csv_row({"Name": "  ", "Role": "Importer"}) is None
@@ -0,0 +1,33 @@
+import pytest
+from hs_codes import hs_digits, hs_prefix_filter
+
+
+@pytest.mark.parametrize("code, digits", [
+    ("0302.11", "030211"),
+    ("03", "03"),
+    (" 4402.90.10 ", "44029010"),
+    ("", ""),
+])
+def test_hs_digits(code, digits):
+    assert hs_digits(code) == digits
+
+
+def test_prefix_filter_one_clause_per_prefix():
+    params = {}
+    assert hs_prefix_filter(["03", "0302.11"], params) == \
+        "(hs_code LIKE :hs_prefix_0 OR hs_code LIKE :hs_prefix_1)"
+    assert params == {"hs_prefix_0": "03%", "hs_prefix_1": "030211%"}
+
+
+def test_prefix_filter_keeps_existing_params():
+    params = {"origin": "ID"}
+    assert hs_prefix_filter(("0301", "03.02"), params, column="i.hs_code") == \
+        "(i.hs_code LIKE :hs_prefix_1 OR i.hs_code LIKE :hs_prefix_2)"
+    assert params == {"origin": "ID", "hs_prefix_1": "0301%", "hs_prefix_2": "0302%"}
+
+
+def test_prefix_filter_without_digits_matches_nothing():
+    params = {}
+    assert hs_prefix_filter([], params) == "FALSE"
+    assert hs_prefix_filter(["", "HS"], params) == "FALSE"
+    assert params == {}
@@ -0,0 +1,51 @@
+import pytest
+import keyboards
+
+
+@pytest.mark.parametrize("data, expected", [
+    ("orders_next_42", ("older", 42)),
+    ("orders_prev_7", ("newer", 7)),
+    ("orders_next_", ("older", None)),
+    ("orders_prev_abc", ("newer", None)),
+    ("orders_next_-3", ("older", None)),
+])
+def test_parse_order_page(data, expected):
+    assert keyboards.parse_order_page(data) == expected
+
+
+def test_order_page_callback_round_trips():
+    for action, direction in (("next", "older"), ("prev", "newer")):
+        assert keyboards.parse_order_page(keyboards.order_page_callback(action, 1234)) == (direction, 1234)
+
+
+def callbacks(markup):
+    return [[button.callback_data for button in row] for row in markup.inline_keyboard]
+
+
+def test_search_pages_first_middle_last():
+    footer = [["regenerate_search"], ["back_to_categories"]]
+    assert callbacks(keyboards.search_pages(0, 3)) == [["page_info", "next_page"]] + footer
+    assert callbacks(keyboards.search_pages(1, 3)) == [["prev_page", "page_info", "next_page"]] + footer
+    assert callbacks(keyboards.search_pages(2, 3)) == [["prev_page", "page_info"]] + footer
+
+
+def test_search_pages_info_label():
+    assert keyboards.search_pages(1, 4).inline_keyboard[0][1].text == "2/4"
+
+
+def test_saved_pages_single_page_has_only_footer():
+    assert callbacks(keyboards.saved_pages(0, 1)) == [["export_saved_contacts"], ["back_to_main"]]
+
+
+def test_saved_pages_navigation():
+    rows = callbacks(keyboards.saved_pages(0, 2))
+    assert rows[0] == ["show_saved_page_info", "show_saved_next"]
+    rows = callbacks(keyboards.saved_pages(1, 2))
+    assert rows[0] == ["show_saved_prev", "show_saved_page_info"]
+    assert rows[1:] == [["export_saved_contacts"], ["back_to_main"]]
+
+
+def test_markups_are_cached():
+    assert keyboards.search_pages(0, 5) is keyboards.search_pages(0, 5)
+    assert keyboards.saved_pages(1, 3) is keyboards.saved_pages(1, 3)
+    assert keyboards.search_pages(0, 5) is not keyboards.search_pages(1, 5)
@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+import pytest
+import notifier
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(notifier.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_take_consumes_then_waits(clock):
+    bucket = notifier.TokenBucket(rate=2.0)
+    assert bucket.take() == 0.0
+    assert bucket.take() == pytest.approx(0.5)
+
+
+def test_take_refills_over_time(clock):
+    bucket = notifier.TokenBucket(rate=1.0)
+    assert bucket.take() == 0.0
+    clock[0] += 0.25
+    assert bucket.take() == pytest.approx(0.75)
+    clock[0] += 0.75
+    assert bucket.take() == 0.0
+
+
+def test_burst_is_capped_at_capacity(clock):
+    bucket = notifier.TokenBucket(rate=1.0, capacity=3.0)
+    clock[0] += 60
+    assert [bucket.take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take() == pytest.approx(1.0)
+
+
+def test_idle_after_a_full_refill(clock):
+    bucket = notifier.TokenBucket(rate=notifier.GROUP_RATE)
+    bucket.take()
+    clock[0] += 1 / notifier.GROUP_RATE
+    assert not bucket.idle()
+    clock[0] += 0.01
+    assert bucket.idle()
+
+
+@pytest.mark.parametrize("delay, seconds", [
+    (5, 5.0),
+    (timedelta(seconds=7, milliseconds=500), 7.5),
+])
+def test_retry_after_seconds(delay, seconds):
+    assert notifier.retry_after_seconds(delay) == seconds
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional
+from telegram.error import RetryAfter
+from cache import LRUCache
+from notifier import retry_after_seconds
+import queries
+from env import env_int, env_float
+
+# Concurrent get_chat calls while resolving unknown users; kept well under
+# Telegram's flood limits so exports never trip RetryAfter in practice
+RESOLVE_CONCURRENCY = env_int('PROFILE_RESOLVE_CONCURRENCY', 8)
+# Observed profile changes are written in one upsert per batch
+PROFILE_FLUSH_SIZE = env_int('PROFILE_FLUSH_SIZE', 100)
+PROFILE_FLUSH_INTERVAL = env_float('PROFILE_FLUSH_INTERVAL', 5)
+
+GET_TELEGRAM_USERS = queries.register('get_telegram_users', """
+    SELECT user_id, username, first_name, last_name
+    FROM telegram_users
+    WHERE user_id = ANY(:user_ids)
+""")
+
+UPSERT_TELEGRAM_USERS = queries.register('upsert_telegram_users', """
+    INSERT INTO telegram_users (user_id, username, first_name, last_name, updated_at)
+    SELECT user_id, username, first_name, last_name, CURRENT_TIMESTAMP
+    FROM unnest(
+        CAST(:user_ids AS BIGINT[]),
+        CAST(:usernames AS TEXT[]),
+        CAST(:first_names AS TEXT[]),
+        CAST(:last_names AS TEXT[])
+    ) AS profile(user_id, username, first_name, last_name)
+    ON CONFLICT (user_id)
+    DO UPDATE SET
+        username = EXCLUDED.username,
+        first_name = EXCLUDED.first_name,
+        last_name = EXCLUDED.last_name,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE (telegram_users.username, telegram_users.first_name, telegram_users.last_name)
+        IS DISTINCT FROM (EXCLUDED.username, EXCLUDED.first_name, EXCLUDED.last_name)
+""")
+
+
+def profile_from_user(user) -> Dict:
+    """Profile dict from a telegram User or Chat"""
+    return {
+        'user_id': user.id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name
+    }
+
+
+def display_username(profile: Optional[Dict]) -> str:
+    if profile is None:
+        return "Unknown"
+    return f"@{profile['username']}" if profile.get('username') else "No username"
+
+
+class UserProfiles:
+    """Local store of Telegram user profiles backed by telegram_users"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._cache = LRUCache(max_size=20000, ttl=3600)
+        self._pending: Dict[int, Dict] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self.api_lookups = 0
+        self.flushed = 0
+
+    def save_many(self, profiles: Iterable[Dict]) -> None:
+        """Upsert profiles in one statement; unchanged rows are left alone"""
+        # Deduplicate: ON CONFLICT cannot touch the same row twice
+        profiles = {profile['user_id']: profile for profile in profiles}
+        if not profiles:
+            return
+        rows = list(profiles.values())
+        with self.engine.begin() as conn:
+            UPSERT_TELEGRAM_USERS.execute(conn, {
+                "user_ids": [row['user_id'] for row in rows],
+                "usernames": [row['username'] for row in rows],
+                "first_names": [row['first_name'] for row in rows],
+                "last_names": [row['last_name'] for row in rows]
+            })
+        for row in rows:
+            self._cache.set(row['user_id'], row)
+
+    def observe(self, user) -> None:
+        """Queue the profile carried by an update for saving if it changed"""
+        if user is None or getattr(user, 'is_bot', False):
+            return
+        profile = profile_from_user(user)
+        if self._cache.get(user.id) == profile:
+            return
+        # Reads see the new profile immediately; the write is batched
+        self._cache.set(user.id, profile)
+        self._pending[user.id] = profile
+        if len(self._pending) >= PROFILE_FLUSH_SIZE:
+            self._schedule_flush(0)
+        else:
+            self._schedule_flush(PROFILE_FLUSH_INTERVAL)
+
+    def _schedule_flush(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        if delay <= 0:
+            # A full batch goes out now; flush() snapshots, so a pending timer is harmless
+            loop.create_task(self.flush())
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_later(delay))
+
+    async def _flush_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write queued profiles in one upsert off the event loop"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            await asyncio.to_thread(self.save_many, batch.values())
+            self.flushed += len(batch)
+        except Exception as e:
+            logging.error(f"Error saving user profiles: {str(e)}", exc_info=True)
+            # Keep newer observations over the failed batch
+            self._pending = {**batch, **self._pending}
+
+    def get(self, user_id: int) -> Optional[Dict]:
+        """Locally known profile for user_id, never calling Telegram"""
+        try:
+            return self.get_many([user_id]).get(user_id)
+        except Exception as e:
+            logging.error(f"Error loading user profile: {str(e)}", exc_info=True)
+            return None
+
+    def get_many(self, user_ids: Iterable[int]) -> Dict[int, Dict]:
+        """Known profiles for user_ids from the cache and telegram_users"""
+        found = {}
+        missing = []
+        for user_id in set(user_ids):
+            profile = self._cache.get(user_id)
+            if profile is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = profile
+
+        if missing:
+            with self.engine.connect() as conn:
+                rows = GET_TELEGRAM_USERS.execute(conn, {"user_ids": missing}).fetchall()
+            for row in rows:
+                profile = dict(row._mapping)
+                self._cache.set(profile['user_id'], profile)
+                found[profile['user_id']] = profile
+        return found
+
+    async def resolve(self, bot, user_ids: Iterable[int]) -> Dict[int, Dict]:
+        """Profiles for user_ids, asking Telegram only for users never seen before"""
+        user_ids = set(user_ids)
+        try:
+            profiles = self.get_many(user_ids)
+        except Exception as e:
+            logging.error(f"Error loading user profiles: {str(e)}", exc_info=True)
+            profiles = {}
+
+        unknown = user_ids - profiles.keys()
+        if not unknown:
+            return profiles
+
+        semaphore = asyncio.Semaphore(RESOLVE_CONCURRENCY)
+
+        async def fetch(user_id: int) -> Optional[Dict]:
+            async with semaphore:
+                for attempt in range(2):
+                    try:
+                        self.api_lookups += 1
+                        return profile_from_user(await bot.get_chat(user_id))
+                    except RetryAfter as e:
+                        if attempt:
+                            break
+                        await asyncio.sleep(retry_after_seconds(e.retry_after))
+                    except Exception as e:
+                        logging.warning(f"Could not resolve user {user_id}: {str(e)}")
+                        break
+                return None
+
+        fetched = [profile for profile in await asyncio.gather(*(fetch(user_id) for user_id in unknown))
+                   if profile is not None]
+        try:
+            self.save_many(fetched)
+        except Exception as e:
+            logging.error(f"Error saving resolved profiles: {str(e)}", exc_info=True)
+        profiles.update((profile['user_id'], profile) for profile in fetched)
+        return profiles
+
+    def stats(self) -> Dict:
+        stats = self._cache.stats()
+        stats.update({
+            'api_lookups': self.api_lookups,
+            'pending': len(self._pending),
+            'flushed': self.flushed
+        })
+        return stats